@@ -28,4 +28,8 @@ class Post(SeoMixin, models.Model):
     class Meta:
         verbose_name = "Artículo"
         verbose_name_plural = "Artículos"
-        ordering = ['-published_at']
\ No newline at end of file
+        ordering = ['-published_at']
+        indexes = [
+            # Orden y keyset del índice del blog (blog/views.py): (-published_at, -id)
+            models.Index(fields=['-published_at', '-id'], name='post_published_idx'),
+        ]
\ No newline at end of file
@@ -1,3 +1,55 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Post
+from .views import PAGE_SIZE, decode_cursor, index_page
+
+
+class BlogIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        posts = [
+            Post(title=f"Artículo {i}", slug=f"articulo-{i}", excerpt="IA en ERP" if i % 3 == 0 else "Otro tema",
+                 content="texto largo", published_at=now - timedelta(hours=i // 2),  # empates de dos en dos
+                 cover_url="https://example.com/c.jpg", read_time=3)
+            for i in range(PAGE_SIZE * 2 + 5)
+        ]
+        posts.append(Post(title="Programado", slug="programado", excerpt="", content="",
+                          published_at=now + timedelta(days=1), cover_url="https://example.com/c.jpg", read_time=1))
+        Post.objects.bulk_create(posts)
+
+    def test_keyset_pages_cover_every_published_post_once(self):
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                page, next_cursor = index_page(cursor=decode_cursor(cursor) if cursor else None)
+            seen += [p.slug for p in page]
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+        expected = list(Post.objects.filter(published_at__lte=timezone.now())
+                        .order_by("-published_at", "-pk").values_list("slug", flat=True))
+        self.assertEqual(seen, expected)
+        self.assertNotIn("programado", seen)
+
+    def test_listing_defers_content(self):
+        page, _ = index_page()
+        self.assertIn("content", page[0].get_deferred_fields())
+
+    def test_search_filters_title_and_excerpt(self):
+        page, _ = index_page(q="erp", page_size=100)
+        self.assertTrue(page)
+        self.assertTrue(all("ERP" in p.excerpt for p in page))
 
-# Create your tests here.
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor("no-es-un-cursor"))
+        response = self.client.get(reverse("blog:blog_index"), {"cursor": "basura"}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["posts"]), PAGE_SIZE)
+        self.assertContains(response, reverse("blog:post", args=["articulo-0"]))
+        self.assertContains(response, "cursor=")
@@ -1,10 +1,75 @@
-from django.shortcuts import render
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-# Create your views here.
+from django.db.models import Q
 from django.shortcuts import render
+from django.utils import timezone
+
+from .models import Post
+
+# Artículos por página del índice (rejilla de 3 columnas)
+PAGE_SIZE = 12
+# Campos de las tarjetas: el `content` (lo que más pesa) nunca se carga en el listado
+CARD_FIELDS = ("title", "slug", "excerpt", "cover_url", "published_at")
+MAX_QUERY_LENGTH = 100
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(post):
+    """Posición de un artículo en el orden del índice: "<published_at en µs>-<id>"."""
+    # Con enteros y no con timestamp(): un float perdería el microsegundo y la igualdad
+    return f"{(post.published_at - EPOCH) // MICROSECOND}-{post.pk}"
+
+
+def decode_cursor(value):
+    """(published_at, id) de un cursor, o None si falta o no es válido (se vuelve a la primera página)."""
+    try:
+        micros, pk = value.rsplit("-", 1)
+        return EPOCH + int(micros) * MICROSECOND, int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def index_page(q="", cursor=None, page_size=PAGE_SIZE):
+    """
+    Una página del índice por keyset (seek): los artículos publicados anteriores al
+    cursor, en orden (-published_at, -id), que es el del índice post_published_idx.
+    Una sola consulta, sin OFFSET ni COUNT: cuesta lo mismo en la página 1 que en la
+    1000, tenga el blog 50 artículos o 100.000.
+
+    Devuelve (artículos, cursor de la siguiente página o None).
+    """
+    now = timezone.now()
+    if cursor is None:
+        posts = Post.objects.filter(published_at__lte=now)
+    else:
+        published_at, pk = cursor
+        # (published_at, id) < cursor, escrito como un solo rango + exclusión. Con el OR
+        # (published_at < X OR (published_at = X AND id < Y)), o con dos cotas (ahora y
+        # el cursor), la BD recorre el índice desde el principio en vez de saltar al cursor
+        posts = Post.objects.filter(published_at__lte=min(published_at, now)).exclude(
+            published_at=published_at, pk__gte=pk)
+    if q:
+        # Solo título y extracto: buscar en `content` obligaría a leer el texto entero
+        posts = posts.filter(Q(title__icontains=q) | Q(excerpt__icontains=q))
+    # Uno más de los que se muestran para saber si hay página siguiente
+    page = list(posts.only(*CARD_FIELDS).order_by("-published_at", "-pk")[:page_size + 1])
+    if len(page) > page_size:
+        page = page[:page_size]
+        return page, encode_cursor(page[-1])
+    return page, None
+
 
 def blog_index_view(request):
-    return render(request, 'blog/index.html')
+    q = request.GET.get("q", "").strip()[:MAX_QUERY_LENGTH]
+    cursor = decode_cursor(request.GET.get("cursor"))
+    posts, next_cursor = index_page(q, cursor)
+    return render(request, 'blog/index.html', {
+        'posts': posts,
+        'q': q,
+        'next_cursor': next_cursor,
+        'is_first_page': cursor is None,
+    })
 
 def post_view(request, slug):
     return render(request, 'blog/post.html', {'slug': slug})
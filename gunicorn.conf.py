@@ -0,0 +1,50 @@
+"""
+Configuración de gunicorn (se carga sola desde el directorio del proyecto).
+
+Precalienta el cliente de Gemini en cada worker para que el primer chat no
+pague la importación del SDK. Se usa `post_worker_init` y no `post_fork`
+porque en `post_fork` el worker todavía no ha cargado Django.
+Se desactiva con GEMINI_WARMUP=False.
+"""
+import os
+
+
+def post_worker_init(worker):
+    if os.getenv("GEMINI_WARMUP", "True") != "True":
+        return
+    from website.views import llm_client
+
+    stats = llm_client.warm_up()
+    if not stats["configured"]:
+        return
+    if stats["loaded"]:
+        worker.log.info(
+            "Gemini precalentado en el worker %s: import %.3fs, init %.3fs",
+            worker.pid, stats["import_seconds"], stats["init_seconds"],
+        )
+    else:
+        worker.log.warning("No se pudo precalentar Gemini en el worker %s: %s", worker.pid, stats["error"])
+
+
+def worker_exit(server, worker):
+    # Vuelca los leads que queden en el buffer antes de que el worker termine
+    from website.leads import lead_buffer
+
+    written = lead_buffer.close()
+    if written:
+        worker.log.info("Worker %s: %s leads guardados al salir", worker.pid, written)
+
+    # Y los eventos de auditoría que sigan en la cola
+    from miweb.security.audit import flush_audit_log
+
+    flush_audit_log()
+
+    # Y los contadores del rate limiter que aún no se han volcado a la cache
+    from miweb.security.rate_limit import rate_limiter
+
+    rate_limiter.flush_stats()
+
+    # Y los aciertos y fallos de la caché de chips
+    from website.views import chip_reply_cache
+
+    chip_reply_cache.flush_stats()
@@ -5,6 +5,24 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Modo ASGI (opcional)
+--------------------
+Con ``gunicorn miweb.wsgi:application`` cada chat ocupa un worker síncrono
+durante toda la llamada a Gemini. Para que esas esperas no bloqueen las
+páginas públicas se puede servir con workers de uvicorn y la vista async
+del chat::
+
+    CHAT_ASYNC=True gunicorn miweb.asgi:application \\
+        -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:$PORT
+
+En el Procfile basta con cambiar la orden de ``gunicorn`` por la anterior.
+WhiteNoise es un middleware síncrono, así que Django sigue usando un hilo
+ligero por petición, pero ya no un worker completo de gunicorn.
+
+Para comparar ambos modos con una latencia del modelo simulada::
+
+    python manage.py bench_chat_concurrency --workers 4 --chats 64 --latency 1.5
 """
 
 import os
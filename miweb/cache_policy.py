@@ -0,0 +1,258 @@
+"""
+Políticas de Cache-Control por ruta, con Vary y surrogate keys para la CDN.
+
+Cada respuesta recibe la política que le toca, por orden de prioridad:
+
+1. la del decorador `@cache_policy("<nombre>")` de la vista,
+2. la de su nombre de URL en CACHE_POLICY_ROUTES ("website:home"),
+3. la del prefijo más largo en CACHE_POLICY_ROUTES ("/api/"),
+4. la de por defecto: "private" para HTML, "never" para el resto (JSON, SSE...).
+
+Si la vista ya puso su propio Cache-Control (p. ej. `never_cache` en el admin)
+se respeta. Por seguridad, una política pública se rebaja a "private" cuando la
+respuesta no es un 200/301/304, pone cookies, varía por Cookie o lleva un nonce
+de CSP por petición: nada de eso puede compartirse en una cache. Los 404 tampoco:
+sin surrogate key no hay forma de purgarlos cuando la página se publica.
+
+Las políticas públicas añaden la cabecera de surrogate keys (Surrogate-Key por
+defecto) con las claves de la política, la de la ruta y las del decorador. Al
+guardar o borrar un modelo de CACHE_PURGE_MODELS se purgan sus claves (tras el
+commit) en los manejadores registrados con `register_purge_handler` y, si está
+configurado, en el webhook CACHE_PURGE_URL de la CDN.
+"""
+import logging
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import requests
+from asgiref.sync import iscoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+NEVER = "never"
+PRIVATE = "private"
+SHAREABLE_STATUS = (200, 301, 304)
+# Respuestas que llevan surrogate keys (un 304 actualiza las cabeceras de la copia guardada)
+KEYED_STATUS = (200, 304)
+
+
+class CachePolicy(NamedTuple):
+    name: str
+    cache_control: str
+    vary: Tuple[str, ...] = ()
+    surrogate_keys: Tuple[str, ...] = ()
+    surrogate_control: Optional[str] = None
+
+    @property
+    def public(self) -> bool:
+        return "public" in self.cache_control
+
+
+class RouteRule(NamedTuple):
+    policy: CachePolicy
+    keys: Tuple[str, ...] = ()
+
+
+def _policy(name: str, options: Dict) -> CachePolicy:
+    return CachePolicy(
+        name=name,
+        cache_control=options["cache_control"],
+        vary=tuple(options.get("vary", ())),
+        surrogate_keys=tuple(options.get("surrogate_keys", ())),
+        surrogate_control=options.get("surrogate_control"),
+    )
+
+
+class CachePolicyRegistry:
+    """Políticas con nombre y reglas por nombre de URL o prefijo, compiladas una vez."""
+
+    def __init__(self, policies: Dict[str, Dict], routes: Dict[str, object]):
+        self.policies = {name: _policy(name, options) for name, options in policies.items()}
+        for required in (NEVER, PRIVATE):
+            if required not in self.policies:
+                raise ValueError(f"Falta la política de cache '{required}'")
+        self.by_name: Dict[str, RouteRule] = {}
+        prefixes = []
+        for route, rule in routes.items():
+            compiled = self.rule(rule)
+            if route.startswith("/"):
+                prefixes.append((route, compiled))
+            else:
+                self.by_name[route] = compiled
+        # Del prefijo más largo al más corto: gana la ruta más específica
+        self.by_prefix: List[Tuple[str, RouteRule]] = sorted(prefixes, key=lambda item: len(item[0]), reverse=True)
+
+    def rule(self, rule) -> RouteRule:
+        """'marketing' o {'policy': 'marketing', 'keys': ['blog', 'blog:{slug}']}."""
+        if isinstance(rule, str):
+            return RouteRule(self.policies[rule])
+        return RouteRule(self.policies[rule["policy"]], tuple(rule.get("keys", ())))
+
+    def resolve(self, request, response) -> Tuple[RouteRule, Optional[str]]:
+        """Regla que aplica a la respuesta y nombre de la ruta (para su surrogate key)."""
+        match = getattr(request, "resolver_match", None)
+        view_name = match.view_name if match else None
+        decorated = getattr(response, "_cache_policy", None)
+        if decorated is not None:
+            return decorated, view_name
+        if view_name in self.by_name:
+            return self.by_name[view_name], view_name
+        for prefix, rule in self.by_prefix:
+            if request.path.startswith(prefix):
+                return rule, view_name
+        is_html = "text/html" in response.get("Content-Type", "")
+        return RouteRule(self.policies[PRIVATE if is_html else NEVER]), view_name
+
+
+def is_shareable(request, response) -> bool:
+    if response.status_code not in SHAREABLE_STATUS or response.cookies:
+        return False
+    if getattr(request, "csp_nonce", None):
+        return False
+    vary = response.get("Vary", "")
+    return "cookie" not in vary.lower() and "*" not in vary
+
+
+def _keys(rule: RouteRule, view_name: Optional[str], kwargs: Dict) -> List[str]:
+    keys = list(rule.policy.surrogate_keys)
+    if view_name:
+        keys.append(view_name)
+    for key in rule.keys:
+        try:
+            keys.append(key.format(**kwargs))
+        except (KeyError, IndexError):
+            logger.warning("Surrogate key %r sin los argumentos de la ruta", key)
+    return list(dict.fromkeys(keys))
+
+
+registry: Optional[CachePolicyRegistry] = None
+
+
+def get_registry() -> CachePolicyRegistry:
+    global registry
+    if registry is None:
+        registry = CachePolicyRegistry(settings.CACHE_POLICIES, getattr(settings, "CACHE_POLICY_ROUTES", {}))
+    return registry
+
+
+class CachePolicyMiddleware(MiddlewareMixin):
+    """Aplica Cache-Control, Vary y surrogate keys según la política de la ruta."""
+
+    def process_response(self, request, response):
+        if response.has_header("Cache-Control"):
+            return response  # la vista ya decidió (never_cache, cache_control...)
+        reg = get_registry()
+        rule, view_name = reg.resolve(request, response)
+        policy = rule.policy
+        if policy.public and not is_shareable(request, response):
+            policy = reg.policies[PRIVATE]
+        response["Cache-Control"] = policy.cache_control
+        # Los 301 públicos se cachean, pero solo las páginas llevan claves para purgarlas
+        if policy.public and response.status_code in KEYED_STATUS:
+            match = getattr(request, "resolver_match", None)
+            keys = _keys(rule, view_name, match.kwargs if match else {})
+            if keys:
+                response[settings.CACHE_SURROGATE_KEY_HEADER] = " ".join(keys)
+            if policy.surrogate_control:
+                response["Surrogate-Control"] = policy.surrogate_control
+        if policy.vary:
+            patch_vary_headers(response, policy.vary)
+        return response
+
+
+def cache_policy(name: str, keys: Iterable[str] = ()):
+    """
+    Decorador de vista: fija la política `name` (de CACHE_POLICIES) y surrogate keys
+    extra, que pueden usar los argumentos de la URL ("blog:{slug}"). Admite vistas
+    síncronas y async, y method_decorator en vistas de clase.
+    """
+    keys = tuple(keys)
+
+    def mark(response):
+        response._cache_policy = get_registry().rule({"policy": name, "keys": keys})
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                return mark(await view(request, *args, **kwargs))
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return mark(view(request, *args, **kwargs))
+        return wrapper
+
+    return decorator
+
+
+# --- Purga ---
+
+_purge_handlers: List[Callable[[List[str]], None]] = []
+
+
+def register_purge_handler(handler: Callable[[List[str]], None]) -> Callable[[List[str]], None]:
+    """Registra una función que recibe las surrogate keys a invalidar (sirve de decorador)."""
+    if handler not in _purge_handlers:
+        _purge_handlers.append(handler)
+    return handler
+
+
+def webhook_purge(keys: List[str]) -> None:
+    """Purga en la CDN vía CACHE_PURGE_URL (POST con {"surrogate_keys": [...]})."""
+    url = getattr(settings, "CACHE_PURGE_URL", "")
+    if not url:
+        return
+    headers = {}
+    token = getattr(settings, "CACHE_PURGE_TOKEN", "")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    response = requests.post(url, json={"surrogate_keys": keys}, headers=headers, timeout=5)
+    response.raise_for_status()
+
+
+register_purge_handler(webhook_purge)
+
+
+def purge(keys: Iterable[str]) -> None:
+    """Invalida `keys` en todas las caches registradas cuando se confirme la transacción."""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return
+
+    def run():
+        for handler in list(_purge_handlers):
+            try:
+                handler(keys)
+            except Exception:
+                logger.exception("Fallo purgando surrogate keys %s", keys)
+
+    transaction.on_commit(run)
+
+
+def _model_receiver(templates: Tuple[str, ...]):
+    def receiver(sender, instance, **kwargs):
+        keys = []
+        for template in templates:
+            try:
+                keys.append(template.format(obj=instance))
+            except (AttributeError, KeyError, IndexError):
+                logger.warning("Surrogate key %r no aplicable a %r", template, instance)
+        purge(keys)
+    return receiver
+
+
+def connect_model_purges() -> None:
+    """Conecta post_save/post_delete de los modelos de CACHE_PURGE_MODELS con `purge`."""
+    for label, templates in getattr(settings, "CACHE_PURGE_MODELS", {}).items():
+        model = apps.get_model(label)
+        receiver = _model_receiver(tuple(templates))
+        for event, signal in (("save", post_save), ("delete", post_delete)):
+            signal.connect(receiver, sender=model, weak=False, dispatch_uid=f"cache_purge:{label}:{event}")
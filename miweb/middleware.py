@@ -1,9 +1,76 @@
 """
 Middleware para proteger el código del sitio web y dificultar la inspección en el navegador.
 """
+from typing import List, Optional
+
+from django.middleware.gzip import GZipMiddleware
 from django.utils.deprecation import MiddlewareMixin
 from django.conf import settings
 
+from miweb.security.headers import RouteHeaderTable, new_nonce, routes_from_settings
+
+BODY_CLOSE = b"</body>"
+# Lo que se retiene de una respuesta en streaming a la espera de un </body> posterior
+MAX_STREAM_HOLD = 64 * 1024
+
+
+def insert_before_last(content: bytes, marker: bytes, snippet: bytes) -> Optional[bytes]:
+    """Inserta `snippet` antes de la última aparición de `marker` (None si no aparece)."""
+    index = content.rfind(marker)
+    if index == -1:
+        return None
+    view = memoryview(content)
+    return b"".join((view[:index], snippet, view[index:]))
+
+
+class StreamInjector:
+    """
+    Inserta `snippet` antes del último `marker` de un cuerpo que llega por trozos.
+
+    Se emite todo salvo lo que va desde el último `marker` visto (o los últimos
+    bytes, por si el marcador viene partido entre dos trozos); al terminar se
+    inserta el snippet en lo retenido.
+    """
+
+    def __init__(self, marker: bytes, snippet: bytes, max_hold: int = MAX_STREAM_HOLD):
+        self.marker = marker
+        self.snippet = snippet
+        self.max_hold = max_hold
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        pending = self._pending + chunk if self._pending else bytes(chunk)
+        index = pending.rfind(self.marker)
+        if index == -1:
+            # Sin marcador: solo se retiene lo justo para detectarlo si llega partido
+            index = max(0, len(pending) - len(self.marker) + 1)
+        elif len(pending) - index > self.max_hold:
+            # Demasiado contenido tras el </body>: se renuncia a este y se sigue buscando
+            index = len(pending) - len(self.marker) + 1
+        self._pending = pending[index:]
+        return [pending[:index]] if index else []
+
+    def finish(self) -> bytes:
+        pending, self._pending = self._pending, b""
+        if pending.startswith(self.marker):
+            return self.snippet + pending
+        return pending
+
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware que no toca los server-sent events.
+
+    El compresor acumula los trozos hasta tener un bloque que merezca la pena, así
+    que un `text/event-stream` comprimido llega al navegador entero al final en
+    vez de evento a evento.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        return super().process_response(request, response)
+
+
 class SecurityProtectionMiddleware(MiddlewareMixin):
     """
     Middleware que añade cabeceras de seguridad y protecciones adicionales
@@ -46,60 +113,85 @@ class SecurityProtectionMiddleware(MiddlewareMixin):
 </script>
 """
     
+    PROTECTION_JS_BYTES = PROTECTION_JS.encode('utf-8')
+    SCRIPT_OPEN = b'<script type="text/javascript">'
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        # Cabeceras compiladas una sola vez por prefijo de ruta (ver miweb/security/headers.py)
+        self.nonces = getattr(settings, 'CSP_NONCES', False)
+        self.header_table = RouteHeaderTable(routes_from_settings(), nonces=self.nonces)
+
+    def process_request(self, request):
+        if self.nonces:
+            request.csp_nonce = new_nonce()
+
+    def _protection_snippet(self, nonce: Optional[str]) -> bytes:
+        if not nonce:
+            return self.PROTECTION_JS_BYTES
+        return self.PROTECTION_JS_BYTES.replace(
+            self.SCRIPT_OPEN, b'<script nonce="' + nonce.encode('ascii') + b'" type="text/javascript">', 1)
+
+    def _inject_protection(self, response, nonce: Optional[str] = None):
+        """Inserta el script antes del último </body> trabajando sobre bytes (sin decodificar)."""
+        snippet = self._protection_snippet(nonce)
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._inject_async(response.streaming_content, snippet)
+            else:
+                response.streaming_content = self._inject_sync(response.streaming_content, snippet)
+            # La longitud cambia y no se conoce hasta el final
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+            return
+        content = response.content
+        if not content:
+            return
+        injected = insert_before_last(content, BODY_CLOSE, snippet)
+        if injected is not None:
+            response.content = injected
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = str(len(injected))
+
+    def _inject_sync(self, chunks, snippet: bytes):
+        injector = StreamInjector(BODY_CLOSE, snippet)
+        for chunk in chunks:
+            yield from injector.feed(chunk)
+        tail = injector.finish()
+        if tail:
+            yield tail
+
+    async def _inject_async(self, chunks, snippet: bytes):
+        injector = StreamInjector(BODY_CLOSE, snippet)
+        async for chunk in chunks:
+            for part in injector.feed(chunk):
+                yield part
+        tail = injector.finish()
+        if tail:
+            yield tail
+
     def process_response(self, request, response):
         """
         Procesa la respuesta HTTP para añadir cabeceras de seguridad.
         """
-        # Permitir cacheo estático para mejorar rendimiento
-        # Las páginas dinámicas tendrán su propio control de cache
-        if 'text/html' in response.get('Content-Type', ''):
-            response['Cache-Control'] = 'private, max-age=300'  # 5 minutos para HTML
-        else:
-            # Para recursos estáticos, permitir cacheo más largo
-            response['Cache-Control'] = 'public, max-age=86400'  # 1 día
-        
-        # Prevenir que el sitio sea mostrado en frames (clickjacking protection)
-        response['X-Frame-Options'] = 'DENY'
-        
-        # Habilitar protección XSS en navegadores modernos
-        response['X-XSS-Protection'] = '1; mode=block'
-        
-        # Prevenir MIME sniffing
-        response['X-Content-Type-Options'] = 'nosniff'
-        
-        # Referrer Policy (controla la información enviada en el header Referer)
-        response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-        
-        # Protección básica de Content Security Policy
-        # Personalízalo según las necesidades específicas de tu sitio
-        if not hasattr(settings, 'CSP_EXEMPT_URLS') or request.path not in settings.CSP_EXEMPT_URLS:
-            response['Content-Security-Policy'] = (
-                "default-src 'self'; "
-                "script-src 'self' https://unpkg.com https://fonts.googleapis.com 'unsafe-inline'; "
-                "style-src 'self' https://fonts.googleapis.com 'unsafe-inline'; "
-                "img-src 'self' data:; "
-                "font-src 'self' https://fonts.gstatic.com; "
-                "connect-src 'self'; "
-                "frame-src 'none'; "
-                "object-src 'none'"
-            )
-        
-        # Solo añadir protección JS en páginas HTML y en producción
-        # La protección JS simplificada para mejorar rendimiento
         content_type = response.get('Content-Type', '')
         is_html = 'text/html' in content_type
+        nonce = getattr(request, 'csp_nonce', None)
+
+        # X-Frame-Options, X-XSS-Protection, nosniff, Referrer-Policy y CSP de la ruta
+        # (el prefijo más largo que coincide), en un solo paso. Cache-Control lo pone
+        # CachePolicyMiddleware
+        self.header_table.for_path(request.path).apply(response, nonce)
+
+        # Solo añadir protección JS en páginas HTML y en producción
+        # La protección JS simplificada para mejorar rendimiento
         is_production = not settings.DEBUG
         
-        # Verificar si debemos añadir la protección
-        if is_html and is_production and hasattr(response, 'content') and response.content:
-            try:
-                content = response.content.decode('utf-8')
-                # Insertar antes del cierre del body
-                if '</body>' in content:
-                    content = content.replace('</body>', self.PROTECTION_JS + '</body>')
-                    response.content = content.encode('utf-8')
-            except (UnicodeDecodeError, AttributeError):
-                # No modificar si no es contenido de texto
-                pass
+        # Verificar si debemos añadir la protección: el script va en UTF-8 y un
+        # cuerpo ya comprimido (gzip/br precalculado) no se puede tocar
+        if (is_html and is_production
+                and (response.charset or '').lower().replace('_', '-') in ('utf-8', 'utf8')
+                and not response.has_header('Content-Encoding')):
+            self._inject_protection(response, nonce)
         
         return response
@@ -0,0 +1,246 @@
+"""
+Cache de página completa para las páginas de marketing (HTML fijo, sin datos del usuario).
+
+La primera petición a una vista de PAGE_CACHE_VIEWS se sirve como siempre
+(vista, inyección del script, cabeceras de seguridad, Cache-Control...) y la
+respuesta final se guarda en la cache 'shared', común a todos los workers, en
+tres variantes: sin comprimir, gzip y brotli (si está instalado), cada una con
+su Content-Length y su ETag ya calculados. Las siguientes peticiones se sirven
+desde ahí sin pasar por la vista ni por el resto de middlewares: la variante ya
+lleva Content-Encoding, así que GZipMiddleware no la vuelve a comprimir, y un
+If-None-Match que coincide se responde con un 304.
+
+Solo se guarda lo que se puede compartir: GET sin query string, 200, con política
+pública y sin cookies ni Vary: Cookie (ver miweb/cache_policy.py). Con
+CSP_NONCES cada página lleva un nonce distinto y la cache se desactiva.
+
+La clave incluye DEPLOY_ID y un hash del contenido de las plantillas, así que
+un despliegue o un cambio de plantilla empieza con la cache vacía. Cualquier
+purga de surrogate keys (guardar un Post, un Service...) invalida todas las
+páginas subiendo una generación común, que se lee junto a la página en la
+misma consulta.
+"""
+import hashlib
+import logging
+import re
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.template.utils import get_app_template_dirs
+from django.urls import NoReverseMatch, reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers, set_response_etag
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from miweb.cache_policy import is_shareable, register_purge_handler
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IDENTITY = "identity"
+GZIP = "gzip"
+BROTLI = "br"
+GENERATION_KEY = "page:generation"
+# Se sube si cambia la forma de CachedPage: las páginas guardadas con la anterior no se leen
+PAGE_FORMAT = 2
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+ACCEPTS_BROTLI = re.compile(r"\bbr\b")
+
+
+class CachedPage(NamedTuple):
+    generation: int
+    headers: Tuple[Tuple[str, str], ...]  # (nombre, valor), como response.headers.items()
+    etag: str
+    body: bytes
+
+
+@lru_cache(maxsize=None)
+def template_version() -> str:
+    """Hash del contenido de las plantillas (carpetas de TEMPLATES y de las apps), una vez por proceso."""
+    digest = hashlib.blake2b(digest_size=8)
+    roots = [Path(d) for engine in settings.TEMPLATES for d in engine.get("DIRS", [])]
+    roots += [Path(d) for d in get_app_template_dirs("templates")]
+    for root in roots:
+        if not root.is_dir():
+            continue
+        for path in sorted(p for p in root.rglob("*") if p.is_file()):
+            digest.update(path.relative_to(root).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def deploy_prefix() -> str:
+    return f"page:v{PAGE_FORMAT}:{getattr(settings, 'DEPLOY_ID', '') or '-'}:{template_version()}"
+
+
+def _cache():
+    return caches[getattr(settings, "PAGE_CACHE_ALIAS", "shared")]
+
+
+def _new_generation(cache) -> int:
+    # Valor nuevo (y no 0) por si la clave se pierde: las páginas anteriores no reviven
+    cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+    return cache.get(GENERATION_KEY)
+
+
+@register_purge_handler
+def purge_pages(keys: List[str]) -> None:
+    """Invalida todas las páginas guardadas (las purgas son raras y las páginas pocas)."""
+    cache = _cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:  # la generación no existe (o caducó): se crea otra
+        _new_generation(cache)
+
+
+def accepted_encoding(request) -> str:
+    accept = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    if brotli is not None and ACCEPTS_BROTLI.search(accept):
+        return BROTLI
+    if ACCEPTS_GZIP.search(accept):
+        return GZIP
+    return IDENTITY
+
+
+def compress(body: bytes, encoding: str, brotli_quality: int = 11) -> Optional[bytes]:
+    """Cuerpo comprimido, o None si no sale más corto (como GZipMiddleware)."""
+    if encoding == GZIP:
+        compressed = compress_string(body)
+    else:
+        compressed = brotli.compress(body, mode=brotli.MODE_TEXT, quality=brotli_quality)
+    return compressed if len(compressed) < len(body) else None
+
+
+def with_headers(headers: Tuple[Tuple[str, str], ...], overrides: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    """`headers` con las cabeceras de `overrides` sustituidas (sin distinguir mayúsculas)."""
+    replaced = {name.lower() for name in overrides}
+    return tuple((n, v) for n, v in headers if n.lower() not in replaced) + tuple(overrides.items())
+
+
+def build_variants(response, generation: int, brotli_quality: int = 11) -> Dict[str, CachedPage]:
+    """Variantes por codificación de una respuesta ya procesada (con ETag débil si va comprimida)."""
+    body = response.content
+    if not response.has_header("ETag"):
+        set_response_etag(response)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    headers = tuple(response.headers.items())
+    etag = response["ETag"]
+    weak_etag = etag if etag.startswith("W/") else f"W/{etag}"
+
+    variants = {IDENTITY: CachedPage(
+        generation, with_headers(headers, {"Content-Length": str(len(body))}), etag, body)}
+    encodings = [GZIP] + ([BROTLI] if brotli is not None else [])
+    for encoding in encodings:
+        compressed = compress(body, encoding, brotli_quality)
+        if compressed is None:
+            variants[encoding] = variants[IDENTITY]
+            continue
+        variants[encoding] = CachedPage(generation, with_headers(headers, {
+            "Content-Length": str(len(compressed)),
+            "Content-Encoding": encoding,
+            "ETag": weak_etag,
+        }), weak_etag, compressed)
+    return variants
+
+
+def page_response(request, page: CachedPage):
+    response = HttpResponse(page.body)
+    for name, value in page.headers:
+        response.headers[name] = value
+    # 304 si el navegador ya tiene esta versión
+    return get_conditional_response(request, etag=page.etag, response=response)
+
+
+class PageCacheMiddleware(MiddlewareMixin):
+    """
+    Sirve desde la cache 'shared' las páginas de PAGE_CACHE_VIEWS (vistas sin
+    argumentos). Va justo después de WhiteNoise: un acierto se salta todo lo demás.
+    """
+
+    def __init__(self, get_response=None):
+        if not getattr(settings, "PAGE_CACHE_ENABLED", False) or getattr(settings, "CSP_NONCES", False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.timeout = settings.PAGE_CACHE_TIMEOUT
+        self.max_size = settings.PAGE_CACHE_MAX_SIZE
+        self.brotli_quality = getattr(settings, "PAGE_CACHE_BROTLI_QUALITY", 11)
+        self.prefix = deploy_prefix()
+        self._paths: Optional[frozenset] = None
+
+    @property
+    def paths(self) -> frozenset:
+        # Rutas de las vistas cacheables, calculadas una vez (resolve() por petición cuesta más)
+        if self._paths is None:
+            paths = set()
+            for name in settings.PAGE_CACHE_VIEWS:
+                try:
+                    paths.add(reverse(name))
+                except NoReverseMatch:
+                    logger.warning("PAGE_CACHE_VIEWS: la vista %r no existe o necesita argumentos", name)
+            self._paths = frozenset(paths)
+        return self._paths
+
+    def _key(self, request) -> Optional[str]:
+        if request.method != "GET" or request.META.get("QUERY_STRING") or request.path not in self.paths:
+            return None
+        # Las plantillas usan request.scheme y get_host() (canonical, og:url...)
+        url = f"{request.scheme}://{request.get_host()}{request.path}"
+        return f"{self.prefix}:{hashlib.blake2b(url.encode(), digest_size=16).hexdigest()}"
+
+    def process_request(self, request):
+        key = self._key(request)
+        if key is None:
+            return None
+        cache = _cache()
+        encoding = accepted_encoding(request)
+        try:
+            found = cache.get_many([f"{key}:{encoding}", GENERATION_KEY])
+            generation = found.get(GENERATION_KEY)
+            if generation is None:
+                generation = _new_generation(cache)
+        except Exception:
+            logger.exception("Error leyendo la cache de páginas")
+            return None
+        page = found.get(f"{key}:{encoding}")
+        if page is not None and page.generation == generation:
+            request._page_cache_hit = True
+            return page_response(request, page)
+        # Fallo: se renderiza y se guarda con la generación leída ahora (si hay una
+        # purga mientras tanto, lo guardado ya nace invalidado)
+        request._page_cache = (key, encoding, generation)
+        return None
+
+    def _storable(self, request, response) -> bool:
+        return (response.status_code == 200
+                and not response.streaming
+                and not response.has_header("Content-Encoding")
+                and "text/html" in response.get("Content-Type", "")
+                and "public" in response.get("Cache-Control", "")
+                and is_shareable(request, response)
+                and len(response.content) <= self.max_size)
+
+    def process_response(self, request, response):
+        pending = getattr(request, "_page_cache", None)
+        if pending is None or getattr(request, "_page_cache_hit", False):
+            return response
+        if not self._storable(request, response):
+            return response
+        key, encoding, generation = pending
+        variants = build_variants(response, generation, self.brotli_quality)
+        try:
+            cache_keys = {f"{key}:{name}": page for name, page in variants.items()}
+            _cache().set_many(cache_keys, self.timeout)
+        except Exception:
+            logger.exception("Error guardando en la cache de páginas")
+        # Se responde ya con la variante comprimida (GZipMiddleware no la repite)
+        return page_response(request, variants[encoding])
@@ -0,0 +1,162 @@
+"""
+Páginas pre-renderizadas en el despliegue y servidas como estáticos.
+
+`python manage.py prerender_pages` pide cada vista de PRERENDER_VIEWS con la
+pila de middlewares completa (inyección del script, cabeceras de seguridad,
+Cache-Control...) y guarda en PRERENDER_ROOT:
+
+- html/<ruta>/index.html: el HTML minificado, con sus variantes .gz y .br,
+- manifest.json: ruta -> fichero y las cabeceras de la respuesta original.
+
+`PrerenderedPagesMiddleware` sustituye a WhiteNoiseMiddleware: sirve los
+estáticos como siempre y, antes, las páginas del manifiesto con las cabeceras
+guardadas (WhiteNoise elige gzip/brotli y responde a If-None-Match). Si falta
+el fichero de una página, o las plantillas han cambiado desde el pre-render, esa
+ruta se renderiza en vivo como siempre.
+"""
+import gzip
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from wsgiref.headers import Headers
+
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.responders import StaticFile
+
+from miweb.page_cache import template_version
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+HTML_DIR = "html"
+MANIFEST_NAME = "manifest.json"
+# Cabeceras de la respuesta renderizada que no se guardan: las calcula WhiteNoise
+# al servir el fichero (tipo, tamaño, ETag, codificación) o no deben compartirse
+SKIPPED_HEADERS = {
+    "content-type", "content-length", "content-encoding", "etag", "last-modified",
+    "vary", "set-cookie", "date",
+}
+
+# Bloques cuyo contenido no se toca al minificar
+PRESERVED_RX = re.compile(r"<(pre|textarea|script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+# Comentarios HTML, salvo los condicionales de IE
+COMMENT_RX = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+SPACE_RX = re.compile(r"\s+")
+
+
+def _collapse(text: str) -> str:
+    return SPACE_RX.sub(" ", COMMENT_RX.sub("", text))
+
+
+def minify_html(html: str) -> str:
+    """
+    Quita comentarios y colapsa cada tramo de espacios en uno (lo mismo que hace el
+    navegador al mostrarlo), sin tocar <pre>, <textarea>, <script> ni <style>.
+    """
+    parts = []
+    cursor = 0
+    for m in PRESERVED_RX.finditer(html):
+        parts.append(_collapse(html[cursor:m.start()]))
+        parts.append(m.group())
+        cursor = m.end()
+    parts.append(_collapse(html[cursor:]))
+    return "".join(parts).strip()
+
+
+def page_file(path: str) -> str:
+    """Fichero de una ruta dentro de html/: "/" -> index.html, "/vinaros/" -> vinaros/index.html."""
+    stripped = path.strip("/")
+    return f"{stripped}/index.html" if stripped else "index.html"
+
+
+def saved_headers(response) -> List[Tuple[str, str]]:
+    return [(name, value) for name, value in response.headers.items() if name.lower() not in SKIPPED_HEADERS]
+
+
+def write_page(directory: Path, path: str, body: bytes) -> Dict[str, int]:
+    """Escribe el HTML de `path` y sus variantes comprimidas (solo si salen más cortas). Devuelve los tamaños."""
+    target = directory / page_file(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(body)
+    sizes = {"html": len(body)}
+    variants = {"gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=11)
+    for suffix, compressed in variants.items():
+        variant = target.with_name(f"{target.name}.{suffix}")
+        if len(compressed) < len(body):
+            variant.write_bytes(compressed)
+            sizes[suffix] = len(compressed)
+        elif variant.exists():
+            variant.unlink()
+    return sizes
+
+
+def read_manifest(root: Path) -> Optional[Dict]:
+    try:
+        return json.loads((root / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.exception("Manifiesto de páginas pre-renderizadas ilegible en %s", root)
+        return None
+
+
+def write_manifest(root: Path, pages: Dict[str, Dict], base_url: str) -> None:
+    manifest = {
+        "template_version": template_version(),
+        "deploy_id": getattr(settings, "DEPLOY_ID", ""),
+        "base_url": base_url,
+        "pages": pages,
+    }
+    tmp = root / f"{MANIFEST_NAME}.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(root / MANIFEST_NAME)
+
+
+class PrerenderedPagesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise + las páginas de PRERENDER_ROOT (GET/HEAD; el resto va a la vista)."""
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        self.pages: Dict[str, StaticFile] = {}
+        if getattr(settings, "PRERENDER_ENABLED", False) and not getattr(settings, "CSP_NONCES", False):
+            self.pages = self.load_pages(Path(settings.PRERENDER_ROOT))
+
+    def load_pages(self, root: Path) -> Dict[str, StaticFile]:
+        manifest = read_manifest(root)
+        if manifest is None:
+            return {}
+        if manifest.get("template_version") != template_version():
+            logger.warning("Las plantillas han cambiado desde el pre-render: las páginas se sirven en vivo")
+            return {}
+        pages = {}
+        for url, entry in manifest.get("pages", {}).items():
+            path = root / HTML_DIR / entry["file"]
+            if not path.is_file():
+                logger.warning("Falta %s: %s se servirá en vivo", path, url)
+                continue
+            pages[url] = StaticFile(str(path), self.page_headers(str(path), url, entry["headers"]),
+                                    encodings={"gzip": f"{path}.gz", "br": f"{path}.br"})
+        return pages
+
+    def page_headers(self, path: str, url: str, saved: Iterable) -> List[Tuple[str, str]]:
+        headers = Headers([])
+        self.add_mime_headers(headers, path, url)
+        for name, value in saved:
+            headers[name] = value
+        return headers.items()
+
+    def __call__(self, request):
+        if request.method in ("GET", "HEAD"):
+            page = self.pages.get(request.path_info)
+            if page is not None:
+                return self.serve(page, request)
+        return super().__call__(request)
@@ -1,125 +1,204 @@
 """
 Middleware de proxy para APIs que oculta los endpoints reales.
+
+Las rutas /api/v1/<hash>/<acción>/ se despachan a la vista registrada para ese
+hash en la tabla `APIEndpoint` (se gestiona desde el admin). La tabla se carga
+una vez, con las vistas ya importadas y convertidas en callables (`as_view()`
+para las de clase), y se recarga en caliente cuando cambia: al guardar o borrar
+un endpoint se sube una versión en la cache 'shared' que cada worker consulta
+como mucho cada API_PROXY_CHECK_INTERVAL segundos.
 """
-import re
-import logging
 import hashlib
-import importlib
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
 from django.conf import settings
-from django.http import HttpResponse, JsonResponse
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
 
 logger = logging.getLogger(__name__)
 
+# URLs que serán procesadas por este middleware: prefijo fijo + /<hash>/<acción>/
+API_PREFIX = "/api/v1/"
+API_PATH_RX = re.compile(r"(?P<hash_id>[a-f0-9]{32})/(?P<action>[a-zA-Z0-9_]+)/?")
+VERSION_KEY = "api_proxy:version"
+# Versión de una tabla que no se pudo cargar: no coincide con ninguna publicada
+RETRY = object()
+
+
+def generate_endpoint_hash(endpoint_path):
+    """Genera un hash para un endpoint específico."""
+    # Usar una sal secreta para hacer más difícil el reverse engineering
+    salt = getattr(settings, 'API_HASH_SALT', settings.SECRET_KEY)
+    hash_input = f"{endpoint_path}:{salt}"
+    return hashlib.md5(hash_input.encode()).hexdigest()
+
+
+class Endpoint(NamedTuple):
+    name: str                    # ruta Python de la vista
+    view: Callable
+    methods: FrozenSet[str]
+
+
+def resolve_view(dotted_path: str) -> Callable:
+    """Callable listo para llamar: `as_view()` para vistas de clase, la función si no."""
+    target = import_string(dotted_path)
+    return target.as_view() if hasattr(target, "as_view") else target
+
+
+def build_table(rows: Iterable[Tuple[str, str, str]]) -> Dict[str, Endpoint]:
+    """
+    {hash: Endpoint} a partir de filas (hash, vista, "GET,POST"). Una fila cuya
+    vista no se puede importar se registra en el log y se omite (ese hash da 404).
+    """
+    table = {}
+    for hash_id, dotted_path, methods in rows:
+        try:
+            view = resolve_view(dotted_path)
+        except Exception:
+            logger.exception(f"Error al importar la vista {dotted_path}")
+            continue
+        allowed = frozenset(m.strip().upper() for m in methods.split(",") if m.strip())
+        table[hash_id] = Endpoint(dotted_path, view, allowed)
+    return table
+
+
+class EndpointRegistry:
+    """
+    Tabla de endpoints en memoria del proceso. Se relee de la BD solo cuando cambia
+    la versión publicada en la cache compartida (comprobada como mucho cada
+    `check_interval` segundos).
+    """
+
+    def __init__(self, check_interval: float = 5.0, cache_alias: str = "shared"):
+        self.check_interval = check_interval
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        self._table: Optional[Dict[str, Endpoint]] = None
+        self._version = None
+        self._next_check = 0.0
+
+    @staticmethod
+    def load() -> Dict[str, Endpoint]:
+        from website.models import APIEndpoint
+        rows = APIEndpoint.objects.filter(enabled=True).values_list("hash_id", "view", "methods")
+        return build_table(rows)
+
+    def _current_version(self):
+        try:
+            return caches[self.cache_alias].get(VERSION_KEY)
+        except Exception:
+            logger.exception("No se pudo leer la versión de los endpoints de API")
+            return self._version
+
+    def table(self) -> Dict[str, Endpoint]:
+        now = time.monotonic()
+        if self._table is not None and now < self._next_check:
+            return self._table
+        with self._lock:
+            if self._table is not None and now < self._next_check:
+                return self._table
+            self._next_check = now + self.check_interval
+            version = self._current_version()
+            if self._table is None or self._version is RETRY or version != self._version:
+                try:
+                    self._table = self.load()
+                    self._version = version
+                except DatabaseError:
+                    logger.exception("No se pudieron cargar los endpoints de API")
+                    # Se sirve la tabla anterior (o ninguna) y se reintenta en la próxima comprobación
+                    self._version = RETRY
+                    if self._table is None:
+                        self._table = {}
+        return self._table
+
+    def invalidate(self) -> None:
+        """Publica una versión nueva: todos los workers recargan en su próxima comprobación."""
+        caches[self.cache_alias].set(VERSION_KEY, time.time_ns(), timeout=None)
+        self._next_check = 0.0
+
+
+registry = EndpointRegistry(
+    check_interval=getattr(settings, "API_PROXY_CHECK_INTERVAL", 5.0),
+)
+
+
+def _endpoints_changed(sender, **kwargs):
+    # Tras el commit: otro worker que recargue antes vería los datos anteriores
+    transaction.on_commit(registry.invalidate)
+
+
+def connect_endpoint_signals() -> None:
+    from website.models import APIEndpoint
+    for event, signal in (("save", post_save), ("delete", post_delete)):
+        signal.connect(_endpoints_changed, sender=APIEndpoint, dispatch_uid=f"api_proxy:{event}")
+
+
 class APIProxyMiddleware(MiddlewareMixin):
     """
     Middleware que actúa como un proxy interno para las API,
     ocultando los endpoints reales y proporcionando una capa
     adicional de seguridad.
-    
+
     NOTA: Este middleware es OPCIONAL y está desactivado por defecto.
     Para activarlo, añade 'ENABLE_API_PROXY = True' en tu settings.py
     """
-    
-    # URLs que serán procesadas por este middleware
-    API_URL_PATTERN = r'^/api/v1/(?P<hash_id>[a-f0-9]{32})/(?P<action>[a-zA-Z0-9_]+)/?$'
-    
-    # Mapeo de hash a endpoints reales (en producción se almacenaría en la base de datos)
-    # En este ejemplo simplificado, lo definimos como una constante
-    API_ENDPOINTS = {
-        # El hash se genera a partir del endpoint real
-        'ea8e8d1aea74c3d4a47e16449bd8c221': {
-            'module': 'website.api.views',
-            'class': 'ContactAPIView',
-            'methods': ['POST'],
-        },
-        '7b23e49f8e3fabc5697fecb0b8e8e8e7': {
-            'module': 'services.api.views',
-            'class': 'ServiceListAPIView',
-            'methods': ['GET'],
-        },
-        # Añadir más endpoints según sea necesario
-    }
-    
-    @staticmethod
-    def generate_endpoint_hash(endpoint_path):
-        """Genera un hash para un endpoint específico."""
-        # Usar una sal secreta para hacer más difícil el reverse engineering
-        salt = getattr(settings, 'API_HASH_SALT', settings.SECRET_KEY)
-        hash_input = f"{endpoint_path}:{salt}"
-        return hashlib.md5(hash_input.encode()).hexdigest()
-    
+
+    generate_endpoint_hash = staticmethod(generate_endpoint_hash)
+
+    def __init__(self, get_response=None, endpoints: Optional[EndpointRegistry] = None):
+        if not getattr(settings, 'ENABLE_API_PROXY', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.registry = endpoints or registry
+        # Las vistas se importan y resuelven al arrancar, no en cada petición
+        self.registry.table()
+
     def process_request(self, request):
         """
         Procesa la solicitud entrante, verificando si es una llamada a la API
         y redireccionándola al endpoint real si corresponde.
         """
-        # Verificar si el proxy está habilitado en la configuración
-        if not getattr(settings, 'ENABLE_API_PROXY', False):
-            # El proxy está desactivado, no procesar la solicitud
-            return None
-            
-        # Solo procesar solicitudes que coincidan con el patrón de URL de la API
         path = request.path_info
-        match = re.match(self.API_URL_PATTERN, path)
-        
-        if not match:
-            # No es una solicitud de API, continuar con el procesamiento normal
+        # Comprobación barata antes de la regex: casi ninguna petición es del proxy
+        if not path.startswith(API_PREFIX):
+            return None
+        match = API_PATH_RX.fullmatch(path, len(API_PREFIX))
+        if match is None:
             return None
-        
-        hash_id = match.group('hash_id')
-        action = match.group('action')
-        
-        # Verificar si el hash existe en nuestro mapeo
-        if hash_id not in self.API_ENDPOINTS:
+        hash_id, action = match.group('hash_id', 'action')
+
+        endpoint = self.registry.table().get(hash_id)
+        if endpoint is None:
             logger.warning(f"Intento de acceso a endpoint de API desconocido: {hash_id}")
             return JsonResponse({'error': 'Endpoint no encontrado'}, status=404)
-        
-        endpoint_info = self.API_ENDPOINTS[hash_id]
-        
+
         # Verificar si el método HTTP está permitido
-        if request.method not in endpoint_info['methods']:
+        if request.method not in endpoint.methods:
             logger.warning(f"Método no permitido {request.method} para endpoint {hash_id}")
             return JsonResponse(
                 {'error': f"Método {request.method} no permitido"},
                 status=405
             )
-        
+
         try:
-            # Importar dinámicamente la vista
-            module = importlib.import_module(endpoint_info['module'])
-            view_class = getattr(module, endpoint_info['class'])
-            
-            # Crear una instancia de la vista
-            view_instance = view_class()
-            
-            # Llamar al método correspondiente (dispatch para vistas basadas en clase)
-            # o directamente al método si es una función
-            if hasattr(view_instance, 'dispatch'):
-                view_instance.request = request
-                view_instance.args = []
-                view_instance.kwargs = {'action': action}
-                response = view_instance.dispatch(request, action=action)
-            else:
-                response = view_instance(request, action=action)
-            
+            response = endpoint.view(request, action=action)
+            # Como hace el handler de Django con las vistas: las respuestas de DRF y las
+            # TemplateResponse se renderizan antes de pasar por el resto de middlewares
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
             return response
-        
-        except ImportError:
-            logger.exception(f"Error al importar el módulo {endpoint_info['module']}")
-            return JsonResponse(
-                {'error': 'Error interno del servidor'},
-                status=500
-            )
-        except AttributeError:
-            logger.exception(f"Clase o método no encontrado: {endpoint_info['class']}")
-            return JsonResponse(
-                {'error': 'Error interno del servidor'},
-                status=500
-            )
         except Exception as e:
             logger.exception(f"Error al procesar la solicitud: {str(e)}")
             return JsonResponse(
                 {'error': 'Error interno del servidor'},
                 status=500
-            )
\ No newline at end of file
+            )
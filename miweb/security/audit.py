@@ -0,0 +1,331 @@
+"""
+Registro de auditoría de la API sin bloquear la petición.
+
+`APISecurityHelper.log_api_access` crea un `AuditEvent` (tupla compacta) y nada
+más: no formatea ni serializa. El handler `AuditQueueHandler` del logger
+`miweb.audit` lo deja tal cual en una cola acotada (AUDIT_QUEUE_SIZE), sin pasar
+por Logger.info ni crear un LogRecord, y un hilo en segundo plano
+(`BatchingQueueListener`) los saca en lotes de hasta AUDIT_BATCH_SIZE, o los que
+haya tras AUDIT_FLUSH_INTERVAL segundos, y los escribe de una vez en el destino
+de AUDIT_LOG_SINK:
+
+- "file": JSON por línea en AUDIT_LOG_PATH, rotando a AUDIT_LOG_MAX_BYTES,
+- "sqlite": tabla `api_audit` en AUDIT_LOG_PATH (un INSERT por lote),
+- "console": el StreamHandler de siempre (desarrollo).
+
+Si la cola está llena el evento se descarta y se cuenta (`dropped`); el hilo
+avisa en el log, como mucho una vez por minuto, cuando el contador sube. Al
+salir (logging.shutdown, y el hook `worker_exit` de gunicorn) se vacía la cola.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+audit_logger = logging.getLogger("miweb.audit")
+
+DROP_WARNING_INTERVAL = 60.0  # segundos entre avisos de eventos descartados
+
+
+class AuditEvent(NamedTuple):
+    ts: float
+    user_id: Optional[int]
+    endpoint: str
+    method: str
+    success: bool
+    ip: str
+
+
+def record_event(record) -> AuditEvent:
+    """El evento de un elemento de la cola (un AuditEvent o un LogRecord)."""
+    if isinstance(record, AuditEvent):
+        return record
+    event = getattr(record, "audit", None)
+    if event is None:  # algo registrado en miweb.audit sin evento: se guarda el mensaje
+        event = AuditEvent(record.created, None, record.getMessage(), "", True, "")
+    return event
+
+
+def event_json(event: AuditEvent) -> str:
+    return json.dumps({
+        "ts": datetime.fromtimestamp(event.ts, timezone.utc).isoformat(timespec="milliseconds"),
+        "user": event.user_id,
+        "endpoint": event.endpoint,
+        "method": event.method,
+        "ok": event.success,
+        "ip": event.ip,
+    }, separators=(",", ":"))
+
+
+class AuditFormatter(logging.Formatter):
+    def format(self, record):
+        return event_json(record_event(record))
+
+
+def as_log_record(item) -> logging.LogRecord:
+    """LogRecord para los handlers que no son de auditoría (p. ej. el de consola)."""
+    if isinstance(item, logging.LogRecord):
+        return item
+    return logging.makeLogRecord({
+        "name": audit_logger.name, "msg": "API Access", "levelno": logging.INFO,
+        "levelname": "INFO", "created": item.ts, "audit": item,
+    })
+
+
+class JSONLinesFileHandler(RotatingFileHandler):
+    """Fichero rotativo con un evento JSON por línea; un lote se escribe con un solo flush."""
+
+    def __init__(self, filename, maxBytes=0, backupCount=0):
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding="utf-8", delay=True)
+        self.setFormatter(AuditFormatter())
+
+    def emit(self, record):
+        self.emit_batch([record])
+
+    def emit_batch(self, records: List) -> None:
+        self.acquire()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            for record in records:
+                line = self.format(record) + "\n"
+                if self.maxBytes > 0 and self.stream.tell() + len(line) >= self.maxBytes:
+                    self.doRollover()
+                self.stream.write(line)
+            self.stream.flush()
+        except Exception:
+            self.handleError(as_log_record(records[-1]))
+        finally:
+            self.release()
+
+
+class SQLiteAuditHandler(logging.Handler):
+    """Tabla `api_audit` en un SQLite local. La conexión es del hilo que escribe."""
+
+    CREATE = ("CREATE TABLE IF NOT EXISTS api_audit (ts REAL NOT NULL, user_id INTEGER, endpoint TEXT NOT NULL,"
+              " method TEXT NOT NULL, success INTEGER NOT NULL, ip TEXT NOT NULL)")
+    INSERT = "INSERT INTO api_audit VALUES (?, ?, ?, ?, ?, ?)"
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = str(path)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self.CREATE)
+        return self._conn
+
+    def emit(self, record):
+        self.emit_batch([record])
+
+    def emit_batch(self, records: List) -> None:
+        self.acquire()
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(self.INSERT, [record_event(r) for r in records])
+        except Exception:
+            self.handleError(as_log_record(records[-1]))
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        finally:
+            self.release()
+        super().close()
+
+
+def build_sink() -> logging.Handler:
+    sink = getattr(settings, "AUDIT_LOG_SINK", "file")
+    path = getattr(settings, "AUDIT_LOG_PATH", None) or Path(settings.BASE_DIR) / "logs" / "api_audit.jsonl"
+    if sink == "sqlite":
+        return SQLiteAuditHandler(path)
+    if sink == "console":
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(AuditFormatter())
+        return handler
+    return JSONLinesFileHandler(path, maxBytes=getattr(settings, "AUDIT_LOG_MAX_BYTES", 10 * 1024 * 1024),
+                                backupCount=getattr(settings, "AUDIT_LOG_BACKUP_COUNT", 5))
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    QueueListener que entrega los registros en lotes: espera al primero y sigue
+    sacando hasta llenar `batch_size` o agotar `flush_interval` segundos.
+    """
+
+    def __init__(self, q, *handlers, batch_size=200, flush_interval=1.0, source=None):
+        super().__init__(q, *handlers)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.source = source  # el AuditQueueHandler, para avisar de los descartados
+        self.written = 0
+        self._reported_drops = 0
+        self._next_warning = 0.0
+
+    def _next_batch(self):
+        """(registros, parar): bloquea hasta el primer registro."""
+        first = self.queue.get()
+        if first is self._sentinel:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                record = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is self._sentinel:
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def handle_batch(self, records: List) -> None:
+        for handler in self.handlers:
+            emit_batch = getattr(handler, "emit_batch", None)
+            if emit_batch is not None:
+                emit_batch(records)
+            else:
+                for record in records:
+                    handler.handle(as_log_record(record))
+        self.written += len(records)
+        self.report_drops()
+
+    def report_drops(self, force: bool = False) -> None:
+        dropped = self.source.dropped if self.source is not None else 0
+        now = time.monotonic()
+        if dropped > self._reported_drops and (force or now >= self._next_warning):
+            logger.warning("Cola de auditoría llena: %s eventos descartados (%s en total)",
+                           dropped - self._reported_drops, dropped)
+            self._reported_drops = dropped
+            self._next_warning = now + DROP_WARNING_INTERVAL
+
+    def _monitor(self):
+        while True:
+            records, stop = self._next_batch()
+            if records:
+                try:
+                    self.handle_batch(records)
+                except Exception:
+                    logger.exception("Error escribiendo %s eventos de auditoría", len(records))
+            if stop:
+                self.report_drops(force=True)
+                return
+
+
+class AuditQueueHandler(QueueHandler):
+    """
+    Encola los eventos (sin formatearlos) en una cola acotada. El hilo que los
+    escribe se arranca con el primer evento de cada proceso (después del fork de
+    gunicorn) y se para, vaciando la cola, al cerrar el handler.
+
+    La cola es una SimpleQueue (en C, sin el Condition de queue.Queue) y el límite
+    se comprueba con qsize(): con varios hilos a la vez puede pasarse por unos
+    pocos eventos, nunca crecer sin límite.
+    """
+
+    def __init__(self, queue_size=10000, batch_size=200, flush_interval=1.0):
+        super().__init__(queue.SimpleQueue())
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.listener: Optional[BatchingQueueListener] = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Proceso hijo: la cola y el hilo heredados no son suyos
+                self.queue = queue.SimpleQueue()
+                self.dropped = 0
+            self.listener = BatchingQueueListener(self.queue, build_sink(), batch_size=self.batch_size,
+                                                  flush_interval=self.flush_interval, source=self)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # El registro no sale del proceso: no hace falta formatearlo ni copiarlo aquí
+        return record
+
+    def enqueue(self, record):
+        self.submit(record)
+
+    def submit(self, item) -> None:
+        """Encola un AuditEvent (o un LogRecord), o lo descarta si la cola está llena."""
+        self._ensure_listener()
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(item)
+
+    def stop(self) -> int:
+        """Vacía la cola y para el hilo (se vuelve a arrancar con el siguiente evento). Devuelve los escritos."""
+        with self._start_lock:
+            listener, self.listener = self.listener, None
+            if listener is None or self._pid != os.getpid():
+                return 0
+            self._pid = None
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        return listener.written
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.listener.written if self.listener else 0,
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+def audit_handler() -> Optional[AuditQueueHandler]:
+    return next((h for h in audit_logger.handlers if isinstance(h, AuditQueueHandler)), None)
+
+
+def log_audit_event(event: AuditEvent) -> None:
+    """Encola el evento en el handler de auditoría, o lo registra normal si no está configurado."""
+    if not audit_logger.isEnabledFor(logging.INFO):
+        return
+    handler = audit_handler()
+    if handler is None:
+        audit_logger.info("API Access", extra={"audit": event})
+    else:
+        handler.submit(event)
+
+
+def flush_audit_log() -> int:
+    """Escribe los eventos pendientes de este proceso (al salir del worker)."""
+    handler = audit_handler()
+    return handler.stop() if handler is not None else 0
@@ -3,14 +3,16 @@ Módulo de utilidades para mantener la lógica sensible en el backend.
 Este módulo proporciona clases base y funciones para encapsular la lógica
 de negocio crítica, evitando su exposición en el frontend.
 """
-import json
 import logging
+import time
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List, Optional, Union
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.http import HttpRequest
 
+from miweb.security.audit import AuditEvent, log_audit_event
+
 logger = logging.getLogger(__name__)
 
 class SecureBusinessLogic(ABC):
@@ -154,15 +156,6 @@ class APISecurityHelper:
                       success: bool, ip_address: str) -> None:
         """
         Registra el acceso a una API para auditoría de seguridad.
+        Solo encola el evento: se serializa y escribe en segundo plano (ver miweb/security/audit.py).
         """
-        import datetime
-        log_entry = {
-            'user_id': user_id,
-            'endpoint': endpoint,
-            'method': method,
-            'success': success,
-            'ip_address': ip_address,
-            'timestamp': datetime.datetime.now().isoformat()
-        }
-        
-        logger.info(f"API Access: {json.dumps(log_entry)}")
\ No newline at end of file
+        log_audit_event(AuditEvent(time.time(), user_id, endpoint, method, success, ip_address))
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Cabeceras de seguridad precompiladas por ruta.
+
+En lugar de montar la CSP y las cabeceras de cada ruta en cada respuesta, al
+arrancar se compila un "bundle" por prefijo de ruta (cabeceras con la CSP ya
+construida y validadas una vez) y el middleware solo las asigna. El bundle se
+elige por el prefijo más largo que coincide con `request.path`, de modo que
+`CSP_EXEMPT_URLS = ['/admin/']` exime también a `/admin/foo`.
+
+Con `CSP_NONCES = True` cada petición lleva un nonce aleatorio
+(`request.csp_nonce`, y `{{ csp_nonce }}` en las plantillas) que sustituye a
+'unsafe-inline' en script-src; los <script> en línea deben llevar
+`nonce="{{ csp_nonce }}"`.
+"""
+import secrets
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.http.response import ResponseHeaders
+
+NONCE_SLOT = "{nonce}"
+
+CSP_DIRECTIVES = {
+    "default-src": "'self'",
+    "script-src": "'self' https://unpkg.com https://fonts.googleapis.com 'unsafe-inline'",
+    "style-src": "'self' https://fonts.googleapis.com 'unsafe-inline'",
+    "img-src": "'self' data:",
+    "font-src": "'self' https://fonts.gstatic.com",
+    "connect-src": "'self'",
+    "frame-src": "'none'",
+    "object-src": "'none'",
+}
+
+SECURITY_HEADERS = {
+    # Prevenir que el sitio sea mostrado en frames (clickjacking protection)
+    "X-Frame-Options": "DENY",
+    # Habilitar protección XSS en navegadores antiguos
+    "X-XSS-Protection": "1; mode=block",
+    # Prevenir MIME sniffing
+    "X-Content-Type-Options": "nosniff",
+    # Referrer Policy (controla la información enviada en el header Referer)
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+}
+
+
+def build_csp(directives: Dict[str, str], nonces: bool = False) -> str:
+    parts = []
+    for name, value in directives.items():
+        if nonces and name == "script-src":
+            # Con nonce, 'unsafe-inline' sobra (y los navegadores lo ignorarían)
+            sources = [s for s in value.split() if s != "'unsafe-inline'"]
+            value = " ".join(sources + [f"'nonce-{NONCE_SLOT}'"])
+        parts.append(f"{name} {value}")
+    return "; ".join(parts)
+
+
+class HeaderBundle:
+    """Cabeceras de una ruta, compiladas una vez (Cache-Control va aparte, en miweb/cache_policy.py)."""
+
+    def __init__(self, headers: Dict[str, Optional[str]], csp: Optional[str],
+                 csp_fallback: Optional[str] = None):
+        headers = {name: value for name, value in headers.items() if value is not None}
+        self.csp_prefix = self.csp_suffix = None
+        self.csp_fallback = csp_fallback
+        if csp is not None and NONCE_SLOT in csp:
+            # La CSP con nonce se completa en cada petición
+            self.csp_prefix, _, self.csp_suffix = csp.partition(NONCE_SLOT)
+        elif csp is not None:
+            headers["Content-Security-Policy"] = csp
+        ResponseHeaders(headers)  # un valor inválido falla al arrancar, no en una respuesta
+        self.headers: Tuple[Tuple[str, str], ...] = tuple(headers.items())
+
+    def apply(self, response, nonce: Optional[str] = None) -> None:
+        for name, value in self.headers:
+            response.headers[name] = value
+        if self.csp_prefix is not None:
+            if nonce:
+                response.headers["Content-Security-Policy"] = f"{self.csp_prefix}{nonce}{self.csp_suffix}"
+            else:
+                # Sin nonce (p. ej. respuesta sin pasar por process_request) la CSP estricta
+                # bloquearía los scripts en línea: se vuelve a la versión sin nonce
+                response.headers["Content-Security-Policy"] = self.csp_fallback
+
+
+class RouteHeaderTable:
+    """
+    Bundles por prefijo de ruta. `routes` es {prefijo: ajustes}, donde ajustes puede
+    llevar "csp": False (sin CSP) o un dict de directivas que se mezclan con las de
+    por defecto, y "headers": {cabecera: valor, o None para no enviarla}.
+    """
+
+    def __init__(self, routes: Dict[str, Dict[str, Any]], nonces: bool = False):
+        self.nonces = nonces
+        self.default = self._compile({})
+        # Del prefijo más largo al más corto: gana la ruta más específica
+        self._routes: List[Tuple[str, HeaderBundle]] = [
+            (prefix, self._compile(options))
+            for prefix, options in sorted(routes.items(), key=lambda item: len(item[0]), reverse=True)
+        ]
+
+    def _compile(self, options: Dict[str, Any]) -> HeaderBundle:
+        csp_option = options.get("csp", True)
+        csp = fallback = None
+        if csp_option:
+            directives = dict(CSP_DIRECTIVES)
+            if isinstance(csp_option, dict):
+                directives.update(csp_option)
+            csp = build_csp(directives, self.nonces)
+            fallback = build_csp(directives)
+        return HeaderBundle({**SECURITY_HEADERS, **options.get("headers", {})}, csp, fallback)
+
+    def for_path(self, path: str) -> HeaderBundle:
+        for prefix, bundle in self._routes:
+            if path.startswith(prefix):
+                return bundle
+        return self.default
+
+
+def routes_from_settings() -> Dict[str, Dict[str, Any]]:
+    """SECURITY_HEADER_ROUTES más los prefijos de CSP_EXEMPT_URLS (sin CSP)."""
+    routes = {prefix: {"csp": False} for prefix in getattr(settings, "CSP_EXEMPT_URLS", [])}
+    for prefix, options in getattr(settings, "SECURITY_HEADER_ROUTES", {}).items():
+        routes[prefix] = {**routes.get(prefix, {}), **options}
+    return routes
+
+
+def new_nonce() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def csp_nonce(request) -> Dict[str, str]:
+    """Context processor: `{{ csp_nonce }}` (vacío si los nonces están desactivados)."""
+    return {"csp_nonce": getattr(request, "csp_nonce", "")}
@@ -0,0 +1,107 @@
+"""
+Autenticación JWT con los tokens ya validados en memoria.
+
+`JWTAuthentication` comprueba la firma y decodifica el token en cada petición y
+después busca el `User` en la BD. Aquí:
+
+- `CachedJWTAuthentication` guarda el token validado hasta su `exp` y las
+  siguientes peticiones con el mismo token se saltan la firma y el parseo (la
+  búsqueda del usuario se mantiene: is_active, permisos...).
+- `CachedJWTStatelessAuthentication` además devuelve un `TokenUser` construido
+  con los claims, sin tocar la BD. Es para los endpoints que solo necesitan el
+  id del usuario; a cambio, un usuario desactivado sigue entrando hasta que
+  caduque su token.
+
+La cache es por proceso (verificar un HS256 es más barato que ir a la cache
+compartida) y está acotada a JWT_TOKEN_CACHE_MAX_ENTRIES. Cada entrada se indexa
+por su `jti` (una por token, se puede revocar con `token_cache.revoke(jti)`),
+pero se busca por el token completo: un token falsificado que repita un `jti`
+válido no coincide y pasa por la verificación normal.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+
+
+class TokenCache:
+    """Tokens validados por token en bruto, hasta su `exp` (los más antiguos salen primero si se llena)."""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or getattr(settings, "JWT_TOKEN_CACHE_MAX_ENTRIES", 10000)
+        self._entries: "OrderedDict[bytes, Tuple[float, Token]]" = OrderedDict()
+        self._by_jti: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, raw_token: bytes) -> Optional[Token]:
+        entry = self._entries.get(raw_token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, token = entry
+        if time.time() >= expires:
+            self._discard(raw_token)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return token
+
+    def put(self, raw_token: bytes, token: Token) -> None:
+        expires = token.payload.get("exp")
+        if not expires:
+            return
+        jti = token.payload.get(api_settings.JTI_CLAIM)
+        with self._lock:
+            while len(self._entries) >= self.max_entries:
+                old_raw, (_, old_token) = self._entries.popitem(last=False)
+                self._by_jti.pop(old_token.payload.get(api_settings.JTI_CLAIM), None)
+            self._entries[raw_token] = (float(expires), token)
+            if jti:
+                self._by_jti[jti] = raw_token
+
+    def _discard(self, raw_token: bytes) -> None:
+        with self._lock:
+            entry = self._entries.pop(raw_token, None)
+            if entry is not None:
+                self._by_jti.pop(entry[1].payload.get(api_settings.JTI_CLAIM), None)
+
+    def revoke(self, jti: str) -> None:
+        """Olvida el token con ese `jti`: la próxima petición lo vuelve a verificar."""
+        raw_token = self._by_jti.get(jti)
+        if raw_token is not None:
+            self._discard(raw_token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_jti.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenMixin:
+    def get_validated_token(self, raw_token: bytes) -> Token:
+        token = token_cache.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            token_cache.put(raw_token, token)
+        return token
+
+
+class CachedJWTAuthentication(CachedTokenMixin, JWTAuthentication):
+    """JWTAuthentication con los tokens validados en cache (el usuario se sigue leyendo de la BD)."""
+
+
+class CachedJWTStatelessAuthentication(CachedTokenMixin, JWTStatelessUserAuthentication):
+    """Tokens validados en cache y `TokenUser` en lugar del `User`: ninguna consulta a la BD."""
@@ -0,0 +1,277 @@
+"""
+Limitador de peticiones compartido entre workers (ventana deslizante).
+
+Cada regla es "N peticiones por ventana" para una dimensión de la petición
+(la IP del cliente o la conversación del chat). Se usa el contador de ventana
+deslizante: dos contadores de ventana fija (la actual y la anterior) y una
+estimación ponderada. Los contadores viven en la cache 'shared' (Redis en
+producción, BD si no hay Redis), visible para todos los workers de gunicorn.
+
+Una petición que pasa cuesta un solo incr() por dimensión (atómico en Redis,
+aproximado en la cache de BD): la clave se crea con add() solo la primera vez
+en cada ventana y la ventana anterior, que ya no cambia, se lee una vez por
+proceso y se guarda en memoria. Solo las peticiones rechazadas hacen un decr().
+
+Se aplica con el decorador `rate_limit("<scope>")`; al superar el límite se
+responde 429 con `Retry-After`. Los contadores de peticiones comprobadas y
+bloqueadas por scope se acumulan en el proceso y se vuelcan a la cache cada
+STATS_FLUSH_INTERVAL segundos; se consultan con `rate_limiter.stats()` o con
+`manage.py rate_limit_stats`.
+"""
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "rl"
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# Cada cuánto (s) se vuelcan a la cache los contadores de stats del proceso
+STATS_FLUSH_INTERVAL = 10.0
+# Ventanas anteriores recordadas por proceso (se vacía al llenarse)
+MAX_PREVIOUS_WINDOWS = 10000
+
+RATE_LIMITED_MESSAGE = "Demasiadas solicitudes. Espera un momento y vuelve a intentarlo."
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """'20/m' -> (20, 60); '5/10m' -> (5, 600)."""
+    count, _, period = rate.partition("/")
+    unit = period[-1:]
+    multiplier = int(period[:-1] or 1)
+    if unit not in PERIODS:
+        raise ValueError(f"Límite mal formado: {rate!r}")
+    return int(count), multiplier * PERIODS[unit]
+
+
+def client_ip(request) -> Optional[str]:
+    """
+    IP del cliente. Con RATE_LIMIT_TRUSTED_PROXIES = N (1 por defecto) se toma la entrada
+    que añadió el N-ésimo proxy propio en X-Forwarded-For (las primeras las controla el
+    cliente). Sin la cabecera, o con menos entradas, se usa REMOTE_ADDR.
+    """
+    proxies = getattr(settings, "RATE_LIMIT_TRUSTED_PROXIES", 1)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR")
+
+
+def conversation_id(request) -> Optional[str]:
+    """`conversation_id` del cuerpo JSON del chat (None en el modo `history`)."""
+    if "application/json" not in (request.content_type or ""):
+        return None
+    try:
+        payload = json.loads(request.body.decode("utf-8") or "{}")
+    except (ValueError, UnicodeDecodeError):
+        return None
+    value = payload.get("conversation_id") if isinstance(payload, dict) else None
+    return value if isinstance(value, str) and value else None
+
+
+KEY_FUNCS: Dict[str, Callable[[Any], Optional[str]]] = {
+    "ip": client_ip,
+    "conversation": conversation_id,
+}
+
+
+class RateLimiter:
+    """Contadores de ventana deslizante en una cache compartida."""
+
+    def __init__(self, alias: str = "shared"):
+        self.alias = alias
+        self._rules: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        # Cuenta final de ventanas ya cerradas: clave -> peticiones
+        self._previous: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._pending_stats: Counter = Counter()
+        self._stats_flushed_at = time.monotonic()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def rules(self, scope: str) -> Dict[str, Tuple[int, int]]:
+        """Límites (n, ventana) por dimensión para `scope`, parseados una sola vez."""
+        if scope not in self._rules:
+            configured = getattr(settings, "RATE_LIMITS", {}).get(scope, {})
+            self._rules[scope] = {dim: parse_rate(rate) for dim, rate in configured.items() if rate}
+        return self._rules[scope]
+
+    def hit(self, scope: str, dimension: str, key: str, limit: int, window: int) -> Tuple[bool, int, int]:
+        """
+        Cuenta una petición y devuelve (permitida, restantes, segundos_hasta_reintentar).
+        Las peticiones rechazadas no se cuentan, para que Retry-After sea fiable.
+        """
+        now = time.time()
+        index = int(now // window)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+        base = f"{PREFIX}:{scope}:{dimension}:{digest}"
+        current_key = f"{base}:{index}"
+
+        current = self._incr(current_key, timeout=window * 2)
+        previous = self._previous_count(f"{base}:{index - 1}")
+
+        elapsed = now - index * window
+        weight = 1 - elapsed / window
+        estimated = previous * weight + current
+        if estimated <= limit:
+            return True, int(limit - estimated), 0
+
+        self.cache.decr(current_key)
+        current -= 1
+        # Cuándo vuelve a caber una petición si no llega ninguna más
+        if current + 1 <= limit and previous:
+            retry_after = window * (weight - (limit - current - 1) / previous)
+        else:
+            retry_after = (window - elapsed) + window * (1 - (limit - 1) / max(current, 1))
+        return False, 0, max(1, math.ceil(retry_after))
+
+    def _incr(self, key: str, timeout: int) -> int:
+        """incr() de la clave, creándola con add() solo si todavía no existe."""
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            if self.cache.add(key, 1, timeout=timeout):
+                return 1
+            return self.cache.incr(key)  # otro worker la ha creado a la vez
+
+    def _previous_count(self, key: str) -> int:
+        """Cuenta de la ventana anterior, leída de la cache una vez por proceso."""
+        count = self._previous.get(key)
+        if count is None:
+            count = self.cache.get(key, 0)
+            if len(self._previous) >= MAX_PREVIOUS_WINDOWS:
+                self._previous.clear()
+            self._previous[key] = count
+        return count
+
+    def check(self, scope: str, request) -> Optional[Tuple[int, int, int]]:
+        """
+        Aplica todas las reglas de `scope`. Devuelve None si la petición pasa o
+        (límite, ventana, retry_after) de la primera regla superada.
+        """
+        rules = self.rules(scope)
+        if not rules:
+            return None
+        self._count(scope, "checked")
+        for dimension, (limit, window) in rules.items():
+            key = KEY_FUNCS[dimension](request)
+            if not key:
+                continue
+            allowed, _, retry_after = self.hit(scope, dimension, key, limit, window)
+            if not allowed:
+                self._count(scope, "blocked")
+                self._count(scope, f"blocked:{dimension}")
+                logger.warning("Rate limit %s/%s superado (reintentar en %ss)", scope, dimension, retry_after)
+                return limit, window, retry_after
+        return None
+
+    def _count(self, scope: str, name: str) -> None:
+        with self._lock:
+            self._pending_stats[f"{PREFIX}:stats:{scope}:{name}"] += 1
+            due = time.monotonic() - self._stats_flushed_at >= STATS_FLUSH_INTERVAL
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self) -> None:
+        """Suma a la cache los contadores acumulados en el proceso."""
+        with self._lock:
+            pending, self._pending_stats = self._pending_stats, Counter()
+            self._stats_flushed_at = time.monotonic()
+        for key, delta in pending.items():
+            try:
+                self.cache.incr(key, delta)
+            except ValueError:
+                if not self.cache.add(key, delta, timeout=None):
+                    self.cache.incr(key, delta)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Peticiones comprobadas y bloqueadas por scope (y dimensión) desde el último reset."""
+        self.flush_stats()
+        result = {}
+        for scope in getattr(settings, "RATE_LIMITS", {}):
+            names = ["checked", "blocked"] + [f"blocked:{dim}" for dim in self.rules(scope)]
+            keys = [f"{PREFIX}:stats:{scope}:{name}" for name in names]
+            values = self.cache.get_many(keys)
+            result[scope] = {name: values.get(key, 0) for name, key in zip(names, keys)}
+        return result
+
+    def reset_stats(self) -> None:
+        for scope, counters in self.stats().items():
+            self.cache.delete_many([f"{PREFIX}:stats:{scope}:{name}" for name in counters])
+
+
+rate_limiter = RateLimiter()
+
+
+def _wants_json(request) -> bool:
+    return (request.path.startswith("/api/")
+            or request.headers.get("x-requested-with") == "XMLHttpRequest"
+            or "application/json" in (request.headers.get("accept") or "")
+            or "application/json" in (request.content_type or ""))
+
+
+def rate_limited_response(request, limit: int, window: int, retry_after: int,
+                          extra: Optional[Dict[str, Any]] = None) -> HttpResponse:
+    if _wants_json(request):
+        data = {"ok": False, "error": "rate_limited", "message": RATE_LIMITED_MESSAGE, "retry_after": retry_after}
+        data.update(extra or {})
+        response = JsonResponse(data, status=429)
+    else:
+        response = HttpResponse(RATE_LIMITED_MESSAGE, status=429, content_type="text/plain; charset=utf-8")
+    response["Retry-After"] = str(retry_after)
+    response["X-RateLimit-Limit"] = f"{limit};w={window}"
+    return response
+
+
+def rate_limit(scope: str, methods=("POST",), extra: Optional[Dict[str, Any]] = None):
+    """
+    Decorador de vista: aplica las reglas RATE_LIMITS[scope] a las peticiones con
+    método en `methods`. `extra` se añade al JSON del 429 (p. ej. la `reply` del chat).
+    Admite vistas síncronas y async.
+    """
+    def check(request):
+        if not getattr(settings, "RATE_LIMIT_ENABLED", True) or request.method not in methods:
+            return None
+        try:
+            exceeded = rate_limiter.check(scope, request)
+        except Exception:
+            # Si la cache compartida falla, mejor servir que tumbar el endpoint
+            logger.exception("Error comprobando el rate limit de %s", scope)
+            return None
+        if exceeded is None:
+            return None
+        return rate_limited_response(request, *exceeded, extra=extra)
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                limited = await sync_to_async(check)(request)
+                if limited is not None:
+                    return limited
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limited = check(request)
+            if limited is not None:
+                return limited
+            return view(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
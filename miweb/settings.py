@@ -48,7 +48,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'miweb.prerender.PrerenderedPagesMiddleware',  # WhiteNoise + páginas pre-renderizadas
+    'miweb.page_cache.PageCacheMiddleware',  # Páginas de marketing servidas desde la cache 'shared'
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,12 +57,13 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'miweb.middleware.SecurityProtectionMiddleware',  # Middleware personalizado para protección
+    'miweb.cache_policy.CachePolicyMiddleware',  # Cache-Control/Vary/Surrogate-Key por ruta
 ]
 
 # Optimizar middleware en producción
 if not DEBUG:
-    # Añadir middleware de gzip para compresión de respuestas HTTP
-    MIDDLEWARE.insert(1, 'django.middleware.gzip.GZipMiddleware')
+    # Añadir middleware de gzip para compresión de respuestas HTTP (salvo los SSE del chat)
+    MIDDLEWARE.insert(1, 'miweb.middleware.StreamingAwareGZipMiddleware')
     
     # Añadir middleware de etag condicional
     MIDDLEWARE.append('django.middleware.http.ConditionalGetMiddleware')
@@ -79,6 +81,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'miweb.security.headers.csp_nonce',
             ],
         },
     },
@@ -107,6 +110,81 @@ AUTH_PASSWORD_VALIDATORS = [
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL   = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
+# ---- Chat: conversaciones guardadas en servidor (modo conversation_id) ----
+# Se guardan en BD para compartirlas entre workers; caducan por inactividad (TTL)
+# y, por encima del máximo, se eliminan las menos recientes (LRU).
+CHAT_STORE_TTL = int(os.getenv("CHAT_STORE_TTL", "7200"))  # segundos
+CHAT_STORE_MAX_CONVERSATIONS = int(os.getenv("CHAT_STORE_MAX_CONVERSATIONS", "5000"))
+CHAT_STORE_MAX_TURNS = int(os.getenv("CHAT_STORE_MAX_TURNS", "40"))
+# Fracción de conversaciones nuevas que lanzan la limpieza (caducadas + exceso sobre el máximo)
+CHAT_STORE_EVICT_PROBABILITY = float(os.getenv("CHAT_STORE_EVICT_PROBABILITY", "0.01"))
+
+# Presupuesto (tokens estimados) del historial que se envía a Gemini; los turnos antiguos
+# se resumen conservando los datos del lead. 0 = sin límite
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "3000"))
+
+# Turnos ya normalizados que se memorizan por proceso (el historial se reenvía en
+# cada petición). 0 = sin memoria
+CHAT_TEXT_CACHE_SIZE = int(os.getenv("CHAT_TEXT_CACHE_SIZE", "2048"))
+
+# Fichero opcional con reglas de prompt injection (un patrón por línea);
+# se recarga en caliente al modificarlo. Vacío = reglas por defecto de website.views
+CHAT_INJECTION_RULES_FILE = os.getenv("CHAT_INJECTION_RULES_FILE", "")
+
+# Caché de respuestas para los mensajes de chip (primer turno): TTL, variantes que se
+# rotan y longitud máxima del mensaje cacheable. Vive en la cache 'shared'.
+CHAT_CHIP_CACHE_TTL = int(os.getenv("CHAT_CHIP_CACHE_TTL", "86400"))
+CHAT_CHIP_CACHE_VARIANTS = int(os.getenv("CHAT_CHIP_CACHE_VARIANTS", "3"))
+CHAT_CHIP_CACHE_MAX_LENGTH = int(os.getenv("CHAT_CHIP_CACHE_MAX_LENGTH", "120"))
+# Textos de los chips del widget del chat, separados por "|". Solo estos se cachean
+# (se comparan normalizados); `is_chip_message` lo envía el cliente y no basta.
+# Vacío = no se cachea ninguno
+CHAT_CHIP_MESSAGES = [m.strip() for m in os.getenv("CHAT_CHIP_MESSAGES", "").split("|") if m.strip()]
+
+# Vista async del chat: activar solo sirviendo con ASGI (ver miweb/asgi.py)
+CHAT_ASYNC = os.getenv("CHAT_ASYNC", "False") == "True"
+
+# Backend del LLM del chat: "gemini" (API real) o "stub" (local, para pruebas de carga)
+CHAT_LLM_BACKEND = os.getenv("CHAT_LLM_BACKEND", "gemini")
+# Stub: distribución de latencia (fixed, uniform, normal, lognormal, exponential), media y
+# dispersión en segundos, pausa entre trozos en streaming, fracción de errores 429/503 y semilla
+CHAT_STUB_LATENCY = os.getenv("CHAT_STUB_LATENCY", "lognormal")
+CHAT_STUB_LATENCY_MEAN = float(os.getenv("CHAT_STUB_LATENCY_MEAN", "0.8"))
+CHAT_STUB_LATENCY_JITTER = float(os.getenv("CHAT_STUB_LATENCY_JITTER", "0.3"))
+CHAT_STUB_CHUNK_DELAY = float(os.getenv("CHAT_STUB_CHUNK_DELAY", "0.05"))
+CHAT_STUB_ERROR_RATE = float(os.getenv("CHAT_STUB_ERROR_RATE", "0"))
+CHAT_STUB_SEED = int(os.getenv("CHAT_STUB_SEED", "42"))
+
+# Resiliencia de las llamadas a Gemini (por proceso): llamadas simultáneas y espera
+# máxima en cola, plazo total por petición (s), reintentos con backoff exponencial
+# y jitter, y circuit breaker (429/timeouts seguidos para abrirlo, segundos abierto)
+CHAT_GEMINI_MAX_CONCURRENCY = int(os.getenv("CHAT_GEMINI_MAX_CONCURRENCY", "8"))
+CHAT_GEMINI_QUEUE_TIMEOUT = float(os.getenv("CHAT_GEMINI_QUEUE_TIMEOUT", "2"))
+CHAT_GEMINI_DEADLINE = float(os.getenv("CHAT_GEMINI_DEADLINE", "25"))
+CHAT_GEMINI_MAX_ATTEMPTS = int(os.getenv("CHAT_GEMINI_MAX_ATTEMPTS", "2"))
+CHAT_GEMINI_BACKOFF_BASE = float(os.getenv("CHAT_GEMINI_BACKOFF_BASE", "0.5"))
+CHAT_GEMINI_BACKOFF_MAX = float(os.getenv("CHAT_GEMINI_BACKOFF_MAX", "4"))
+CHAT_GEMINI_BREAKER_THRESHOLD = int(os.getenv("CHAT_GEMINI_BREAKER_THRESHOLD", "5"))
+CHAT_GEMINI_BREAKER_RESET = float(os.getenv("CHAT_GEMINI_BREAKER_RESET", "30"))
+
+# ---- Rate limiting (miweb/security/rate_limit.py) ----
+# Contadores en la cache 'shared' (comunes a todos los workers). Formato "N/periodo":
+# 20/m, 5/10m, 100/h... Dimensiones: "ip" y "conversation" (conversation_id del chat)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True") == "True"
+# Proxies propios delante de Django para leer la IP de X-Forwarded-For. Por defecto 1 (el
+# router de Render/Heroku); con 0 todas las peticiones que pasan por un proxy comparten
+# la IP de este. Pon 0 solo si Django recibe las conexiones directamente
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1"))
+RATE_LIMITS = {
+    "chat": {
+        "ip": os.getenv("RATE_LIMIT_CHAT_IP", "20/m"),
+        "conversation": os.getenv("RATE_LIMIT_CHAT_CONVERSATION", "10/m"),
+    },
+    "contact": {"ip": os.getenv("RATE_LIMIT_CONTACT_IP", "5/10m")},
+    "contact_api": {"ip": os.getenv("RATE_LIMIT_CONTACT_API_IP", "10/m")},
+    "contact_batch_api": {"ip": os.getenv("RATE_LIMIT_CONTACT_BATCH_API_IP", "10/m")},
+}
+
 # ---- Destinatarios correo ----
 DEFAULT_TO_EMAIL = os.getenv("DEFAULT_TO_EMAIL", "you@example.com")
 CONTACT_RECIPIENTS = [
@@ -124,6 +202,25 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
 EMAIL_USE_TLS   = os.getenv("EMAIL_USE_TLS", "False") == "True"
 EMAIL_USE_SSL   = os.getenv("EMAIL_USE_SSL", "False") == "True"
+
+# ---- Outbox de emails (website/outbox.py, lo vacía `manage.py outbox_worker`) ----
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))  # segundos entre vueltas del worker
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "120"))  # reserva de un lote en envío
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "30"))   # 30s, 60s, 120s... hasta el tope
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+# A partir de cuántos emails del mismo tipo y destinatarios en un lote se envía un resumen (0 = nunca)
+OUTBOX_DIGEST_THRESHOLD = int(os.getenv("OUTBOX_DIGEST_THRESHOLD", "3"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "30"))  # enviados que se conservan
+
+# ---- Registro de leads (website/leads.py): se escriben en lotes con bulk_create ----
+LEAD_BUFFER_SIZE = int(os.getenv("LEAD_BUFFER_SIZE", "50"))         # leads por lote
+LEAD_BUFFER_MAX_AGE = float(os.getenv("LEAD_BUFFER_MAX_AGE", "2"))  # segundos máximos en memoria
+# Lotes seguidos que un lead puede volver al buffer si la BD no responde antes de darlo por perdido
+LEAD_BUFFER_MAX_RETRIES = int(os.getenv("LEAD_BUFFER_MAX_RETRIES", "5"))
+# Contactos por petición en la carga por lotes de la API (array JSON o NDJSON)
+CONTACT_BATCH_MAX_ROWS = int(os.getenv("CONTACT_BATCH_MAX_ROWS", "10000"))
 LANGUAGE_CODE = 'es'
 TIME_ZONE = 'Europe/Madrid'
 USE_I18N = True
@@ -145,6 +242,23 @@ CACHES = {
     }
 }
 
+# Cache compartida entre todos los workers de gunicorn (la LocMemCache es por proceso).
+# Con REDIS_URL se usa Redis; si no, una tabla en la BD (python manage.py createcachetable).
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'TIMEOUT': 300,
+    }
+else:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'shared_cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "10000"))},
+    }
+
 # Activar cache de templates en producción
 if not DEBUG:
     TEMPLATES[0]['APP_DIRS'] = False  # Deshabilitar APP_DIRS cuando usamos loaders
@@ -183,12 +297,118 @@ if not DEBUG:
     X_FRAME_OPTIONS = 'DENY'
 
 # URLs que están exentas de la protección de Content Security Policy
-# Útil para páginas que necesitan cargar recursos externos
+# Útil para páginas que necesitan cargar recursos externos (son prefijos: '/admin/' exime /admin/*)
 CSP_EXEMPT_URLS = [
     '/admin/',
     '/demos/',
 ]
 
+# Ajustes de cabeceras por prefijo de ruta, compilados al arrancar (ver miweb/security/headers.py):
+# {'/ruta/': {'csp': {'img-src': "'self' data: https:"}, 'headers': {'X-Frame-Options': 'SAMEORIGIN'}}}
+SECURITY_HEADER_ROUTES = {}
+
+# Nonce por petición en la CSP en lugar de 'unsafe-inline' para scripts en línea
+# (los <script> en línea de las plantillas llevan nonce="{{ csp_nonce }}")
+CSP_NONCES = os.getenv("CSP_NONCES", "False") == "True"
+
+# ---- Cache HTTP (navegador y CDN), ver miweb/cache_policy.py ----
+# Políticas con nombre; "never" y "private" son obligatorias (por defecto para no-HTML y HTML).
+# Las públicas se rebajan solas a "private" si la respuesta pone cookies o varía por Cookie.
+CACHE_POLICIES = {
+    "never": {"cache_control": "no-store"},
+    "private": {"cache_control": "private, max-age=300"},
+    "marketing": {
+        "cache_control": "public, max-age=300, s-maxage=86400, stale-while-revalidate=600",
+        "vary": ["Accept-Encoding"],
+        "surrogate_keys": ["pages"],
+    },
+}
+
+# Política por nombre de URL ("namespace:nombre") o prefijo ("/ruta/"); el decorador
+# @cache_policy de la vista tiene prioridad. Las claves admiten los argumentos de la URL.
+CACHE_POLICY_ROUTES = {
+    "/api/": "never",
+    "/admin/": "never",
+    "website:home": "marketing",
+    "website:acerca": "marketing",
+    "website:privacidad": "marketing",
+    "website:terminos": "marketing",
+    "website:cookies": "marketing",
+    "website:vinaros": "marketing",
+    "website:castellon": "marketing",
+    "software_a_medida_direct": {"policy": "marketing", "keys": ["services"]},
+    "integraciones_api_direct": {"policy": "marketing", "keys": ["services"]},
+    "automatizacion_procesos_ia_direct": {"policy": "marketing", "keys": ["services"]},
+    "erp_crm_medida_direct": {"policy": "marketing", "keys": ["services"]},
+    "/servicios/": {"policy": "marketing", "keys": ["services"]},
+    "/apps/": {"policy": "marketing", "keys": ["demos"]},
+    "/blog/": {"policy": "marketing", "keys": ["blog"]},
+    "blog:post": {"policy": "marketing", "keys": ["blog", "blog:{slug}"]},
+}
+
+# Cabecera de surrogate keys de la CDN (Surrogate-Key en Fastly, Cache-Tag en Cloudflare)
+CACHE_SURROGATE_KEY_HEADER = os.getenv("CACHE_SURROGATE_KEY_HEADER", "Surrogate-Key")
+
+# Purga al guardar/borrar estos modelos (claves con {obj.<campo>}). Las claves se envían
+# por POST a CACHE_PURGE_URL (webhook de la CDN) si está configurada
+CACHE_PURGE_MODELS = {
+    "blog.Post": ["blog", "blog:{obj.slug}"],
+    "services.Service": ["services"],
+    "demos.AppDemo": ["demos"],
+}
+CACHE_PURGE_URL = os.getenv("CACHE_PURGE_URL", "")
+CACHE_PURGE_TOKEN = os.getenv("CACHE_PURGE_TOKEN", "")
+
+# ---- Cache de página completa (miweb/page_cache.py) ----
+# Respuesta final de estas vistas (sin argumentos) guardada en la cache 'shared' con sus
+# variantes gzip/brotli. Desactivada en DEBUG (las plantillas cambian sin reiniciar) y con CSP_NONCES
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", str(not DEBUG)) == "True"
+PAGE_CACHE_ALIAS = "shared"
+PAGE_CACHE_TIMEOUT = int(os.getenv("PAGE_CACHE_TIMEOUT", "3600"))
+PAGE_CACHE_MAX_SIZE = int(os.getenv("PAGE_CACHE_MAX_SIZE", str(512 * 1024)))  # bytes sin comprimir
+PAGE_CACHE_BROTLI_QUALITY = int(os.getenv("PAGE_CACHE_BROTLI_QUALITY", "11"))  # se comprime una vez por página
+PAGE_CACHE_VIEWS = [
+    "website:home",
+    "website:vinaros",
+    "website:castellon",
+    "website:privacidad",
+    "website:terminos",
+    "website:cookies",
+    "services:servicios_index",
+    "services:software_a_medida",
+    "services:integraciones_api",
+    "services:automatizacion_procesos_ia",
+    "services:erp_crm_medida",
+    "software_a_medida_direct",
+    "integraciones_api_direct",
+    "automatizacion_procesos_ia_direct",
+    "erp_crm_medida_direct",
+]
+
+# ---- Páginas pre-renderizadas (miweb/prerender.py, `python manage.py prerender_pages`) ----
+# HTML minificado y precomprimido generado en el despliegue y servido como estático. Si falta
+# una página, o las plantillas cambiaron desde el pre-render, se renderiza en vivo
+PRERENDER_ENABLED = os.getenv("PRERENDER_ENABLED", str(not DEBUG)) == "True"
+PRERENDER_ROOT = BASE_DIR / "prerendered"
+# Esquema y host con los que se generan (canonical, og:url). Vacío = https + primer ALLOWED_HOSTS
+PRERENDER_BASE_URL = os.getenv("PRERENDER_BASE_URL", "")
+PRERENDER_VIEWS = PAGE_CACHE_VIEWS + ["website:acerca"]
+
+# Identificador del despliegue (p. ej. el commit); forma parte de la clave de la cache de páginas
+DEPLOY_ID = os.getenv("DEPLOY_ID") or os.getenv("RENDER_GIT_COMMIT") or os.getenv("HEROKU_SLUG_COMMIT", "")
+
+# ---- Auditoría de la API (miweb/security/audit.py) ----
+# Los eventos se encolan en la petición y un hilo los escribe en lotes en el destino:
+# "file" (JSON por línea, rotativo), "sqlite" (tabla api_audit) o "console"
+AUDIT_LOG_SINK = os.getenv("AUDIT_LOG_SINK", "file")
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH") or BASE_DIR / "logs" / (
+    "api_audit.sqlite3" if AUDIT_LOG_SINK == "sqlite" else "api_audit.jsonl")
+AUDIT_LOG_MAX_BYTES = int(os.getenv("AUDIT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # solo "file"
+AUDIT_LOG_BACKUP_COUNT = int(os.getenv("AUDIT_LOG_BACKUP_COUNT", "5"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))         # eventos; si se llena se descartan
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))           # eventos por escritura
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))   # segundos máximos en la cola
+
 # Configuración de logging simplificada para producción
 LOGGING = {
     'version': 1,
@@ -197,6 +417,13 @@ LOGGING = {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'audit': {
+            # Con '()' y no 'class': dictConfig no trata el handler como un QueueHandler genérico
+            '()': 'miweb.security.audit.AuditQueueHandler',
+            'queue_size': AUDIT_QUEUE_SIZE,
+            'batch_size': AUDIT_BATCH_SIZE,
+            'flush_interval': AUDIT_FLUSH_INTERVAL,
+        },
     },
     'loggers': {
         'django.request': {
@@ -204,13 +431,19 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
+        'miweb.audit': {
+            'handlers': ['audit'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication con los tokens validados en cache (miweb/security/jwt_auth.py)
+        'miweb.security.jwt_auth.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',  # Mantener autenticación de sesión
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -258,12 +491,17 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Tokens validados que guarda cada proceso (hasta su exp) para no verificar la firma en cada petición
+JWT_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("JWT_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
 # Configuración de características de seguridad avanzadas
 # Todas estas características son OPCIONALES y están DESACTIVADAS por defecto
 # Para activarlas en producción, añade estas variables a tu .env
 
-# Habilitar el proxy de API (por defecto: False)
+# Habilitar el proxy de API (por defecto: False). Los endpoints se gestionan en el admin
+# (APIEndpoint); cada worker comprueba si han cambiado como mucho cada N segundos
 ENABLE_API_PROXY = os.getenv('ENABLE_API_PROXY', 'False') == 'True'
+API_PROXY_CHECK_INTERVAL = float(os.getenv('API_PROXY_CHECK_INTERVAL', '5'))
 
 # Habilitar la autenticación JWT (por defecto: False)
 ENABLE_JWT_AUTH = os.getenv('ENABLE_JWT_AUTH', 'False') == 'True'
@@ -0,0 +1,94 @@
+// ==============================
+// Cliente del chat en streaming (SSE sobre fetch)
+// ==============================
+// Uso:
+//   streamChat('Hola', {
+//     conversationId,                       // opcional (modo conversación)
+//     onChunk: (partial) => render(partial), // texto acumulado provisional
+//     onDone:  (data) => render(data.reply), // respuesta definitiva
+//   });
+// EventSource solo admite GET, así que se lee el cuerpo de la respuesta a mano.
+(() => {
+  const getCSRF = () => {
+    const m = document.cookie.match(/csrftoken=([^;]+)/);
+    return m ? decodeURIComponent(m[1]) : '';
+  };
+
+  // Convierte un bloque "event: x\ndata: {...}" en {event, data}
+  const parseEvent = (block) => {
+    let event = 'message';
+    const data = [];
+    block.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) data.push(line.slice(5).trimStart());
+    });
+    if (!data.length) return null;
+    try { return { event, data: JSON.parse(data.join('\n')) }; }
+    catch (e) { return null; }
+  };
+
+  async function streamChat(message, opts = {}) {
+    const { conversationId, isChip = false, onStart, onChunk, onDone, onError,
+            url = '/api/chat-gemini/stream/' } = opts;
+
+    const body = { message, is_chip_message: isChip };
+    if (conversationId) body.conversation_id = conversationId;
+
+    let partial = '';
+    let final = null;
+
+    try {
+      const res = await fetch(url, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
+          'X-CSRFToken': getCSRF(),
+        },
+        body: JSON.stringify(body),
+      });
+
+      // Errores de validación (400) vuelven como JSON normal
+      if (!res.ok || !res.body) {
+        const data = await res.json().catch(() => ({}));
+        onError?.(data);
+        return data;
+      }
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+          const evt = parseEvent(buffer.slice(0, sep));
+          buffer = buffer.slice(sep + 2);
+          if (!evt) continue;
+
+          if (evt.event === 'start') onStart?.(evt.data);
+          else if (evt.event === 'chunk') {
+            partial += evt.data.text || '';
+            onChunk?.(partial, evt.data.text || '');
+          } else if (evt.event === 'done') {
+            final = evt.data;
+          }
+        }
+      }
+    } catch (err) {
+      onError?.({ error: 'No se pudo conectar. Revisa tu red e inténtalo de nuevo.' });
+      return null;
+    }
+
+    // La respuesta definitiva sustituye al texto provisional
+    if (final) onDone?.(final);
+    else onError?.({ error: 'La respuesta se cortó. Inténtalo de nuevo.' });
+    return final;
+  }
+
+  window.streamChat = streamChat;
+})();
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Contacto, Testimonio
+from django.utils.html import format_html_join
+from .models import Contacto, Testimonio, ChatConversation, OutboundEmail, Lead, APIEndpoint
+from .leads import NON_DIGITS_RX, normalize_phone
 
 @admin.register(Contacto)
 class ContactoAdmin(admin.ModelAdmin):
@@ -11,4 +13,59 @@ class ContactoAdmin(admin.ModelAdmin):
 class TestimonioAdmin(admin.ModelAdmin):
     list_display = ('autor', 'empresa', 'publicado', 'fecha_creacion')
     list_filter = ('publicado',)
-    search_fields = ('autor', 'empresa', 'texto')
\ No newline at end of file
+    search_fields = ('autor', 'empresa', 'texto')
+
+@admin.register(ChatConversation)
+class ChatConversationAdmin(admin.ModelAdmin):
+    list_display = ('conversation_id', 'lead_sent', 'created_at', 'updated_at')
+    list_filter = ('lead_sent',)
+    search_fields = ('conversation_id',)
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'kind', 'status', 'attempts', 'digest', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind', 'digest')
+    search_fields = ('subject', 'body')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+
+@admin.register(Lead)
+class LeadAdmin(admin.ModelAdmin):
+    list_display = ('name', 'phone', 'source', 'priority', 'company', 'created_at')
+    list_filter = ('source', 'priority')
+    search_fields = ('name',)
+    ordering = ('-created_at',)
+    list_per_page = 50
+    # Con cientos de miles de filas, evita el COUNT(*) sin filtros en cada página
+    show_full_result_count = False
+    exclude = ('transcript_z',)
+    readonly_fields = ('phone_normalized', 'conversation_id', 'transcript_display')
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        # El listado no necesita la transcripción ni el mensaje completo
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            qs = qs.defer('transcript_z', 'message')
+        return qs
+
+    def get_search_results(self, request, queryset, search_term):
+        # Un teléfono (en cualquier formato) se busca normalizado, por igualdad: usa el índice
+        if len(NON_DIGITS_RX.sub('', search_term)) >= 9:
+            return queryset.filter(phone_normalized=normalize_phone(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
+
+    @admin.display(description='Transcripción')
+    def transcript_display(self, obj):
+        turns = obj.transcript
+        if not turns:
+            return '—'
+        return format_html_join(
+            '', '<p><strong>{}:</strong> {}</p>',
+            (('Cliente' if t.get('role') == 'user' else 'Asistente', t.get('content', '')) for t in turns),
+        )
+
+@admin.register(APIEndpoint)
+class APIEndpointAdmin(admin.ModelAdmin):
+    list_display = ('path', 'hash_id', 'view', 'methods', 'enabled', 'updated_at')
+    list_filter = ('enabled',)
+    search_fields = ('path', 'view', 'hash_id')
+    readonly_fields = ('updated_at',)
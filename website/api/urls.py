@@ -16,4 +16,5 @@ urlpatterns = [
     
     # URLs de la API
     path('contact/', views.ContactAPIView.as_view(), name='api_contact'),
+    path('contact/batch/', views.ContactBatchAPIView.as_view(), name='api_contact_batch'),
 ]
\ No newline at end of file
@@ -1,12 +1,35 @@
 """
 Vistas de API para la aplicación de website.
 """
+import json
+import logging
+import re
+
 from rest_framework import status
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.db import transaction
+from django.utils.decorators import method_decorator
 
 from miweb.security.business_logic import DataProcessor, APISecurityHelper
+from miweb.security.jwt_auth import CachedJWTStatelessAuthentication
+from miweb.security.rate_limit import rate_limit
+from website.leads import build_lead
+from website.models import Lead
+
+logger = logging.getLogger(__name__)
+
+# Los endpoints de contactos solo usan request.user.id: TokenUser, sin consultar la BD
+STATELESS_AUTHENTICATION = [CachedJWTStatelessAuthentication, SessionAuthentication]
+
+# Ejemplo simple: al menos 9 dígitos
+PHONE_RX = re.compile(r'\+?[\d\s]{9,}')
+REQUIRED_FIELDS = ('name', 'phone', 'message', 'sector')
+
 
 class ContactProcessor(DataProcessor):
     """
@@ -16,25 +39,29 @@ class ContactProcessor(DataProcessor):
     
     def validate_data(self, data):
         """Valida los datos de contacto."""
-        required_fields = ['name', 'phone', 'message', 'sector']
-        
-        for field in required_fields:
+        error = self.check_contact(data)
+        if error:
+            self.add_error(error)
+            return False
+        return True
+
+    @classmethod
+    def check_contact(cls, data):
+        """Primer error de un contacto, o None si es válido."""
+        for field in REQUIRED_FIELDS:
             if field not in data or not data[field]:
-                self.add_error(f"El campo '{field}' es obligatorio.")
-                return False
+                return f"El campo '{field}' es obligatorio."
         
         # Validación adicional específica
-        if 'phone' in data and not self._validate_phone(data['phone']):
-            self.add_error("El formato del teléfono no es válido.")
-            return False
+        if not cls._validate_phone(data['phone']):
+            return "El formato del teléfono no es válido."
         
-        return True
+        return None
     
-    def _validate_phone(self, phone):
+    @staticmethod
+    def _validate_phone(phone):
         """Valida el formato del teléfono."""
-        import re
-        # Ejemplo simple: al menos 9 dígitos
-        return bool(re.match(r'^\+?[\d\s]{9,}$', phone))
+        return isinstance(phone, str) and PHONE_RX.fullmatch(phone) is not None
     
     def process_data(self, data):
         """Procesa los datos de contacto de forma segura."""
@@ -52,7 +79,8 @@ class ContactProcessor(DataProcessor):
         
         return processed_data
     
-    def _calculate_priority(self, data):
+    @staticmethod
+    def _calculate_priority(data):
         """
         Calcula la prioridad del contacto según criterios internos.
         Esta es lógica sensible que debe mantenerse en el backend.
@@ -70,11 +98,13 @@ class ContactProcessor(DataProcessor):
         return priority
 
 
+@method_decorator(rate_limit("contact_api"), name="post")
 class ContactAPIView(APIView):
     """
     API para gestionar contactos.
     Utiliza JWT para autenticación y mantiene la lógica crítica en el backend.
     """
+    authentication_classes = STATELESS_AUTHENTICATION
     permission_classes = [IsAuthenticated]
     
     def post(self, request, *args, **kwargs):
@@ -113,4 +143,135 @@ class ContactAPIView(APIView):
             return Response(
                 {'status': 'error', 'message': 'Error al procesar la solicitud'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+class NDJSONParser(BaseParser):
+    """
+    Un contacto JSON por línea. Una línea ilegible no invalida el lote: queda como
+    None y se informa como error de ese elemento.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        rows = []
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line.decode(encoding)))
+            except ValueError:  # incluye UnicodeDecodeError
+                rows.append(None)
+        return rows
+
+
+class ContactBatchProcessor(DataProcessor):
+    """
+    Procesa un lote de contactos: valida cada uno con las reglas de ContactProcessor,
+    calcula su prioridad y guarda los válidos como leads con un único bulk_create.
+    Los errores se devuelven por elemento (índice en el lote), sin rechazar el resto.
+    """
+
+    def __init__(self, request=None, max_rows=None):
+        super().__init__(request)
+        self.max_rows = max_rows or getattr(settings, 'CONTACT_BATCH_MAX_ROWS', 10000)
+
+    def validate_data(self, rows):
+        """Comprueba el lote en conjunto (los contactos se validan uno a uno al procesarlo)."""
+        if not isinstance(rows, list):
+            self.add_error("Se esperaba una lista de contactos (array JSON o NDJSON).")
+            return False
+        if not rows:
+            self.add_error("La lista de contactos está vacía.")
+            return False
+        if len(rows) > self.max_rows:
+            self.add_error(f"Como máximo {self.max_rows} contactos por petición.")
+            return False
+        return True
+
+    def build_lead(self, row):
+        """Lead de un contacto, o el mensaje de error si no es válido."""
+        if not isinstance(row, dict):
+            return None, "El contacto no es un objeto JSON válido."
+        error = ContactProcessor.check_contact(row)
+        if error:
+            return None, error
+        try:
+            priority = ContactProcessor._calculate_priority(row)
+        except (AttributeError, TypeError, ValueError):
+            return None, "Hay campos con un valor no válido (p. ej. el presupuesto)."
+        return build_lead(
+            Lead.SOURCE_API,
+            str(row['name']),
+            row['phone'],
+            message=str(row['message']),
+            company=str(row.get('company') or ''),
+            sector=str(row['sector']),
+            priority=priority,
+        ), None
+
+    def process_data(self, rows):
+        leads = []
+        errors = []
+        for index, row in enumerate(rows):
+            lead, error = self.build_lead(row)
+            if error:
+                errors.append({'index': index, 'error': error})
+            else:
+                leads.append(lead)
+        if leads:
+            with transaction.atomic():
+                Lead.objects.bulk_create(leads, batch_size=500)
+        return {'received': len(rows), 'created': len(leads), 'errors': errors}
+
+
+@method_decorator(rate_limit("contact_batch_api"), name="post")
+class ContactBatchAPIView(APIView):
+    """
+    API para cargar contactos por lotes desde el CRM de un partner.
+    Acepta un array JSON o NDJSON (application/x-ndjson) y guarda los válidos.
+    """
+    authentication_classes = STATELESS_AUTHENTICATION
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        """Procesa un lote de contactos."""
+        # Fuera del try: un cuerpo ilegible es un 400 de DRF, no un error interno
+        rows = request.data
+        try:
+            client_ip = request.META.get('REMOTE_ADDR', 'unknown')
+            APISecurityHelper.log_api_access(
+                request.user.id,
+                'contact_batch',
+                'POST',
+                True,
+                client_ip
+            )
+
+            processor = ContactBatchProcessor(request)
+            result = processor.safe_execute(rows)
+
+            if not result['success']:
+                return Response(
+                    {'status': 'error', 'errors': result['errors']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            data = result['result']
+            if not data['created']:
+                return Response({'status': 'error', **data}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                {'status': 'partial' if data['errors'] else 'success', **data},
+                status=status.HTTP_201_CREATED
+            )
+
+        except Exception:
+            logger.exception("Error en ContactBatchAPIView")
+
+            return Response(
+                {'status': 'error', 'message': 'Error al procesar la solicitud'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class WebsiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'website'
+
+    def ready(self):
+        # Purga de surrogate keys al guardar/borrar contenido (ver miweb/cache_policy.py)
+        from miweb.cache_policy import connect_model_purges
+        connect_model_purges()
+        # Recarga en caliente de la tabla del proxy de API al editar sus endpoints
+        from miweb.security.api_proxy import connect_endpoint_signals
+        connect_endpoint_signals()
+        # La cache de páginas registra su purga al importarse (también en shell/worker)
+        import miweb.page_cache  # noqa: F401
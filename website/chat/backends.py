@@ -0,0 +1,33 @@
+"""
+Selección del backend de LLM del chat (setting CHAT_LLM_BACKEND).
+
+- "gemini": `GeminiClientManager`, la API real.
+- "stub": `StubClient`, local y determinista, para pruebas de carga sin red
+  (ver website/chat/stub.py y los settings CHAT_STUB_*).
+
+Ambos exponen `configured`, `model_name`, `get_model()`, `warm_up()` y
+`stats()`; el modelo devuelto tiene `start_chat(history)` como el del SDK.
+"""
+from typing import Any, Dict
+
+from django.conf import settings
+
+from .client import GeminiClientManager
+from .stub import StubClient
+
+BACKENDS = ("gemini", "stub")
+
+
+def build_client(backend: str, api_key: str, model_name: str, generation_config: Dict[str, Any]):
+    if backend == "gemini":
+        return GeminiClientManager(api_key, model_name, generation_config)
+    if backend == "stub":
+        return StubClient(
+            distribution=settings.CHAT_STUB_LATENCY,
+            mean=settings.CHAT_STUB_LATENCY_MEAN,
+            jitter=settings.CHAT_STUB_LATENCY_JITTER,
+            chunk_delay=settings.CHAT_STUB_CHUNK_DELAY,
+            error_rate=settings.CHAT_STUB_ERROR_RATE,
+            seed=settings.CHAT_STUB_SEED,
+        )
+    raise ValueError(f"CHAT_LLM_BACKEND desconocido: {backend!r} (opciones: {', '.join(BACKENDS)})")
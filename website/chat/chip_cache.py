@@ -0,0 +1,126 @@
+"""
+Caché de respuestas para los mensajes de chip.
+
+Los chips (opciones rápidas) con historial vacío son un conjunto pequeño y fijo
+de primeros mensajes, y todos llevan el mismo prompt. Se guarda la respuesta
+cruda del modelo por mensaje normalizado y versión del prompt; cuando ya hay
+`variants` respuestas distintas se sirven rotando sin llamar al LLM.
+
+Solo se cachean los textos de chip conocidos (CHAT_CHIP_MESSAGES, comparados
+ya normalizados): el indicador `is_chip_message` lo pone el cliente, así que
+con él solo cualquiera podría llenar la cache de mensajes propios.
+
+Las respuestas viven en la cache 'shared' (Redis o BD) y las comparten todos
+los workers. Un acierto cuesta un solo get(): la rotación entre variantes es
+por proceso y los contadores de aciertos y fallos se acumulan en el proceso y
+se vuelcan a la cache cada STATS_FLUSH_INTERVAL segundos (como en el rate
+limiter). La cache está acotada por su MAX_ENTRIES/TTL y cada entrada por el
+número de variantes.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+PREFIX = "chat:chip"
+STRIP_CHARS = " .,;:!?¡¿"
+# Cada cuánto (s) se vuelcan a la cache los contadores de aciertos y fallos del proceso
+STATS_FLUSH_INTERVAL = 10.0
+
+
+def normalize_message(message: str) -> str:
+    return " ".join((message or "").casefold().split()).strip(STRIP_CHARS)
+
+
+class ChipReplyCache:
+    """Respuestas cacheadas por (mensaje normalizado, versión del prompt)."""
+
+    def __init__(self, prompt_version: str, messages: Optional[Iterable[str]] = None, alias: str = "shared",
+                 ttl: Optional[int] = None, variants: Optional[int] = None, max_length: Optional[int] = None):
+        self.prompt_version = prompt_version
+        if messages is None:
+            messages = getattr(settings, "CHAT_CHIP_MESSAGES", ())
+        self.messages = frozenset(filter(None, map(normalize_message, messages)))
+        self.alias = alias
+        self.ttl = ttl if ttl is not None else getattr(settings, "CHAT_CHIP_CACHE_TTL", 86400)
+        self.variants = variants if variants is not None else getattr(settings, "CHAT_CHIP_CACHE_VARIANTS", 3)
+        self.max_length = (max_length if max_length is not None
+                           else getattr(settings, "CHAT_CHIP_CACHE_MAX_LENGTH", 120))
+        self._lock = threading.Lock()
+        self._turns: Counter = Counter()  # aciertos por clave en este proceso (rotación)
+        self._pending_stats: Counter = Counter()
+        self._stats_flushed_at = time.monotonic()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key_for(self, message: str) -> Optional[str]:
+        """Clave de `message`, o None si no es uno de los chips conocidos."""
+        normalized = normalize_message(message)
+        if normalized not in self.messages or len(normalized) > self.max_length:
+            return None
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+        return f"{PREFIX}:{self.prompt_version}:{digest}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._pending_stats[f"{PREFIX}:{self.prompt_version}:{name}"] += 1
+            due = time.monotonic() - self._stats_flushed_at >= STATS_FLUSH_INTERVAL
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self) -> None:
+        """Suma a la cache los contadores acumulados en el proceso."""
+        with self._lock:
+            pending, self._pending_stats = self._pending_stats, Counter()
+            self._stats_flushed_at = time.monotonic()
+        for key, delta in pending.items():
+            try:
+                self.cache.incr(key, delta)
+            except ValueError:
+                if not self.cache.add(key, delta, timeout=None):
+                    self.cache.incr(key, delta)
+
+    def get(self, message: str) -> Optional[str]:
+        """Devuelve una variante cacheada (rotando), o None si aún hay que llamar al modelo."""
+        key = self.key_for(message)
+        if key is None:
+            return None
+        replies = self.cache.get(key) or []
+        if len(replies) < self.variants:
+            self._count("misses")
+            return None
+        self._count("hits")
+        with self._lock:
+            n = self._turns[key]
+            self._turns[key] += 1
+        return replies[n % len(replies)]
+
+    def add(self, message: str, reply: str) -> None:
+        """Guarda una respuesta nueva del modelo hasta completar las variantes."""
+        key = self.key_for(message)
+        if key is None or not reply:
+            return
+        replies = self.cache.get(key) or []
+        if reply in replies or len(replies) >= self.variants:
+            return
+        self.cache.set(key, replies + [reply], timeout=self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        self.flush_stats()
+        prefix = f"{PREFIX}:{self.prompt_version}"
+        counters = self.cache.get_many([f"{prefix}:hits", f"{prefix}:misses"])
+        hits = counters.get(f"{prefix}:hits", 0)
+        misses = counters.get(f"{prefix}:misses", 0)
+        total = hits + misses
+        return {
+            "prompt_version": self.prompt_version,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
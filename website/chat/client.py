@@ -0,0 +1,95 @@
+"""
+Cliente de Gemini perezoso y compartido entre hilos.
+
+El SDK (`google.generativeai`) tarda en importarse y antes se configuraba al
+cargar `website.views`, es decir, en cada `manage.py` y en cada worker aunque
+solo sirviera páginas. `GeminiClientManager` difiere la importación hasta el
+primer chat, o hasta `warm_up()` si se llama desde el hook de gunicorn
+(ver gunicorn.conf.py), y guarda cuánto tardó.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiClientManager:
+    """Crea el `GenerativeModel` una sola vez, bajo demanda."""
+
+    def __init__(self, api_key: str, model_name: str, generation_config: Dict[str, Any]):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self._lock = threading.Lock()
+        self._model = None
+        self._loaded = False
+        self.import_seconds: Optional[float] = None
+        self.init_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def get_model(self):
+        """Devuelve el modelo (o None si falta la API key o falló la inicialización)."""
+        if self._loaded:
+            return self._model
+        if not self.configured:
+            return None
+        with self._lock:
+            if not self._loaded:
+                self._model = self._load()
+                self._loaded = True
+        return self._model
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            import google.generativeai as genai
+            from google.generativeai.types import HarmCategory, HarmBlockThreshold
+        except Exception as e:
+            self.error = f"{e}"
+            logger.exception("No se pudo importar el SDK de Gemini")
+            return None
+        self.import_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            genai.configure(api_key=self.api_key)
+
+            # Configuración de seguridad (permitir contenido moderado para conversaciones comerciales)
+            safety_settings = {
+                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            }
+            model = genai.GenerativeModel(
+                model_name=self.model_name,
+                generation_config=self.generation_config,
+                safety_settings=safety_settings,
+            )
+        except Exception as e:
+            self.error = f"{e}"
+            logger.exception("Error inicializando Gemini")
+            return None
+        self.init_seconds = time.perf_counter() - start
+        logger.info("Gemini listo: import %.3fs, init %.3fs", self.import_seconds, self.init_seconds)
+        return model
+
+    def warm_up(self) -> Dict[str, Any]:
+        """Carga el SDK y el modelo ya (p. ej. tras el fork del worker) y devuelve los tiempos."""
+        self.get_model()
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured,
+            "loaded": self._loaded and self._model is not None,
+            "import_seconds": self.import_seconds,
+            "init_seconds": self.init_seconds,
+            "error": self.error,
+        }
@@ -0,0 +1,80 @@
+"""
+Ventana de historial con presupuesto de tokens para las peticiones a Gemini.
+
+Los tokens se estiman sin llamar a la API (caracteres / CHARS_PER_TOKEN). Si el
+historial supera el presupuesto, se conservan los turnos más recientes y los
+antiguos se resumen en un único turno de usuario que incluye siempre los datos
+ya capturados en el lead (nombre, teléfono, proyecto) para que el asistente no
+los vuelva a pedir.
+"""
+import math
+from typing import Any, Dict, List, Optional
+
+# Aproximación conservadora para español con los tokenizadores de Gemini
+CHARS_PER_TOKEN = 3.5
+# Coste fijo por turno (rol, separadores)
+TURN_OVERHEAD_TOKENS = 4
+
+SUMMARY_ACK = "Entendido, sigo a partir de ahí sin volver a pedir esos datos."
+LEAD_LABELS = (("name", "nombre"), ("phone", "teléfono"), ("message", "proyecto"))
+SAID_PREFIX = " El cliente había comentado: "
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def turn_tokens(turn: Dict[str, Any]) -> int:
+    return TURN_OVERHEAD_TOKENS + sum(estimate_tokens(p.get("text", "")) for p in turn.get("parts", []))
+
+
+def _summary_text(dropped: List[Dict[str, Any]], lead: Optional[Dict[str, Any]], max_tokens: int) -> str:
+    facts = [f"{label}: {lead[key]}" for key, label in LEAD_LABELS if lead and lead.get(key)]
+    lines = [f"Resumen de los {len(dropped)} mensajes anteriores de la conversación."]
+    if facts:
+        lines.append("Datos ya confirmados del cliente (no los vuelvas a pedir): " + "; ".join(facts) + ".")
+    header = " ".join(lines)
+
+    # Lo que dijo el usuario, del más antiguo al más reciente, hasta llenar el hueco
+    # (descontando el coste fijo del turno y el propio resumen)
+    room = int((max_tokens - TURN_OVERHEAD_TOKENS) * CHARS_PER_TOKEN) - len(header) - len(SAID_PREFIX)
+    said = []
+    for turn in dropped:
+        if turn.get("role") != "user" or room <= 0:
+            continue
+        text = " ".join(p.get("text", "") for p in turn.get("parts", []))[:min(160, room)]
+        if text:
+            said.append(text)
+            room -= len(text) + 3
+    if said:
+        header += SAID_PREFIX + " | ".join(said)
+    return header
+
+
+def fit_history(contents: List[Dict[str, Any]], budget: int,
+                lead: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Recorta `contents` (formato del SDK) a `budget` tokens estimados.
+
+    Reserva una cuarta parte del presupuesto para el resumen de los turnos
+    descartados y mantiene la alternancia usuario/modelo que exige Gemini.
+    """
+    if budget <= 0 or not contents:
+        return contents
+    costs = [turn_tokens(t) for t in contents]
+    if sum(costs) <= budget:
+        return contents
+
+    summary_budget = max(budget // 4, 1)
+    room = budget - summary_budget
+    keep = len(contents)
+    used = 0
+    while keep > 0 and used + costs[keep - 1] <= room:
+        keep -= 1
+        used += costs[keep]
+
+    dropped, window = contents[:keep], contents[keep:]
+    summary = {"role": "user", "parts": [{"text": _summary_text(dropped, lead, summary_budget)}]}
+    if window and window[0].get("role") == "model":
+        return [summary] + window
+    return [summary, {"role": "model", "parts": [{"text": SUMMARY_ACK}]}] + window
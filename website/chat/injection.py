@@ -0,0 +1,184 @@
+"""
+Detector de prompt injection con las reglas compiladas una sola vez.
+
+Al cargar la lista, todas las reglas se unen en una sola alternancia compilada
+con IGNORECASE (el texto no se pasa antes a minúsculas), así que `match()`
+recorre el texto una sola vez sea cual sea el número de reglas.
+
+`re` prueba todas las ramas de la alternancia en cada posición del texto. Para
+que eso no cueste lo mismo que un bucle de búsquedas, la alternancia va detrás
+de un lookahead con los prefijos literales de las reglas ("ignore", "system"...)
+escritos como un trie: en casi todas las posiciones falla en una o dos
+comparaciones y las reglas solo se prueban donde empieza alguno de sus
+prefijos. Si alguna regla no tiene prefijo literal, el lookahead se omite.
+
+La regla que ha saltado se busca solo cuando hay coincidencia: la primera de la
+lista que coincide en ese mismo punto, que es la rama que ha elegido `re`. Con
+un grupo con nombre por regla bastaría `lastgroup`, pero `re` guarda y restaura
+las marcas de todos los grupos en cada rama que prueba y con cientos de reglas
+la búsqueda se vuelve varias veces más lenta.
+
+La lista de reglas se puede recargar en caliente con `reload()` o desde un
+fichero (un patrón por línea) que se vuelve a leer cuando cambia.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+FLAGS = re.IGNORECASE
+
+
+class InjectionMatch(NamedTuple):
+    """Regla que ha detectado el ataque."""
+    index: int
+    pattern: str
+    text: str
+
+
+class _CompiledRules(NamedTuple):
+    patterns: Tuple[str, ...]
+    regexes: Tuple[re.Pattern, ...]
+    combined: Optional[re.Pattern]  # alternancia de todas las reglas (None si no hay)
+    prefixes: Tuple[str, ...]  # prefijo literal de cada regla ("" si no tiene)
+
+    def rule_at(self, text: str, pos: int, indexes: Optional[Iterable[int]] = None) -> Optional[InjectionMatch]:
+        """
+        La rama de la alternancia que coincide en `pos`: la primera regla de la
+        lista (o de `indexes`, en orden) que encaja ahí.
+        """
+        for index in range(len(self.regexes)) if indexes is None else indexes:
+            m = self.regexes[index].match(text, pos)
+            if m:
+                return InjectionMatch(index, self.patterns[index], m.group(0))
+        return None
+
+
+def literal_prefix(pattern: str) -> str:
+    """Texto literal con el que empieza toda coincidencia de `pattern` ("" si no hay)."""
+    prefix = []
+    for op, av in sre_parse.parse(pattern, FLAGS):
+        if op is sre_parse.AT and not prefix:
+            continue  # \b, ^...: no consumen texto
+        if op is not sre_parse.LITERAL:
+            break
+        prefix.append(chr(av))
+    return "".join(prefix)
+
+
+def trie_regex(words: Iterable[str]) -> str:
+    """Expresión regular equivalente a la alternancia de `words`, en forma de trie."""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+def compile_rules(patterns: Tuple[str, ...]) -> _CompiledRules:
+    """Reglas compiladas una a una (el re.error señala la inválida) y su alternancia."""
+    regexes = tuple(re.compile(p, FLAGS) for p in patterns)
+    prefixes = tuple(literal_prefix(p) for p in patterns)
+    if not patterns:
+        return _CompiledRules(patterns, regexes, None, prefixes)
+    alternation = "|".join(f"(?:{p})" for p in patterns)
+    if all(prefixes):
+        alternation = f"(?={trie_regex(set(prefixes))})(?:{alternation})"
+    return _CompiledRules(patterns, regexes, re.compile(alternation, FLAGS), prefixes)
+
+
+class PromptInjectionDetector:
+    """
+    Detector de prompt injection con las reglas precompiladas.
+
+    `rules_file` es opcional: si existe, sus patrones sustituyen a los de
+    `patterns` y se recargan al cambiar la fecha de modificación (se comprueba
+    como mucho cada `check_interval` segundos).
+    """
+
+    def __init__(self, patterns: Iterable[str], rules_file: Optional[str] = None,
+                 check_interval: float = 5.0):
+        self.rules_file = rules_file
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._file_mtime = None
+        self._next_check = 0.0
+        self.reload(patterns)
+        if rules_file:
+            self._reload_from_file()
+
+    @property
+    def patterns(self) -> List[str]:
+        return list(self._rules.patterns)
+
+    def reload(self, patterns: Iterable[str]) -> None:
+        """Sustituye la lista de reglas (se compila antes de publicarla)."""
+        patterns = tuple(p for p in patterns if p)
+        self._rules = compile_rules(patterns)
+
+    def _reload_from_file(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.rules_file)
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        try:
+            with open(self.rules_file, encoding="utf-8") as fh:
+                patterns = [line.strip() for line in fh
+                            if line.strip() and not line.lstrip().startswith("#")]
+            self.reload(patterns)
+        except (OSError, re.error):
+            logger.exception("No se pudieron recargar las reglas de prompt injection")
+        self._file_mtime = mtime
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            self._reload_from_file()
+
+    def current_rules(self) -> _CompiledRules:
+        """Reglas compiladas vigentes (recargando el fichero si ha cambiado)."""
+        if self.rules_file:
+            self._maybe_reload()
+        return self._rules
+
+    def match(self, text: str, pos: int = 0) -> Optional[InjectionMatch]:
+        """
+        Regla de la primera coincidencia en `text` a partir de `pos` (si dos
+        empiezan en el mismo sitio, la que va antes en la lista), o None.
+        """
+        if not isinstance(text, str) or not text:
+            return None
+        rules = self.current_rules()
+        if rules.combined is None:
+            return None
+        m = rules.combined.search(text, pos)
+        return rules.rule_at(text, m.start()) if m else None
+
+    def is_attack(self, text: str) -> bool:
+        return self.match(text) is not None
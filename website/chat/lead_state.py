@@ -0,0 +1,40 @@
+"""
+Estado del lead firmado para el modo `history` del chat.
+
+En lugar de volver a parsear todos los turnos del asistente en cada petición,
+el servidor devuelve el lead agregado y el marcador de "ya enviado" como un
+token firmado (`lead_state`) que el cliente reenvía en el siguiente turno.
+El token guarda cuántos turnos del asistente resume: si no coincide con el
+historial recibido, se ignora y se recalcula desde cero.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core import signing
+
+SALT = "website.chat.lead_state"
+
+
+def count_assistant_turns(history: List[Dict[str, Any]]) -> int:
+    return sum(1 for turn in history or [] if turn.get("role") == "assistant")
+
+
+def dumps(lead: Dict[str, Any], sent: bool, assistant_turns: int) -> str:
+    return signing.dumps({"lead": lead, "sent": sent, "turns": assistant_turns},
+                         salt=SALT, compress=True)
+
+
+def loads(token: Any, history: List[Dict[str, Any]]) -> Optional[Tuple[Dict[str, Any], bool]]:
+    """Devuelve (lead, ya_enviado) si el token es válido para este historial."""
+    if not token or not isinstance(token, str):
+        return None
+    try:
+        state = signing.loads(token, salt=SALT, max_age=getattr(settings, "CHAT_STORE_TTL", 7200))
+    except signing.BadSignature:
+        return None
+    if not isinstance(state, dict) or state.get("turns") != count_assistant_turns(history):
+        return None
+    lead = state.get("lead")
+    if not isinstance(lead, dict):
+        return None
+    return lead, bool(state.get("sent"))
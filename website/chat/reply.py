@@ -0,0 +1,241 @@
+"""
+Post-proceso de la respuesta del modelo en una sola pasada.
+
+La vista necesitaba cinco recorridos de cada respuesta: la defensa de salida
+(SASQA si es un ataque), el lead del último bloque ```json lead```, quitar los
+bloques y las dos limpiezas de respaldo (```json...``` sin bloque válido y
+objetos sueltos con "name"). `ReplyScanner` recorre la respuesta una vez y
+clasifica cada coincidencia como:
+
+- ataque: empieza ahí una regla del detector de prompt injection,
+- bloque: un bloque del lead (`block_rx`),
+- resto: un ```json que no abre un bloque válido o un "name" fuera de los bloques.
+
+Las coincidencias se visitan en orden, también las de dentro de un bloque (ahí
+puede haber un ataque). Con ellas se quitan los bloques, se guarda el lead del
+último y se decide si hacen falta las limpiezas de respaldo: solo si ha
+aparecido algún resto o si al unir los trozos se forma un token. En ese caso se
+aplican las mismas sustituciones de siempre sobre el texto ya sin bloques, así
+que el resultado es idéntico al de la cadena anterior (ver website/tests.py).
+
+La pasada busca en `text.lower()`, sin IGNORECASE, un trie con los prefijos de
+las reglas, "```json" y "name": así `re` salta directamente a las posiciones
+que empiezan por alguna de sus letras iniciales, y cada regla se prueba solo
+donde aparece su prefijo. Si alguna regla no tiene un prefijo literal ASCII, o
+el texto lleva letras en las que str.lower() y re.IGNORECASE no coinciden (ı, ſ,
+İ), se recorre en su lugar con una alternancia con IGNORECASE de las mismas
+ramas, más lenta pero equivalente.
+"""
+import json
+import re
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .injection import InjectionMatch, PromptInjectionDetector, trie_regex
+
+FENCE = "```json"
+NAME_TOKEN = '"name"'
+# Ventana alrededor de cada unión: un token de 7 caracteres que la cruce cabe en ella
+JOIN_WINDOW = len(FENCE) - 1
+# Letras en las que str.lower() no equivale a re.IGNORECASE (o cambia la longitud)
+CASEFOLD_UNSAFE = ("ı", "ſ", "İ")
+
+# Limpiezas de respaldo: ```json...``` sin bloque válido y objetos sueltos con "name"
+FENCE_BLOCK_RX = re.compile(r"```json.*?```", re.DOTALL | re.IGNORECASE)
+NAME_OBJECT_RX = re.compile(r'\{[^}]*"name"[^}]*\}')
+# Mismas reglas de mayúsculas que las expresiones anteriores (p. ej. "ſ" ~ "s")
+FENCE_RX = re.compile(re.escape(FENCE), re.IGNORECASE)
+
+# Tipos de coincidencia de la pasada
+ATTACK, BLOCK, REST = "attack", "block", "rest"
+
+
+class ReplyScan(NamedTuple):
+    """Resultado del post-proceso de una respuesta."""
+    visible: str
+    lead: Dict[str, Any]
+    is_attack: bool
+    injection: Optional[InjectionMatch]
+
+
+def parse_lead_json(raw: str) -> Dict[str, Any]:
+    """JSON del bloque del lead, o {} si no es un objeto válido."""
+    try:
+        data = json.loads(raw)
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def cleanup_fallbacks(text: str) -> str:
+    text = FENCE_BLOCK_RX.sub("", text)
+    text = NAME_OBJECT_RX.sub("", text)
+    return text.strip()
+
+
+def casefold_safe(text: str) -> bool:
+    """True si buscar prefijos ASCII en `text.lower()` equivale a buscarlos con re.IGNORECASE."""
+    return not any(ch in text for ch in CASEFOLD_UNSAFE)
+
+
+def scoped(rx: re.Pattern) -> str:
+    """Patrón de `rx` con su IGNORECASE/DOTALL, para meterlo en otra expresión."""
+    on = "s" if rx.flags & re.DOTALL else ""
+    off = "" if rx.flags & re.IGNORECASE else "-i"
+    return f"(?{on}{off}:{rx.pattern})" if on or off else f"(?:{rx.pattern})"
+
+
+class _BlockMatch(NamedTuple):
+    """Lo que se usa de un bloque encontrado por la alternancia (como un re.Match de `block_rx`)."""
+    stop: int
+    lead: Optional[str]
+    generic: Optional[str]
+
+    def end(self) -> int:
+        return self.stop
+
+    def group(self, index: int) -> Optional[str]:
+        return self.lead if index == 1 else self.generic
+
+
+class _Tokens(NamedTuple):
+    """Expresiones de la pasada para unas reglas concretas del detector."""
+    rules: Any
+    # Trie sobre text.lower() y reglas a probar por palabra del trie (None si no se puede)
+    trie: Optional[re.Pattern]
+    by_word: Dict[str, Tuple[int, ...]]
+    # Alternancia con IGNORECASE (siempre disponible)
+    alternation: re.Pattern
+    block_group: int  # grupo `block`; los dos de `block_rx` van justo detrás
+
+
+class ReplyScanner:
+    """
+    Devuelve texto visible, lead y veredicto de seguridad de una respuesta.
+
+    `block_rx` es la expresión del bloque del lead (dos grupos: ```json lead``` y
+    ```json``` genérico); `attack_reply` sustituye a la respuesta si es un ataque.
+    """
+
+    def __init__(self, detector: PromptInjectionDetector, block_rx: re.Pattern, attack_reply: str):
+        self.detector = detector
+        self.block_rx = block_rx
+        self.attack_reply = attack_reply
+        self._tokens: Optional[_Tokens] = None
+        self._attack_result: Optional[ReplyScan] = None
+
+    def _compile(self, rules) -> _Tokens:
+        trie = None
+        by_word: Dict[str, Tuple[int, ...]] = {}
+        if rules is not None and all(p and p.isascii() for p in rules.prefixes):
+            prefixes = [p.lower() for p in rules.prefixes]
+            words = set(prefixes) | {FENCE, NAME_TOKEN}
+            # Una palabra del trie lleva a las reglas cuyo prefijo es ella o un prefijo suyo
+            by_word = {w: tuple(i for i, p in enumerate(prefixes) if w.startswith(p)) for w in words}
+            trie = re.compile(trie_regex(words))
+
+        branches = [
+            rf"(?=(?P<block>{scoped(self.block_rx)}))",
+            rf"(?=(?P<fence>{re.escape(FENCE)}))",
+            rf"(?=(?P<name>(?-i:{re.escape(NAME_TOKEN)})))",
+        ]
+        if rules is not None and rules.combined is not None:
+            branches.insert(0, f"(?P<attack>{scoped(rules.combined)})")
+        alternation = re.compile("|".join(branches), re.IGNORECASE)
+        return _Tokens(rules, trie, by_word, alternation, alternation.groupindex["block"])
+
+    def _tokens_for(self, rules) -> _Tokens:
+        """Expresiones para las reglas vigentes (se recompilan si el detector recarga)."""
+        tokens = self._tokens
+        if tokens is None or tokens.rules is not rules:
+            tokens = self._tokens = self._compile(rules)
+        return tokens
+
+    def scan(self, reply: str) -> ReplyScan:
+        text = reply or ""
+        rules = self.detector.current_rules()
+        result = self._build(text, self._tokens_for(rules))
+        if isinstance(result, ReplyScan):
+            return result
+        # Veredicto de seguridad sobre la respuesta completa (bloque incluido)
+        return self._attack_scan()._replace(injection=result)
+
+    def _attack_scan(self) -> ReplyScan:
+        if self._attack_result is None:
+            result = self._build(self.attack_reply, self._compile(None))
+            self._attack_result = result._replace(is_attack=True)
+        return self._attack_result
+
+    def _matches(self, text: str, tokens: _Tokens) -> Iterator[Tuple[str, int, Any]]:
+        """
+        (tipo, inicio, dato) de cada coincidencia, en orden: la InjectionMatch de un
+        ataque, la coincidencia de `block_rx` de un bloque y None en el resto.
+        """
+        rules = tokens.rules
+        if tokens.trie is not None and casefold_safe(text):
+            lowered = text.lower()
+            search = tokens.trie.search
+            m = search(lowered)
+            while m is not None:
+                word, pos = m.group(), m.start()
+                candidates = tokens.by_word[word]
+                injection = rules.rule_at(text, pos, candidates) if candidates else None
+                if injection is not None:
+                    yield ATTACK, pos, injection
+                    return
+                if word.startswith(FENCE):
+                    block = self.block_rx.match(text, pos)
+                    yield (BLOCK, pos, block) if block else (REST, pos, None)
+                elif word.startswith(NAME_TOKEN) and text.startswith(NAME_TOKEN, pos):
+                    yield REST, pos, None  # "name" distingue mayúsculas: se mira en el original
+                m = search(lowered, pos + 1)  # también las que empiezan dentro de esta
+            return
+
+        # Las ramas de bloque, ```json y "name" son lookaheads: se visitan todas las posiciones
+        group = tokens.block_group
+        for m in tokens.alternation.finditer(text):
+            kind, pos = m.lastgroup, m.start()
+            if kind == "attack":
+                yield ATTACK, pos, rules.rule_at(text, pos)
+                return
+            if kind == "block":
+                yield BLOCK, pos, _BlockMatch(m.end("block"), m.group(group + 1), m.group(group + 2))
+            else:
+                yield REST, pos, None
+
+    def _build(self, text: str, tokens: _Tokens):
+        """ReplyScan de `text`, o la InjectionMatch si es un ataque."""
+        pieces: List[str] = []
+        joins: List[int] = []
+        last_block = None
+        residual = False
+        cursor = 0  # fin del último bloque quitado
+        length = 0
+        for kind, pos, data in self._matches(text, tokens):
+            if kind == ATTACK:
+                return data
+            if pos < cursor:
+                continue  # dentro de un bloque ya quitado
+            if kind == BLOCK:
+                pieces.append(text[cursor:pos])
+                length += pos - cursor
+                joins.append(length)
+                cursor = data.end()
+                last_block = data
+            else:
+                residual = True
+        pieces.append(text[cursor:])
+        without_blocks = "".join(pieces)
+
+        if not residual:
+            for join in joins:
+                window = without_blocks[max(0, join - JOIN_WINDOW):join + JOIN_WINDOW]
+                if NAME_TOKEN in window or FENCE_RX.search(window):
+                    residual = True  # token formado al unir los trozos
+                    break
+
+        visible = without_blocks.strip()
+        if residual:
+            visible = cleanup_fallbacks(visible)
+        lead = parse_lead_json(last_block.group(1) or last_block.group(2)) if last_block is not None else {}
+        return ReplyScan(visible, lead, False, None)
+
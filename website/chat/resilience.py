@@ -0,0 +1,312 @@
+"""
+Capa de resiliencia para las llamadas a Gemini.
+
+- Límite de llamadas simultáneas por proceso, con tiempo máximo de espera en cola.
+- Circuit breaker: tras varios 429/timeouts seguidos se abre y las peticiones
+  reciben el fallback de rate limit al instante, sin esperar a una llamada
+  condenada; pasado `reset_timeout` deja pasar una llamada de prueba.
+- Reintentos con backoff exponencial y jitter para errores transitorios.
+- Plazo máximo por llamada. El SDK 0.3.x no acepta timeout, así que la llamada
+  síncrona se ejecuta en un pool del tamaño del límite de concurrencia y se deja
+  de esperar al vencer el plazo (el hueco se libera cuando termina de verdad).
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Categorías de error
+RATE_LIMIT = "rate_limit"
+TIMEOUT = "timeout"
+UNAVAILABLE = "unavailable"
+AUTH = "auth"
+BLOCKED = "blocked"
+OTHER = "other"
+
+# Errores que cuentan para abrir el circuito y que se reintentan
+TRIP_ERRORS = {RATE_LIMIT, TIMEOUT, UNAVAILABLE}
+RETRY_ERRORS = {RATE_LIMIT, UNAVAILABLE}
+
+
+class ResilienceError(Exception):
+    category = OTHER
+
+
+class CircuitOpenError(ResilienceError):
+    category = RATE_LIMIT
+
+
+class ConcurrencyLimitError(ResilienceError):
+    category = RATE_LIMIT
+
+
+class CallTimeoutError(ResilienceError):
+    category = TIMEOUT
+
+
+def classify_error(e: BaseException) -> str:
+    """Clasifica un error del SDK por su tipo (y, si no se reconoce, por el mensaje)."""
+    if isinstance(e, ResilienceError):
+        return e.category
+    if isinstance(e, (TimeoutError, FutureTimeout, asyncio.TimeoutError)):
+        return TIMEOUT
+    try:
+        from google.api_core import exceptions as gexc
+    except ImportError:  # pragma: no cover
+        gexc = None
+    if gexc is not None:
+        if isinstance(e, (gexc.TooManyRequests, gexc.ResourceExhausted)):
+            return RATE_LIMIT
+        if isinstance(e, (gexc.DeadlineExceeded, gexc.GatewayTimeout)):
+            return TIMEOUT
+        if isinstance(e, (gexc.ServiceUnavailable, gexc.InternalServerError, gexc.BadGateway)):
+            return UNAVAILABLE
+        if isinstance(e, (gexc.Unauthenticated, gexc.PermissionDenied)):
+            return AUTH
+    if type(e).__name__ in ("BlockedPromptException", "StopCandidateException"):
+        return BLOCKED
+
+    error_msg = str(e).lower()
+    if "quota" in error_msg or "429" in error_msg or "rate limit" in error_msg:
+        return RATE_LIMIT
+    if "api" in error_msg and "key" in error_msg:
+        return AUTH
+    if "safety" in error_msg or "blocked" in error_msg:
+        return BLOCKED
+    return OTHER
+
+
+class CircuitBreaker:
+    """Circuit breaker por proceso: closed -> open -> half-open -> closed."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Devuelve el turno de la llamada de prueba si terminó sin resultado (sin hueco, cancelada...)."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Circuito de Gemini abierto tras %s fallos", self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class ResilientCaller:
+    """Envuelve las llamadas al modelo con límite de concurrencia, breaker, reintentos y plazo."""
+
+    def __init__(self, max_concurrency: int = 8, queue_timeout: float = 2.0, deadline: float = 25.0,
+                 max_attempts: int = 2, backoff_base: float = 0.5, backoff_max: float = 4.0,
+                 breaker: CircuitBreaker = None):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": aleatorio entre 0 y base * 2^intento, con tope
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _reject(self, error: ResilienceError) -> None:
+        with self._lock:
+            self.rejected += 1
+        raise error
+
+    @contextmanager
+    def _admitted(self):
+        """
+        Permiso del breaker para un intento. Si el intento es la llamada de prueba y
+        acaba sin registrar resultado (sin hueco de concurrencia, stream cerrado por
+        el cliente, tarea cancelada...), se devuelve el turno; si no, el circuito se
+        quedaría medio abierto para siempre.
+        """
+        if not self.breaker.allow():
+            self._reject(CircuitOpenError("Circuito de Gemini abierto"))
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            yield
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()
+            raise
+
+    def _acquire_slot(self) -> None:
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._reject(ConcurrencyLimitError("Demasiadas llamadas simultáneas a Gemini"))
+
+    async def _acquire_slot_async(self) -> None:
+        queue_until = time.monotonic() + self.queue_timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= queue_until:
+                self._reject(ConcurrencyLimitError("Demasiadas llamadas simultáneas a Gemini"))
+            await asyncio.sleep(0.02)
+
+    def _record(self, error: BaseException = None) -> None:
+        if error is None:
+            self.breaker.record_success()
+        elif classify_error(error) in TRIP_ERRORS:
+            self.breaker.record_failure()
+        else:
+            # El servicio ha respondido (p. ej. contenido bloqueado): está sano
+            self.breaker.record_success()
+
+    def _should_retry(self, error: BaseException, attempt: int, ends_at: float, delay: float) -> bool:
+        return (attempt + 1 < self.max_attempts
+                and classify_error(error) in RETRY_ERRORS
+                and time.monotonic() + delay < ends_at
+                and self.breaker.state == CircuitBreaker.CLOSED)
+
+    def _run_with_slot(self, fn: Callable, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._slots.release()
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Ejecuta `fn` (síncrona) con todas las protecciones."""
+        ends_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with self._admitted():
+                self._acquire_slot()
+                future = self._pool.submit(self._run_with_slot, fn, args, kwargs)
+                try:
+                    result = future.result(timeout=max(0.0, ends_at - time.monotonic()))
+                except FutureTimeout:
+                    error = CallTimeoutError(f"Gemini no respondió en {self.deadline:.0f}s")
+                    self._record(error)
+                    raise error
+                except Exception as e:
+                    self._record(e)
+                    delay = self._backoff(attempt)
+                    if not self._should_retry(e, attempt, ends_at, delay):
+                        raise
+                else:
+                    self._record()
+                    return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, fn: Callable, *args, **kwargs) -> Any:
+        """Como `call`, para corrutinas (`send_message_async`)."""
+        ends_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with self._admitted():
+                await self._acquire_slot_async()
+                try:
+                    result = await asyncio.wait_for(fn(*args, **kwargs),
+                                                    timeout=max(0.0, ends_at - time.monotonic()))
+                except asyncio.TimeoutError:
+                    error = CallTimeoutError(f"Gemini no respondió en {self.deadline:.0f}s")
+                    self._record(error)
+                    raise error
+                except Exception as e:
+                    self._record(e)
+                    delay = self._backoff(attempt)
+                    if not self._should_retry(e, attempt, ends_at, delay):
+                        raise
+                else:
+                    self._record()
+                    return result
+                finally:
+                    self._slots.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @contextmanager
+    def guard(self):
+        """
+        Protección para respuestas en streaming: breaker y hueco de concurrencia
+        durante todo el stream. No hay reintentos (ya se ha enviado texto).
+
+        Devuelve `within_deadline(fn, *args, **kwargs)`: cada paso del stream (la
+        llamada que lo abre y la lectura de cada trozo) se ejecuta en el pool y se
+        deja de esperar al vencer el plazo de la llamada completa, aunque el
+        modelo se quede callado a mitad de un trozo. Si una lectura se queda
+        colgada, el hueco se libera cuando termina de verdad (como en `call`).
+        """
+        with self._admitted():
+            self._acquire_slot()
+            ends_at = time.monotonic() + self.deadline
+            stuck = []
+
+            def within_deadline(fn: Callable, *args, **kwargs):
+                future = self._pool.submit(fn, *args, **kwargs)
+                try:
+                    return future.result(timeout=max(0.0, ends_at - time.monotonic()))
+                except FutureTimeout:
+                    if future.done():
+                        raise  # el TimeoutError es de `fn`, no del plazo
+                    stuck.append(future)
+                    raise CallTimeoutError(f"Gemini no terminó en {self.deadline:.0f}s") from None
+
+            try:
+                yield within_deadline
+            except Exception as e:
+                self._record(e)
+                raise
+            else:
+                self._record()
+            finally:
+                if stuck:
+                    stuck[0].add_done_callback(lambda future: self._slots.release())
+                else:
+                    self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.state,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+        }
@@ -0,0 +1,112 @@
+"""
+Almacén de conversaciones del chat en servidor.
+
+El cliente solo envía el mensaje nuevo y un ``conversation_id``; los turnos
+normalizados, el lead agregado y el estado de "lead ya enviado" viven aquí.
+Se guarda en la base de datos para que todos los workers de gunicorn vean el
+mismo estado (la LocMemCache es por proceso). El almacén está acotado:
+las conversaciones inactivas más de ``CHAT_STORE_TTL`` segundos caducan y,
+si se supera ``CHAT_STORE_MAX_CONVERSATIONS``, se eliminan las usadas hace
+más tiempo (LRU por ``updated_at``). La limpieza no se hace en cada petición:
+solo en una de cada 1/``CHAT_STORE_EVICT_PROBABILITY`` conversaciones nuevas.
+
+Cada intercambio se añade con la fila bloqueada (``select_for_update``) sobre
+los turnos que hay en la BD en ese momento, no sobre los que se leyeron al
+empezar la petición: dos mensajes a la vez en la misma conversación no se pisan.
+"""
+import random
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from website.models import ChatConversation
+
+
+def empty_lead() -> Dict[str, Any]:
+    return {
+        "name": "", "phone": "", "message": "", "contact_preference": "phone",
+        "missing": ["name", "phone", "message"],
+    }
+
+
+class ConversationStore:
+    """Almacén acotado (LRU + TTL) de conversaciones compartido entre workers."""
+
+    def __init__(self, ttl: Optional[int] = None, max_conversations: Optional[int] = None,
+                 max_turns: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else getattr(settings, "CHAT_STORE_TTL", 7200)
+        self.max_conversations = (max_conversations if max_conversations is not None
+                                  else getattr(settings, "CHAT_STORE_MAX_CONVERSATIONS", 5000))
+        self.max_turns = (max_turns if max_turns is not None
+                          else getattr(settings, "CHAT_STORE_MAX_TURNS", 40))
+        self.evict_probability = getattr(settings, "CHAT_STORE_EVICT_PROBABILITY", 0.01)
+
+    def _expiry_cutoff(self):
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+    @staticmethod
+    def _normalize_id(conversation_id: Any) -> str:
+        try:
+            return uuid.UUID(str(conversation_id)).hex
+        except (ValueError, TypeError, AttributeError):
+            return ""
+
+    def get(self, conversation_id: Any) -> Optional[ChatConversation]:
+        """Devuelve la conversación si existe y no ha caducado."""
+        cid = self._normalize_id(conversation_id)
+        if not cid:
+            return None
+        return (ChatConversation.objects
+                .filter(conversation_id=cid, updated_at__gte=self._expiry_cutoff())
+                .first())
+
+    def create(self) -> ChatConversation:
+        conversation = ChatConversation.objects.create(
+            conversation_id=uuid.uuid4().hex, turns=[], lead=empty_lead(),
+        )
+        if random.random() < self.evict_probability:
+            self.evict()
+        return conversation
+
+    def get_or_create(self, conversation_id: Any) -> ChatConversation:
+        return self.get(conversation_id) or self.create()
+
+    def append(self, conversation: ChatConversation, user_text: str, assistant_text: str,
+               lead: Optional[Dict[str, Any]] = None, lead_sent: Optional[bool] = None) -> None:
+        """
+        Añade un intercambio usuario/asistente y actualiza el lead y el marcador de envío.
+        `conversation` se actualiza con lo que queda guardado.
+        """
+        with transaction.atomic():
+            current = (ChatConversation.objects.select_for_update()
+                       .only("turns", "lead", "lead_sent").get(pk=conversation.pk))
+            turns = list(current.turns or [])
+            if user_text:
+                turns.append({"role": "user", "content": user_text})
+            if assistant_text:
+                turns.append({"role": "assistant", "content": assistant_text})
+            current.turns = turns[-self.max_turns:]
+            if lead is not None:
+                current.lead = lead
+            if lead_sent is not None:
+                current.lead_sent = lead_sent
+            current.save(update_fields=["turns", "lead", "lead_sent", "updated_at"])
+        conversation.turns = current.turns
+        conversation.lead = current.lead
+        conversation.lead_sent = current.lead_sent
+        conversation.updated_at = current.updated_at
+
+    def evict(self) -> int:
+        """Elimina conversaciones caducadas y las menos recientes por encima del límite."""
+        deleted, _ = ChatConversation.objects.filter(updated_at__lt=self._expiry_cutoff()).delete()
+        overflow = ChatConversation.objects.count() - self.max_conversations
+        if overflow > 0:
+            oldest = (ChatConversation.objects.order_by("updated_at")
+                      .values_list("pk", flat=True)[:overflow])
+            extra, _ = ChatConversation.objects.filter(pk__in=list(oldest)).delete()
+            deleted += extra
+        return deleted
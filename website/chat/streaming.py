@@ -0,0 +1,67 @@
+"""
+Utilidades para la variante en streaming del chat.
+"""
+from typing import Optional
+
+from .injection import InjectionMatch, PromptInjectionDetector
+
+
+class LeadBlockFilter:
+    """
+    Filtra los trozos de texto que llegan del modelo en streaming.
+
+    Deja pasar el texto visible y retiene todo lo que va desde el inicio del
+    bloque ```json lead``` (o de un JSON suelto) hasta el final, que se procesa
+    una sola vez cuando termina la generación. Las comillas invertidas del final
+    de un trozo se guardan hasta saber si abren un bloque de código.
+
+    Con `detector`, además, es la defensa de salida del stream: cada trozo se
+    comprueba contra las reglas de prompt injection al llegar y los últimos
+    `holdback` caracteres (por defecto, la longitud de la regla más larga) no se
+    dejan pasar hasta que llega el siguiente, porque una regla que empieza en
+    ellos podría completarse con él. Si una regla coincide, `attack` guarda la
+    coincidencia y no sale nada más.
+    """
+
+    HOLD_MARKERS = ("```", "{")
+
+    def __init__(self, detector: Optional[PromptInjectionDetector] = None, holdback: Optional[int] = None):
+        self.detector = detector
+        if holdback is None:
+            holdback = max(map(len, detector.patterns), default=0) if detector is not None else 0
+        self.holdback = holdback
+        self.attack: Optional[InjectionMatch] = None
+        self._text = ""
+        self._sent = 0      # caracteres de `_text` ya entregados
+        self._checked = 0   # caracteres de `_text` ya revisados por el detector
+        self._stop = None   # inicio del bloque retenido
+
+    def feed(self, text: str) -> str:
+        """Devuelve la parte de `text` (o de lo retenido antes) que ya se puede mostrar al usuario."""
+        if self.attack is not None or not text:
+            return ""
+        start = max(0, len(self._text) - max(map(len, self.HOLD_MARKERS)) + 1)
+        self._text += text
+
+        if self.detector is not None:
+            # Desde `holdback` caracteres antes: una regla puede empezar en lo ya revisado
+            self.attack = self.detector.match(self._text, max(0, self._checked - self.holdback))
+            self._checked = len(self._text)
+            if self.attack is not None:
+                return ""
+
+        if self._stop is None:
+            cuts = [i for i in (self._text.find(marker, start) for marker in self.HOLD_MARKERS) if i != -1]
+            if cuts:
+                self._stop = min(cuts)
+        if self._stop is not None:
+            end = self._stop
+        else:
+            end = len(self._text.rstrip("`"))
+        end = min(end, len(self._text) - self.holdback)
+
+        if end <= self._sent:
+            return ""
+        out = self._text[self._sent:end]
+        self._sent = end
+        return out
@@ -0,0 +1,213 @@
+"""
+Backend de LLM local para pruebas de carga y benchmarks sin la API real.
+
+Imita la interfaz del SDK de Gemini que usan las vistas (`start_chat`,
+`send_message`, `send_message_async`, `stream=True`). Las respuestas son
+deterministas (dependen solo de la conversación): siguen el flujo del asistente
+(nombre -> proyecto -> teléfono) y terminan siempre con un bloque ```json lead```
+válido, así que el pipeline completo (extracción del lead, email, caché de chips)
+se ejercita igual que en producción.
+
+La latencia sigue una distribución configurable (fixed, uniform, normal,
+lognormal, exponential) y una fracción de las llamadas puede fallar con los
+mismos errores que el SDK (429 / 503). Latencias y errores salen de un
+generador con semilla fija, de modo que las ejecuciones son reproducibles.
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+ERROR_KINDS = ("rate_limit", "unavailable")
+
+# Los turnos más largos son prompts del sistema o resúmenes, no mensajes del cliente
+MAX_USER_TURN_CHARS = 400
+CHUNK_CHARS = 24
+
+NAME_RX = re.compile(r"\b(?:me llamo|mi nombre es|soy)\s+([A-ZÁÉÍÓÚÑ][\wáéíóúñü]+)", re.I)
+PHONE_RX = re.compile(r"(?:\+?\d[\s-]?){9,13}")
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class LatencyModel:
+    """Muestrea latencias (s) de la distribución indicada con media `mean` y dispersión `jitter`."""
+
+    def __init__(self, distribution: str = "fixed", mean: float = 0.8, jitter: float = 0.0,
+                 rng: Optional[random.Random] = None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Distribución de latencia desconocida: {distribution}")
+        self.distribution = distribution
+        self.mean = max(0.0, mean)
+        self.jitter = max(0.0, jitter)
+        self.rng = rng or random.Random()
+
+    def sample(self) -> float:
+        mean, jitter, rng = self.mean, self.jitter, self.rng
+        if self.distribution == "fixed" or mean == 0:
+            value = mean
+        elif self.distribution == "uniform":
+            value = rng.uniform(mean - jitter, mean + jitter)
+        elif self.distribution == "normal":
+            value = rng.gauss(mean, jitter)
+        elif self.distribution == "lognormal":
+            # Parámetros para que la media y la desviación sean `mean` y `jitter`
+            sigma2 = math.log(1 + (jitter / mean) ** 2)
+            value = rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+        else:
+            value = rng.expovariate(1 / mean)
+        return max(0.0, value)
+
+
+def _sdk_error(kind: str) -> Exception:
+    """Error con el mismo tipo que lanzaría el SDK (o uno equivalente si no está instalado)."""
+    try:
+        from google.api_core import exceptions as gexc
+    except ImportError:  # pragma: no cover
+        gexc = None
+    if kind == "rate_limit":
+        return gexc.ResourceExhausted("Quota exceeded (stub)") if gexc else RuntimeError("429 Quota exceeded (stub)")
+    return gexc.ServiceUnavailable("Service unavailable (stub)") if gexc else RuntimeError("503 Service unavailable (stub)")
+
+
+def _user_texts(history: List[Dict[str, Any]], content: str) -> List[str]:
+    texts = []
+    for turn in history or []:
+        if turn.get("role") != "user":
+            continue
+        text = " ".join(p.get("text", "") for p in turn.get("parts", []))
+        if text and len(text) <= MAX_USER_TURN_CHARS:
+            texts.append(text)
+    texts.append(content or "")
+    return texts
+
+
+def stub_lead(history: List[Dict[str, Any]], content: str) -> Dict[str, Any]:
+    """Lead que "entendería" el modelo a partir de los mensajes del cliente."""
+    lead = {"name": "", "phone": "", "message": "", "contact_preference": "phone", "missing": []}
+    for text in _user_texts(history, content):
+        name = NAME_RX.search(text)
+        phone = PHONE_RX.search(text)
+        if name and not lead["name"]:
+            lead["name"] = name.group(1).capitalize()
+        if phone and not lead["phone"]:
+            lead["phone"] = re.sub(r"[\s-]", "", phone.group(0))
+        if not name and not phone and not lead["message"] and len(text.split()) >= 4:
+            lead["message"] = text.strip()
+    lead["missing"] = [k for k in ("name", "phone", "message") if not lead[k]]
+    return lead
+
+
+def stub_reply(history: List[Dict[str, Any]], content: str) -> str:
+    """Respuesta determinista con el bloque ```json lead``` al final."""
+    lead = stub_lead(history, content)
+    name = lead["name"]
+    if "name" in lead["missing"]:
+        text = "¡Genial! Te ayudo a darle forma. ¿Cómo te llamas?"
+    elif "message" in lead["missing"]:
+        text = f"¡Genial, {name}! Cuéntame un poco más sobre tu proyecto."
+    elif "phone" in lead["missing"]:
+        text = f"Suena muy interesante, {name}. ¿Cuál es tu número de teléfono para que Héctor pueda llamarte?"
+    else:
+        text = f"Perfecto, {name}. Héctor te llamará para explorar tu proyecto. ¡Gracias! 📞"
+    return f"{text}\n\n```json lead\n{json.dumps(lead, ensure_ascii=False, indent=2)}\n```"
+
+
+class StubChat:
+    def __init__(self, client: "StubClient", history: Optional[List[Dict[str, Any]]]):
+        self.client = client
+        self.history = list(history or [])
+
+    def _reply(self, content: str) -> str:
+        text = stub_reply(self.history, content)
+        self.history.append({"role": "user", "parts": [{"text": content}]})
+        self.history.append({"role": "model", "parts": [{"text": text}]})
+        return text
+
+    def send_message(self, content: str, stream: bool = False, **kwargs):
+        delay, error = self.client.next_call()
+        if stream:
+            return self._stream(content, delay, error)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return StubResponse(self._reply(content))
+
+    def _stream(self, content: str, delay: float, error: Optional[Exception]) -> Iterator[StubResponse]:
+        time.sleep(delay)  # tiempo hasta el primer trozo
+        if error is not None:
+            raise error
+        text = self._reply(content)
+        for i in range(0, len(text), CHUNK_CHARS):
+            if i:
+                time.sleep(self.client.chunk_delay)
+            yield StubResponse(text[i:i + CHUNK_CHARS])
+
+    async def send_message_async(self, content: str, **kwargs):
+        delay, error = self.client.next_call()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return StubResponse(self._reply(content))
+
+
+class StubModel:
+    def __init__(self, client: "StubClient"):
+        self.client = client
+
+    def start_chat(self, history=None):
+        return StubChat(self.client, history)
+
+
+class StubClient:
+    """Misma interfaz que `GeminiClientManager`, sin red ni SDK."""
+
+    model_name = "stub"
+    configured = True
+
+    def __init__(self, distribution: str = "fixed", mean: float = 0.8, jitter: float = 0.0,
+                 chunk_delay: float = 0.05, error_rate: float = 0.0, seed: int = 42):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.latency = LatencyModel(distribution, mean, jitter, self._rng)
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self._model = StubModel(self)
+        self.calls = 0
+        self.errors = 0
+
+    def next_call(self):
+        """Latencia y error (o None) de la siguiente llamada."""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency.sample()
+            error = None
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.errors += 1
+                error = _sdk_error(self._rng.choice(ERROR_KINDS))
+        return delay, error
+
+    def get_model(self):
+        return self._model
+
+    def warm_up(self) -> Dict[str, Any]:
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": True,
+            "loaded": True,
+            "import_seconds": 0.0,
+            "init_seconds": 0.0,
+            "error": None,
+            "calls": self.calls,
+            "errors": self.errors,
+        }
@@ -0,0 +1,94 @@
+"""
+Normalización del texto de usuario y de los turnos del historial.
+
+Antes eran dos `re.sub` por turno, y en cada petición se volvía a limpiar el
+historial completo que reenvía el cliente. Ahora:
+
+- los caracteres no permitidos se quitan con `str.translate` y una tabla que
+  se rellena la primera vez que aparece cada carácter,
+- los espacios se colapsan con `split()` + `join()` (mismo criterio que `\\s`),
+- el resultado se memoriza por contenido en una LRU pequeña, así que un turno
+  que ya se limpió en una petición anterior cuesta una búsqueda en un dict. Los
+  textos cortos son su propia clave (el hash de str ya es del contenido); los
+  largos se resumen con blake2b para que la memoria no dependa de lo que envíe
+  el cliente.
+
+El resultado es idéntico al de las expresiones regulares anteriores.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+# Además de letras, dígitos, "_" y espacios (\w y \s de re)
+ALLOWED_PUNCTUATION = ".,!?¿¡áéíóúñüÁÉÍÓÚÑÜ()@/:-"
+MAX_LENGTH = 2000  # margen generoso
+# Entradas de la tabla de traducción (caracteres distintos vistos) que se memorizan
+MAX_TABLE_SIZE = 65536
+# Textos más largos se guardan por su digest y no por el texto completo
+MAX_KEY_LENGTH = 1024
+
+
+class _DropTable(dict):
+    """Tabla para str.translate: None para los caracteres que se eliminan."""
+
+    def __missing__(self, code: int) -> Optional[int]:
+        ch = chr(code)
+        keep = ch.isalnum() or ch == "_" or ch.isspace() or ch in ALLOWED_PUNCTUATION
+        value = code if keep else None
+        if len(self) < MAX_TABLE_SIZE:
+            self[code] = value
+        return value
+
+
+DROP_TABLE = _DropTable()
+
+
+def normalize_text(text: str, max_length: int = MAX_LENGTH) -> str:
+    """Quita caracteres no permitidos, colapsa espacios y recorta a `max_length`."""
+    if not text:
+        return ""
+    return " ".join(text.translate(DROP_TABLE).split())[:max_length]
+
+
+class TextNormalizer:
+    """`normalize_text` con memoria LRU por hash del contenido."""
+
+    def __init__(self, cache_size: int = 2048, max_length: int = MAX_LENGTH):
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self._cache: "OrderedDict[Union[str, bytes], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clean(self, text: str) -> str:
+        if not text:
+            return ""
+        if not self.cache_size:
+            return normalize_text(text, self.max_length)
+        key = text
+        if len(text) > MAX_KEY_LENGTH:
+            key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with self._lock:
+            cleaned = self._cache.get(key)
+            if cleaned is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cleaned
+        cleaned = normalize_text(text, self.max_length)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = cleaned
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return cleaned
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,200 @@
+"""
+Registro de leads (chat y formulario) en base de datos.
+
+Guardar el lead no debe retrasar la respuesta: `record_lead()` solo construye
+el objeto y lo deja en un buffer en memoria. Un hilo en segundo plano lo vuelca
+con un único `bulk_create` cuando se llenan `LEAD_BUFFER_SIZE` leads o pasan
+`LEAD_BUFFER_MAX_AGE` segundos desde el primero pendiente. Si el lote falla se
+guarda lead a lead: uno con datos inválidos no arrastra al resto y, si la BD no
+responde, los leads vuelven al buffer para el siguiente lote (hasta
+`LEAD_BUFFER_MAX_RETRIES` veces). Al parar el proceso (atexit y el hook
+`worker_exit` de gunicorn) se vuelca lo que quede y lo que no se pueda guardar
+queda completo en el log. El email del lead va por el outbox, así que un lead
+nunca depende solo del buffer.
+
+La transcripción se guarda como JSON comprimido con zlib y el teléfono también
+normalizado (solo dígitos, con prefijo de país) para buscar por él con índice.
+"""
+import atexit
+import json
+import logging
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Lead
+
+logger = logging.getLogger(__name__)
+
+NON_DIGITS_RX = re.compile(r"\D+")
+DEFAULT_COUNTRY_CODE = "34"  # números nacionales de 9 cifras
+
+
+def normalize_phone(phone: str) -> str:
+    """'+34 612 34 56 78', '0034612345678' y '612-345-678' -> '34612345678'."""
+    digits = NON_DIGITS_RX.sub("", phone or "")
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if len(digits) == 9:
+        digits = DEFAULT_COUNTRY_CODE + digits
+    return digits[:20]
+
+
+def compress_transcript(turns: List[Dict[str, Any]]) -> bytes:
+    if not turns:
+        return b""
+    compact = [{"role": t.get("role"), "content": t.get("content") or ""} for t in turns]
+    return zlib.compress(json.dumps(compact, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decompress_transcript(data: Optional[bytes]) -> List[Dict[str, Any]]:
+    if not data:
+        return []
+    return json.loads(zlib.decompress(bytes(data)).decode("utf-8"))
+
+
+class LeadBuffer:
+    """Acumula leads en memoria y los escribe en lotes desde un hilo propio."""
+
+    def __init__(self, size: Optional[int] = None, max_age: Optional[float] = None,
+                 max_retries: Optional[int] = None):
+        self.size = size if size is not None else getattr(settings, "LEAD_BUFFER_SIZE", 50)
+        self.max_age = max_age if max_age is not None else getattr(settings, "LEAD_BUFFER_MAX_AGE", 2.0)
+        self.max_retries = (max_retries if max_retries is not None
+                            else getattr(settings, "LEAD_BUFFER_MAX_RETRIES", 5))
+        self._pending: List[Lead] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.failed = 0
+
+    def add(self, lead: Lead) -> None:
+        with self._cond:
+            self._pending.append(lead)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="lead-buffer", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.size:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                # Espera a que haya algo, y luego a que se llene o caduque el lote
+                while not self._pending:
+                    self._cond.wait()
+                if len(self._pending) < self.size:
+                    self._cond.wait(timeout=self.max_age)
+            try:
+                self.flush()
+            finally:
+                # El hilo tiene su propia conexión a la BD: no dejarla abierta entre lotes
+                connection.close()
+
+    def flush(self) -> int:
+        """
+        Escribe lo pendiente con un único bulk_create (lead a lead si el lote falla).
+        Devuelve cuántos leads escribió.
+        """
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            # En su propia transacción: si falla, se deshace entero y se reintenta lead a lead
+            with transaction.atomic():
+                Lead.objects.bulk_create(batch, batch_size=500)
+            written = len(batch)
+        except Exception:
+            logger.warning("No se pudo guardar el lote de %s leads; se guardan uno a uno", len(batch), exc_info=True)
+            written = self._save_one_by_one(batch)
+        self.written += written
+        return written
+
+    def _save_one_by_one(self, batch: List[Lead]) -> int:
+        written = 0
+        for index, lead in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    lead.save(force_insert=True)
+            except (IntegrityError, DataError):
+                # Este lead no se va a poder guardar nunca
+                self._discard(lead, exc_info=True)
+            except Exception:
+                # La BD no está disponible: ni se intenta el resto, todo vuelve al buffer
+                logger.warning("BD no disponible; %s leads vuelven al buffer", len(batch) - index, exc_info=True)
+                self._requeue(batch[index:])
+                break
+            else:
+                written += 1
+        return written
+
+    def _requeue(self, leads: List[Lead]) -> None:
+        keep = []
+        for lead in leads:
+            lead._buffer_attempts = getattr(lead, "_buffer_attempts", 0) + 1
+            if lead._buffer_attempts > self.max_retries:
+                self._discard(lead)
+            else:
+                keep.append(lead)
+        with self._cond:
+            self._pending[:0] = keep
+
+    def _discard(self, lead: Lead, exc_info: bool = False) -> None:
+        """Cuenta el lead como perdido y lo deja completo en el log para poder recuperarlo."""
+        self.failed += 1
+        logger.error("Lead no guardado: %s", json.dumps({
+            "source": lead.source, "name": lead.name, "phone": lead.phone, "company": lead.company,
+            "sector": lead.sector, "message": lead.message, "conversation_id": lead.conversation_id,
+            "created_at": lead.created_at.isoformat() if lead.created_at else None,
+        }, ensure_ascii=False), exc_info=exc_info)
+
+    def close(self) -> int:
+        """Último volcado al parar el proceso: lo que no se pueda guardar ya, al log."""
+        written = self.flush()
+        with self._cond:
+            leftover, self._pending = self._pending, []
+        for lead in leftover:
+            self._discard(lead)
+        return written
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._pending), "written": self.written, "failed": self.failed}
+
+
+lead_buffer = LeadBuffer()
+atexit.register(lead_buffer.close)
+
+
+def build_lead(source: str, name: str, phone: str, message: str = "", company: str = "",
+               sector: str = "", conversation_id: str = "",
+               transcript: Optional[List[Dict[str, Any]]] = None, priority: str = "") -> Lead:
+    """Lead listo para bulk_create (recorta los campos a su longitud, sin tocar la BD)."""
+    return Lead(
+        source=source,
+        name=(name or "")[:150],
+        phone=(phone or "")[:40],
+        phone_normalized=normalize_phone(phone),
+        company=(company or "")[:150],
+        sector=(sector or "")[:150],
+        message=message or "",
+        conversation_id=conversation_id or "",
+        transcript_z=compress_transcript(transcript or []),
+        priority=priority or "",
+        created_at=timezone.now(),
+    )
+
+
+def record_lead(source: str, name: str, phone: str, message: str = "", company: str = "",
+                sector: str = "", conversation_id: str = "",
+                transcript: Optional[List[Dict[str, Any]]] = None) -> Lead:
+    """Prepara el lead (sin tocar la BD) y lo deja en el buffer."""
+    lead = build_lead(source, name, phone, message=message, company=company, sector=sector,
+                      conversation_id=conversation_id, transcript=transcript)
+    lead_buffer.add(lead)
+    return lead
@@ -0,0 +1,121 @@
+"""
+Micro-benchmark del despacho de APIProxyMiddleware.
+
+Compara, con una vista trivial para que solo cuente el despacho:
+
+- la versión anterior (re.match sin compilar, import_module e instancia de la
+  vista en cada petición),
+- la tabla resuelta al arrancar (prefijo + regex compilada + callable as_view()),
+- el enrutado normal de Django (resolve() de una ruta de la API + la vista).
+
+También mide lo que cuesta al middleware una petición que no es del proxy.
+"""
+import importlib
+import re
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+from django.views import View
+
+from miweb.security.api_proxy import APIProxyMiddleware, EndpointRegistry, build_table
+
+LEGACY_PATTERN = r'^/api/v1/(?P<hash_id>[a-f0-9]{32})/(?P<action>[a-zA-Z0-9_]+)/?$'
+HASH_ID = "ea8e8d1aea74c3d4a47e16449bd8c221"
+VIEW_PATH = "website.management.commands.bench_api_proxy.PingView"
+
+
+class PingView(View):
+    def get(self, request, *args, **kwargs):
+        return HttpResponse("ok")
+
+
+def ping(request, *args, **kwargs):
+    return HttpResponse("ok")
+
+
+def legacy_process_request(request, endpoints):
+    """process_request anterior (sin los logs), como referencia."""
+    match = re.match(LEGACY_PATTERN, request.path_info)
+    if not match:
+        return None
+    hash_id = match.group('hash_id')
+    action = match.group('action')
+    if hash_id not in endpoints:
+        return JsonResponse({'error': 'Endpoint no encontrado'}, status=404)
+    endpoint_info = endpoints[hash_id]
+    if request.method not in endpoint_info['methods']:
+        return JsonResponse({'error': f"Método {request.method} no permitido"}, status=405)
+    module = importlib.import_module(endpoint_info['module'])
+    view_class = getattr(module, endpoint_info['class'])
+    view_instance = view_class()
+    view_instance.request = request
+    view_instance.args = []
+    view_instance.kwargs = {'action': action}
+    return view_instance.dispatch(request, action=action)
+
+
+class FixedRegistry(EndpointRegistry):
+    """Registro con la tabla fija del benchmark (sin BD)."""
+
+    def __init__(self, rows):
+        super().__init__(check_interval=3600)
+        self.rows = rows
+
+    def load(self):
+        return build_table(self.rows)
+
+    def _current_version(self):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Mide el coste de despacho del proxy de API (antes, tabla resuelta y enrutado de Django)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=50000, help="Peticiones por medición")
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        factory = RequestFactory()
+        api_request = factory.get(f"/api/v1/{HASH_ID}/ping/")
+        routed_request = factory.get("/api/auth/contact/")
+        other_request = factory.get("/servicios/software-a-medida/")
+        legacy_endpoints = {HASH_ID: {
+            'module': 'website.management.commands.bench_api_proxy', 'class': 'PingView', 'methods': ['GET'],
+        }}
+        with override_settings(ENABLE_API_PROXY=True):
+            middleware = APIProxyMiddleware(ping, endpoints=FixedRegistry([(HASH_ID, VIEW_PATH, "GET")]))
+
+        def per_call(fn, request):
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                for _ in range(number):
+                    fn(request)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return best / number * 1e6
+
+        # Lo que haría el URLconf: la vista de clase ya convertida con as_view()
+        ping_view = PingView.as_view()
+
+        def django_routing(request):
+            match = resolve(request.path_info)
+            return ping_view(request, *match.args, **match.kwargs)
+
+        legacy = per_call(lambda r: legacy_process_request(r, legacy_endpoints), api_request)
+        table = per_call(middleware.process_request, api_request)
+        routed = per_call(django_routing, routed_request)
+        legacy_other = per_call(lambda r: legacy_process_request(r, legacy_endpoints), other_request)
+        table_other = per_call(middleware.process_request, other_request)
+
+        self.stdout.write(f"{number} peticiones por medición (µs por petición)")
+        self.stdout.write(f"{'caso':<40} {'µs':>8}")
+        self.stdout.write(f"{'/api/v1/<hash>/ping/ antes':<40} {legacy:>8.2f}")
+        self.stdout.write(f"{'/api/v1/<hash>/ping/ tabla':<40} {table:>8.2f}  ({legacy / table:.1f}x)")
+        self.stdout.write(f"{'enrutado de Django (resolve + vista)':<40} {routed:>8.2f}")
+        self.stdout.write(f"{'ruta que no es del proxy, antes':<40} {legacy_other:>8.3f}")
+        self.stdout.write(f"{'ruta que no es del proxy, prefijo':<40} {table_other:>8.3f}  ({legacy_other / table_other:.1f}x)")
@@ -0,0 +1,88 @@
+"""
+Coste de `APISecurityHelper.log_api_access` en el hilo de la petición.
+
+Compara el registro anterior (dict + json.dumps + StreamHandler síncrono, aquí
+a un fichero temporal) con la cola de miweb/security/audit.py (el hilo de la
+petición solo encola; el fichero se escribe en lotes en segundo plano). Después
+lanza una ráfaga contra una cola pequeña para ver el contador de descartados.
+"""
+import datetime
+import json
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from miweb.security.audit import AuditQueueHandler, audit_logger
+from miweb.security.business_logic import APISecurityHelper
+
+
+def legacy_log_api_access(log, user_id, endpoint, method, success, ip_address):
+    """log_api_access anterior, como referencia."""
+    log_entry = {
+        'user_id': user_id,
+        'endpoint': endpoint,
+        'method': method,
+        'success': success,
+        'ip_address': ip_address,
+        'timestamp': datetime.datetime.now().isoformat()
+    }
+    log.info(f"API Access: {json.dumps(log_entry)}")
+
+
+class Command(BaseCommand):
+    help = "Mide lo que cuesta registrar un acceso a la API en la petición (síncrono frente a cola)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=50000, help="Eventos por medición")
+        parser.add_argument("--burst-queue", type=int, default=1000, help="Tamaño de la cola en la ráfaga")
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            legacy_stream = open(tmp / "legacy.log", "w", encoding="utf-8")
+            legacy = logging.getLogger("bench.audit.legacy")
+            legacy.propagate = False
+            legacy.setLevel(logging.INFO)
+            legacy.handlers = [logging.StreamHandler(legacy_stream)]
+
+            start = time.perf_counter()
+            for i in range(number):
+                legacy_log_api_access(legacy, i, "contact", "POST", True, "203.0.113.7")
+            legacy_s = time.perf_counter() - start
+            legacy_stream.close()
+
+            saved = audit_logger.handlers
+            try:
+                with override_settings(AUDIT_LOG_SINK="file", AUDIT_LOG_PATH=tmp / "audit.jsonl"):
+                    handler = AuditQueueHandler(queue_size=number + 1)
+                    audit_logger.handlers = [handler]
+                    start = time.perf_counter()
+                    for i in range(number):
+                        APISecurityHelper.log_api_access(i, "contact", "POST", True, "203.0.113.7")
+                    queued_s = time.perf_counter() - start
+                    handler.stop()
+                    drained_s = time.perf_counter() - start
+                    lines = sum(1 for _ in open(tmp / "audit.jsonl", encoding="utf-8"))
+
+                    burst = AuditQueueHandler(queue_size=options["burst_queue"])
+                    audit_logger.handlers = [burst]
+                    for i in range(number):
+                        APISecurityHelper.log_api_access(i, "contact", "POST", True, "203.0.113.7")
+                    dropped = burst.dropped
+                    written = burst.stop()
+            finally:
+                audit_logger.handlers = saved
+
+        self.stdout.write(f"{number} eventos")
+        self.stdout.write(f"{'caso':<34} {'µs/evento':>10}")
+        self.stdout.write(f"{'síncrono (json.dumps + fichero)':<34} {legacy_s / number * 1e6:>10.2f}")
+        self.stdout.write(f"{'cola (hilo de la petición)':<34} {queued_s / number * 1e6:>10.2f}"
+                          f"  ({legacy_s / queued_s:.1f}x)")
+        self.stdout.write(f"{'cola + escritura en lotes':<34} {drained_s / number * 1e6:>10.2f}"
+                          f"  ({lines} líneas escritas)")
+        self.stdout.write(f"Ráfaga con cola de {options['burst_queue']}: {written} escritos, {dropped} descartados")
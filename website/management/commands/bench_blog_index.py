@@ -0,0 +1,86 @@
+"""
+Consultas y latencia del índice del blog según el número de artículos.
+
+Para cada tamaño (--sizes) crea los artículos con bulk_create dentro de una
+transacción que se deshace al final, y pide la vista `blog_index_view`
+completa (consulta + plantilla) en la primera página, en una página profunda
+(cursor al 90% del listado) y con una búsqueda. Como referencia mide también
+la paginación con OFFSET y el modelo entero (lo habitual con Paginator) en esa
+misma página profunda.
+
+Necesita la BD migrada.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from blog.models import Post
+from blog.views import PAGE_SIZE, blog_index_view, encode_cursor
+
+WORDS = ["automatización", "ERP", "CRM", "IA", "facturas", "chatbot", "procesos", "datos"]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mide consultas y latencia del índice del blog con 50 artículos frente a 100.000."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100000], help="Artículos en el blog")
+        parser.add_argument("--content-size", type=int, default=1000, help="Bytes de `content` por artículo")
+        parser.add_argument("--number", type=int, default=50, help="Peticiones por medición")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'artículos':>10} {'caso':<28} {'ms':>8} {'consultas':>10}")
+        for size in options["sizes"]:
+            try:
+                with transaction.atomic():
+                    self.run(size, options["content_size"], options["number"])
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, size, content_size, number):
+        now = timezone.now()
+        content = "x" * content_size
+        Post.objects.bulk_create((
+            Post(title=f"Artículo {i} sobre {WORDS[i % len(WORDS)]}", slug=f"bench-{i}",
+                 excerpt=f"Extracto del artículo {i}", content=content,
+                 published_at=now - timedelta(minutes=i), cover_url="https://example.com/c.jpg",
+                 read_time=5)
+            for i in range(size)
+        ), batch_size=1000)
+
+        deep = int(size * 0.9)
+        deep_post = Post.objects.order_by("-published_at", "-pk").only("published_at")[deep]
+        factory = RequestFactory()
+        cases = [
+            ("primera página", lambda: blog_index_view(factory.get("/blog/"))),
+            ("página profunda (keyset)",
+             lambda: blog_index_view(factory.get("/blog/", {"cursor": encode_cursor(deep_post)}))),
+            ("búsqueda", lambda: blog_index_view(factory.get("/blog/", {"q": "facturas"}))),
+            ("profunda, OFFSET (consulta)",
+             lambda: list(Post.objects.order_by("-published_at", "-pk")[deep:deep + PAGE_SIZE])),
+        ]
+        for label, fn in cases:
+            queries = []
+
+            def count_query(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            fn()  # calentamiento
+            with connection.execute_wrapper(count_query):
+                start = time.perf_counter()
+                for _ in range(number):
+                    fn()
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{size:>10} {label:<28} {elapsed / number * 1000:>8.2f} {len(queries) / number:>10.1f}"
+            )
@@ -0,0 +1,125 @@
+"""
+Comparativa de carga del chat: workers síncronos (WSGI) frente a workers ASGI.
+
+Sustituye el LLM por el backend local (website/chat/stub.py) y lanza N chats a
+la vez contra `api_chat_gemini` (cada worker atiende un chat cada vez) y contra
+`api_chat_gemini_async` (cada worker es un bucle de eventos). Se mide el
+pipeline completo: anti-injection, historial, resiliencia y extracción del lead.
+"""
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from website import views
+from website.chat.resilience import CircuitBreaker, ResilientCaller
+from website.chat.stub import DISTRIBUTIONS, StubClient
+
+
+def _is_fallback(response) -> bool:
+    """La respuesta no viene del modelo (error, rate limit...)."""
+    data = json.loads(response.content)
+    return response.status_code != 200 or "error" in data or "error_type" in data
+
+
+class Command(BaseCommand):
+    help = "Compara cuántos chats simultáneos sostienen N workers síncronos frente a N workers ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Workers de gunicorn simulados")
+        parser.add_argument("--chats", type=int, default=64, help="Chats lanzados a la vez")
+        parser.add_argument("--latency", type=float, default=1.0, help="Latencia media simulada del modelo (s)")
+        parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="fixed",
+                            help="Distribución de la latencia simulada")
+        parser.add_argument("--jitter", type=float, default=0.0, help="Dispersión de la latencia (s)")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de llamadas con 429/503")
+        parser.add_argument("--max-concurrency", type=int, default=0,
+                            help="Límite de llamadas simultáneas al modelo (0 = sin límite)")
+
+    def handle(self, *args, **options):
+        workers, chats, latency = options["workers"], options["chats"], options["latency"]
+        stub = StubClient(distribution=options["distribution"], mean=latency, jitter=options["jitter"],
+                          chunk_delay=0, error_rate=options["error_rate"])
+        max_concurrency = options["max_concurrency"] or chats
+        factory = RequestFactory()
+        body = json.dumps({"message": "Quiero una app para mi negocio", "history": []})
+
+        def make_request():
+            return factory.post("/api/chat-gemini/", data=body, content_type="application/json")
+
+        def make_caller():
+            # Breaker imposible de abrir: se mide el rendimiento, no la protección
+            return ResilientCaller(max_concurrency=max_concurrency, queue_timeout=3600, deadline=3600,
+                                   max_attempts=1, breaker=CircuitBreaker(failure_threshold=10 ** 9))
+
+        saved = views.llm_client, views.llm_caller
+        views.llm_client = stub
+        try:
+            views.llm_caller = make_caller()
+            sync_result = self._run_sync(make_request, workers, chats)
+            views.llm_caller = make_caller()
+            async_result = self._run_async(make_request, workers, chats)
+        finally:
+            views.llm_client, views.llm_caller = saved
+
+        self.stdout.write(
+            f"{workers} workers · {chats} chats simultáneos · latencia del modelo "
+            f"{options['distribution']} {latency:.2f}s ± {options['jitter']:.2f}s · errores {options['error_rate']:.0%}"
+        )
+        self.stdout.write(
+            f"{'modo':<6} {'total(s)':>9} {'chats/s':>8} {'p50(s)':>7} {'p95(s)':>7} {'en vuelo':>9} {'fallback':>9}"
+        )
+        for name, (wall, latencies, fallbacks) in (("wsgi", sync_result), ("asgi", async_result)):
+            throughput = chats / wall
+            # Ley de Little: chats atendidos a la vez = rendimiento x latencia del modelo
+            in_flight = throughput * latency
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            self.stdout.write(
+                f"{name:<6} {wall:>9.2f} {throughput:>8.1f} {statistics.median(latencies):>7.2f} "
+                f"{p95:>7.2f} {in_flight:>9.1f} {fallbacks:>9}"
+            )
+
+    @staticmethod
+    def _run_sync(make_request, workers, chats):
+        """Cada worker síncrono atiende un chat cada vez."""
+        # La latencia se mide desde el lanzamiento, incluyendo la cola de espera
+        def one():
+            response = views.api_chat_gemini(make_request())
+            return time.perf_counter() - start, _is_fallback(response)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda _: one(), range(chats)))
+        wall = time.perf_counter() - start
+        return wall, [r[0] for r in results], sum(r[1] for r in results)
+
+    @staticmethod
+    def _run_async(make_request, workers, chats):
+        """Cada worker es un bucle de eventos que reparte los chats que le tocan."""
+        latencies = []
+        fallbacks = []
+        lock = threading.Lock()
+
+        async def one():
+            response = await views.api_chat_gemini_async(make_request())
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                fallbacks.append(_is_fallback(response))
+
+        async def worker(n):
+            await asyncio.gather(*(one() for _ in range(n)))
+
+        shares = [chats // workers + (1 if i < chats % workers else 0) for i in range(workers)]
+        threads = [threading.Thread(target=asyncio.run, args=(worker(n),)) for n in shares if n]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start, latencies, sum(fallbacks)
@@ -0,0 +1,117 @@
+"""
+Rendimiento de la carga de contactos por lotes (POST /api/auth/contact/batch/).
+
+Genera N contactos (un 5% inválidos) y mide, dentro de una transacción que se
+deshace al final (la BD queda igual):
+
+- contacto a contacto: ContactProcessor + un INSERT por lead, lo que costaba
+  cargarlos con el endpoint de uno en uno (sin contar la red ni el JWT),
+- el endpoint por lotes con un array JSON y con NDJSON, de punta a punta
+  (parseo, validación, prioridad y bulk_create).
+
+Necesita la BD migrada (python manage.py migrate).
+"""
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from website.api.views import ContactBatchAPIView, ContactProcessor
+from website.leads import build_lead
+from website.models import Lead
+
+MESSAGES = [
+    "Necesitamos una app de reservas para la clínica",
+    "urgent: la web actual no carga en móvil",
+    "Queremos automatizar la facturación con nuestro ERP " * 6,
+    "Presupuesto para una tienda online",
+]
+
+
+def make_rows(count, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        row = {
+            "name": f"Contacto {i}",
+            "phone": f"+34 6{rng.randrange(10 ** 8):08d}",
+            "message": rng.choice(MESSAGES),
+            "sector": rng.choice(["salud", "retail", "industria"]),
+        }
+        if rng.random() < 0.3:
+            row["company"] = f"Empresa {i % 500}"
+        if rng.random() < 0.2:
+            row["budget"] = rng.choice([3000, 12000, "25000"])
+        if rng.random() < 0.05:
+            row["phone"] = "12 34"  # inválido
+        rows.append(row)
+    return rows
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mide cuántos contactos por segundo ingiere la API por lotes frente a uno a uno."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000, help="Contactos del lote")
+
+    def handle(self, *args, **options):
+        count = options["rows"]
+        rows = make_rows(count)
+        json_body = json.dumps(rows).encode()
+        ndjson_body = b"\n".join(json.dumps(row).encode() for row in rows)
+        factory = APIRequestFactory()
+        view = ContactBatchAPIView.as_view()
+        user = User(id=0, username="bench")
+
+        def one_by_one():
+            for row in rows:
+                result = ContactProcessor().safe_execute(row)
+                if result["success"]:
+                    data = result["result"]
+                    build_lead(Lead.SOURCE_API, data["name"], data["phone"], message=data["message"],
+                               sector=data["sector"], priority=data["priority"]).save()
+
+        def batch(body, content_type):
+            def run():
+                request = factory.post("/api/auth/contact/batch/", body, content_type=content_type)
+                force_authenticate(request, user=user)
+                response = view(request)
+                assert response.status_code == 201, response.data
+                return response.data
+            return run
+
+        def timed(fn):
+            start = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    result = fn()
+                    raise Rollback
+            except Rollback:
+                pass
+            return time.perf_counter() - start, result
+
+        with override_settings(RATE_LIMIT_ENABLED=False, CONTACT_BATCH_MAX_ROWS=max(count, 10000)):
+            cases = [
+                ("uno a uno (save por lead)", one_by_one),
+                ("lote, array JSON", batch(json_body, "application/json")),
+                ("lote, NDJSON", batch(ndjson_body, "application/x-ndjson")),
+            ]
+            self.stdout.write(f"{count} contactos ({len(json_body) / 1024:.0f} KiB en JSON)")
+            self.stdout.write(f"{'caso':<28} {'s':>8} {'contactos/s':>12}")
+            baseline = None
+            for label, fn in cases:
+                elapsed, result = timed(fn)
+                rate = count / elapsed
+                baseline = baseline or elapsed
+                self.stdout.write(f"{label:<28} {elapsed:>8.3f} {rate:>12.0f}  ({baseline / elapsed:.1f}x)")
+                if result:
+                    self.stdout.write(f"{'':<28} creados {result['created']}, errores {len(result['errors'])}")
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark de la normalización del historial en cada petición del chat.
+
+Compara las dos `re.sub` por turno de antes (más la limpieza del JSON de los
+turnos del asistente) con `TextNormalizer`: tabla de traducción y memoria por
+hash del contenido. En una conversación real cada petición solo trae dos turnos
+nuevos; el resto ya se limpió en peticiones anteriores.
+"""
+import re
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from website.chat.text import TextNormalizer
+from website.views import JSON_BLOCK_RX
+
+USER_TURN = "Tenemos una clínica dental en Castellón 🦷 y queremos una app para gestionar citas, recordatorios por WhatsApp y pagos. ¿Cuánto costaría?"
+ASSISTANT_TURN = (
+    "¡Genial! 😊 Para una clínica dental lo habitual es empezar por la agenda de citas y los recordatorios. "
+    "¿Cuántas personas la usarían a diario?\n"
+    '```json lead\n{"name": "Laura", "phone": "", "message": "App de citas", "missing": ["phone"]}\n```'
+)
+
+
+def build_history(turns: int):
+    # Turnos distintos entre sí, como en una conversación real
+    return [
+        {"role": "user", "content": f"{USER_TURN} ({i})"} if i % 2 == 0
+        else {"role": "assistant", "content": f"{ASSISTANT_TURN} ({i})"}
+        for i in range(turns)
+    ]
+
+
+def legacy_clean(s):
+    if not s:
+        return ""
+    s = re.sub(r"[^\w\s.,!?¿¡áéíóúñüÁÉÍÓÚÑÜ()@/:-]", "", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s[:2000]
+
+
+def legacy_request(history):
+    contents = []
+    for turn in history:
+        content = legacy_clean(turn["content"])
+        if turn["role"] == "assistant":
+            content = JSON_BLOCK_RX.sub("", content).strip()
+        contents.append(content)
+    return contents
+
+
+class Command(BaseCommand):
+    help = "Mide el coste por petición de normalizar el historial según crece la conversación."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--turns", default="2,10,40,100,200", help="Turnos del historial")
+        parser.add_argument("--number", type=int, default=200, help="Peticiones por medición")
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options["turns"].split(",") if s.strip()]
+        number = options["number"]
+
+        self.stdout.write(f"{number} peticiones por medición (µs por petición)")
+        self.stdout.write(f"{'turnos':>7} {'regex':>9} {'tabla':>9} {'tabla+memoria':>14} {'nuevos':>7}")
+        for size in sizes:
+            history = build_history(size)
+            fresh = TextNormalizer(cache_size=0)
+            assert [fresh.clean(t["content"]) for t in history] == legacy_request(history)
+
+            # Como en producción: los turnos anteriores ya se limpiaron en la petición previa
+            cached = TextNormalizer(cache_size=4096)
+            for turn in history[:-2]:
+                cached.clean(turn["content"])
+
+            def cached_request():
+                # Los dos últimos turnos son nuevos en cada petición
+                for turn in history[:-2]:
+                    cached.clean(turn["content"])
+                fresh.clean(history[-2]["content"])
+                fresh.clean(history[-1]["content"])
+
+            legacy = min(timeit.repeat(lambda: legacy_request(history), number=number, repeat=3))
+            table = min(timeit.repeat(lambda: [fresh.clean(t["content"]) for t in history], number=number, repeat=3))
+            memo = min(timeit.repeat(cached_request, number=number, repeat=3))
+            self.stdout.write(
+                f"{size:>7} {legacy / number * 1e6:>9.1f} {table / number * 1e6:>9.1f} "
+                f"{memo / number * 1e6:>14.1f} {min(size, 2):>7}"
+            )
@@ -0,0 +1,96 @@
+"""
+Peticiones autenticadas por segundo con JWT, con y sin la cache de tokens.
+
+Una vista DRF trivial (IsAuthenticated, JSON) se llama con tokens de acceso
+reales de --tokens clientes, repartidos por turnos, usando:
+
+- JWTAuthentication: firma + decodificación + User de la BD en cada petición,
+- CachedJWTAuthentication: token validado en cache, User de la BD,
+- CachedJWTStatelessAuthentication: token en cache y TokenUser, sin BD.
+
+El usuario del benchmark se crea dentro de una transacción que se deshace al
+final. Necesita la BD migrada.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from miweb.security.jwt_auth import CachedJWTAuthentication, CachedJWTStatelessAuthentication, token_cache
+
+
+def make_view(authentication_class):
+    class PingView(APIView):
+        authentication_classes = [authentication_class]
+        permission_classes = [IsAuthenticated]
+        renderer_classes = [JSONRenderer]
+
+        def get(self, request):
+            return Response({"user": request.user.id})
+
+    return PingView.as_view()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mide las peticiones autenticadas por segundo con JWT (sin cache, con cache y sin BD)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=20000, help="Peticiones por caso")
+        parser.add_argument("--tokens", type=int, default=50, help="Tokens distintos (clientes)")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options["number"], options["tokens"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, number, tokens):
+        user = get_user_model().objects.create_user("bench-jwt", password=None)
+        factory = RequestFactory()
+        requests = [
+            factory.get("/api/ping/", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+            for _ in range(tokens)
+        ]
+        cases = [
+            ("JWTAuthentication", JWTAuthentication),
+            ("CachedJWTAuthentication", CachedJWTAuthentication),
+            ("CachedJWTStatelessAuthentication", CachedJWTStatelessAuthentication),
+        ]
+        self.stdout.write(f"{number} peticiones, {tokens} tokens distintos")
+        self.stdout.write(f"{'autenticación':<34} {'µs':>8} {'pet/s':>9} {'consultas/pet':>14}")
+        baseline = None
+        for label, auth_class in cases:
+            token_cache.clear()
+            view = make_view(auth_class)
+            queries = []
+
+            def count_query(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_query):
+                start = time.perf_counter()
+                for i in range(number):
+                    response = view(requests[i % tokens])
+                elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.status_code
+            baseline = baseline or elapsed
+            self.stdout.write(
+                f"{label:<34} {elapsed / number * 1e6:>8.1f} {number / elapsed:>9.0f}"
+                f" {len(queries) / number:>14.2f}  ({baseline / elapsed:.1f}x)"
+            )
+        token_cache.clear()
@@ -0,0 +1,67 @@
+"""
+Micro-benchmark de la cache de página completa (miweb/page_cache.py).
+
+Pide las páginas de marketing con la pila de middlewares de producción (GZip,
+inyección del script, cabeceras, ConditionalGet) con y sin PageCacheMiddleware
+y compara el tiempo por petición. Con --alias default se usa la LocMemCache del
+proceso en lugar de la cache 'shared' (que necesita Redis o createcachetable).
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+PAGES = ["website:home", "website:vinaros", "services:software_a_medida", "website:castellon"]
+
+
+def production_middleware():
+    """MIDDLEWARE como queda con DEBUG=False (GZip delante y ConditionalGet al final)."""
+    middleware = [m for m in settings.MIDDLEWARE
+                  if m not in ('django.middleware.gzip.GZipMiddleware', 'django.middleware.http.ConditionalGetMiddleware')]
+    middleware.insert(1, 'django.middleware.gzip.GZipMiddleware')
+    middleware.append('django.middleware.http.ConditionalGetMiddleware')
+    return middleware
+
+
+class Command(BaseCommand):
+    help = "Mide el tiempo por petición de las páginas de marketing con y sin la cache de páginas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=500, help="Peticiones por página y medición")
+        parser.add_argument("--alias", default=getattr(settings, "PAGE_CACHE_ALIAS", "shared"),
+                            help="Alias de cache para las páginas")
+        parser.add_argument("--encoding", default="gzip, deflate, br", help="Accept-Encoding del cliente")
+
+    def measure(self, enabled, paths, number, alias, encoding):
+        overrides = dict(
+            DEBUG=False, ALLOWED_HOSTS=["testserver"], MIDDLEWARE=production_middleware(),
+            PAGE_CACHE_ENABLED=enabled, PAGE_CACHE_ALIAS=alias, CSP_NONCES=False,
+        )
+        results = {}
+        with override_settings(**overrides):
+            client = Client(HTTP_ACCEPT_ENCODING=encoding)
+            for path in paths:
+                client.get(path)  # calienta plantillas y, si está activa, la cache
+                start = time.perf_counter()
+                for _ in range(number):
+                    response = client.get(path)
+                results[path] = ((time.perf_counter() - start) / number * 1e6,
+                                 response.get("Content-Encoding", "identity"), len(response.content))
+        return results
+
+    def handle(self, *args, **options):
+        number, alias, encoding = options["number"], options["alias"], options["encoding"]
+        paths = [reverse(name) for name in PAGES]
+        live = self.measure(False, paths, number, alias, encoding)
+        cached = self.measure(True, paths, number, alias, encoding)
+
+        self.stdout.write(f"{number} peticiones por página, Accept-Encoding: {encoding!r} (µs por petición)")
+        self.stdout.write(f"{'página':<30} {'sin cache':>10} {'cache':>8} {'mejora':>7} {'cuerpo':>16}")
+        for path in paths:
+            before, _, _ = live[path]
+            after, content_encoding, size = cached[path]
+            self.stdout.write(
+                f"{path:<30} {before:>10.1f} {after:>8.1f} {before / after:>6.1f}x {content_encoding:>8} {size:>7}"
+            )
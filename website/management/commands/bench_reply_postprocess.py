@@ -0,0 +1,81 @@
+"""
+Micro-benchmark del post-proceso de respuestas del modelo.
+
+Compara la cadena anterior de la vista (un `re.search` por regla sobre el texto
+en minúsculas, extracción del lead, `JSON_BLOCK_RX.sub` y las dos limpiezas de
+respaldo con `re.sub`) con `ReplyScanner`, que lo resuelve todo en una sola
+pasada, sobre respuestas de longitud creciente con el bloque ```json lead``` al
+final.
+"""
+import re
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from website.views import (
+    JSON_BLOCK_RX,
+    PROMPT_INJECTION_PATTERNS,
+    SASQA_MSG,
+    extract_lead_from_text,
+    reply_scanner,
+)
+
+PARAGRAPH = (
+    "¡Genial, Laura! Para una clínica dental lo habitual es empezar por la agenda de citas, "
+    "los recordatorios por WhatsApp y una ficha sencilla de cada paciente; después se puede "
+    "añadir la facturación y un panel con las métricas del mes. "
+)
+LEAD_BLOCK = (
+    '```json lead\n{\n  "name": "Laura", "phone": "600123456", "message": "App de citas",'
+    ' "contact_preference": "phone", \n  "missing": []\n}\n```'
+)
+
+
+def build_reply(size: int) -> str:
+    body = (PARAGRAPH * (size // len(PARAGRAPH) + 1))[:size]
+    return body + "\n\n" + LEAD_BLOCK
+
+
+def legacy_is_attack(text: str) -> bool:
+    text_lower = text.lower()
+    return any(re.search(p, text_lower, re.IGNORECASE) for p in PROMPT_INJECTION_PATTERNS)
+
+
+def legacy_postprocess(reply: str):
+    if legacy_is_attack(reply):
+        reply = SASQA_MSG
+    lead = extract_lead_from_text(reply)
+    reply_clean = JSON_BLOCK_RX.sub("", reply).strip()
+    reply_clean = re.sub(r'```json.*?```', '', reply_clean, flags=re.DOTALL | re.IGNORECASE)
+    reply_clean = re.sub(r'\{[^}]*"name"[^}]*\}', '', reply_clean)
+    return reply_clean.strip(), lead
+
+
+class Command(BaseCommand):
+    help = "Mide el coste del post-proceso de una respuesta del modelo según su longitud."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="600,4000,16000,64000", help="Longitudes del texto (caracteres)")
+        parser.add_argument("--number", type=int, default=200, help="Llamadas por medición")
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options["sizes"].split(",") if s.strip()]
+        number = options["number"]
+
+        self.stdout.write(f"{number} llamadas por medición")
+        self.stdout.write(f"{'chars':>7} {'cadena (µs)':>12} {'scanner (µs)':>13} {'mejora':>7}")
+        for size in sizes:
+            reply = build_reply(size)
+
+            # Mismo resultado en ambos métodos
+            scan = reply_scanner.scan(reply)
+            assert (scan.visible, scan.lead) == legacy_postprocess(reply), size
+
+            legacy = min(timeit.repeat(lambda: legacy_postprocess(reply), number=number, repeat=3))
+            scanner = min(timeit.repeat(lambda: reply_scanner.scan(reply), number=number, repeat=3))
+
+            legacy_us = legacy / number * 1e6
+            scanner_us = scanner / number * 1e6
+            self.stdout.write(
+                f"{len(reply):>7} {legacy_us:>12.1f} {scanner_us:>13.1f} {legacy_us / scanner_us:>6.1f}x"
+            )
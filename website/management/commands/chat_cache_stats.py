@@ -0,0 +1,17 @@
+"""
+Muestra la tasa de aciertos de la caché de respuestas de chips.
+"""
+from django.core.management.base import BaseCommand
+
+from website.views import chip_reply_cache
+
+
+class Command(BaseCommand):
+    help = "Muestra aciertos, fallos y tasa de aciertos de la caché de respuestas de chips."
+
+    def handle(self, *args, **options):
+        stats = chip_reply_cache.stats()
+        self.stdout.write(
+            f"prompt {stats['prompt_version']}: {stats['hits']} aciertos, {stats['misses']} fallos, "
+            f"tasa de aciertos {stats['hit_rate']:.1%}"
+        )
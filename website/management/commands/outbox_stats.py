@@ -0,0 +1,27 @@
+"""
+Muestra el estado del outbox de emails: profundidad de la cola y latencia de entrega.
+"""
+from django.core.management.base import BaseCommand
+
+from website import outbox
+
+
+class Command(BaseCommand):
+    help = "Muestra los emails pendientes/fallidos del outbox y la latencia de entrega reciente."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sample", type=int, default=200, help="Emails enviados recientes para la latencia")
+
+    def handle(self, *args, **options):
+        stats = outbox.stats(options["sample"])
+        self.stdout.write(
+            f"pendientes {stats['pending']} (ya toca: {stats['due']}), fallidos {stats['failed']}, "
+            f"el más antiguo espera {stats['oldest_pending_seconds']:.0f}s"
+        )
+        if stats["sent_sample"]:
+            self.stdout.write(
+                f"latencia de entrega (últimos {stats['sent_sample']}): p50 {stats['latency_p50']:.1f}s, "
+                f"p95 {stats['latency_p95']:.1f}s, máx {stats['latency_max']:.1f}s"
+            )
+        else:
+            self.stdout.write("Aún no hay emails enviados.")
@@ -0,0 +1,52 @@
+"""
+Worker del outbox de emails: envía los emails encolados por las vistas.
+
+Se ejecuta como proceso aparte (ver el `worker:` del Procfile). Mientras hay
+trabajo reutiliza la misma conexión SMTP; cuando la cola se vacía la cierra
+para no mantener sesiones ociosas con el servidor de correo.
+"""
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from website import outbox
+
+PURGE_EVERY = 3600  # segundos
+
+
+class Command(BaseCommand):
+    help = "Envía los emails pendientes del outbox (en bucle, o una vez con --once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Vacía lo pendiente y termina")
+        parser.add_argument("--interval", type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                            help="Segundos de espera cuando la cola está vacía")
+        parser.add_argument("--batch", type=int, default=settings.OUTBOX_BATCH_SIZE,
+                            help="Emails reservados por lote")
+
+    def handle(self, *args, **options):
+        connection = get_connection(fail_silently=False)
+        last_purge = 0.0
+        try:
+            while True:
+                result = outbox.drain(options["batch"], connection=connection)
+                if result["sent"] or result["failed"]:
+                    self.stdout.write(f"Outbox: {result['sent']} enviados, {result['failed']} con error")
+                # Cola vacía: se cierra la sesión SMTP hasta la siguiente vuelta con trabajo
+                connection.close()
+
+                if time.monotonic() - last_purge > PURGE_EVERY:
+                    purged = outbox.purge(settings.OUTBOX_RETENTION_DAYS)
+                    if purged:
+                        self.stdout.write(f"Outbox: {purged} emails antiguos borrados")
+                    last_purge = time.monotonic()
+
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
@@ -0,0 +1,106 @@
+"""
+Pre-renderiza las páginas de PRERENDER_VIEWS en PRERENDER_ROOT (ver miweb/prerender.py).
+
+Se ejecuta en el despliegue, después de collectstatic y antes de arrancar el
+servidor. Cada página se pide con la pila de middlewares real (con DEBUG=False
+lleva el script de protección) y con el host de PRERENDER_BASE_URL, que es el que
+acaba en los canonical y og:url. Las páginas que no se pueden compartir (error,
+cookies, política privada...) se quedan sin fichero y se sirven en vivo.
+"""
+import shutil
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import NoReverseMatch, reverse
+
+from miweb.cache_policy import is_shareable
+from miweb.prerender import HTML_DIR, minify_html, page_file, saved_headers, write_manifest, write_page
+
+
+def default_base_url() -> str:
+    hosts = [h for h in settings.ALLOWED_HOSTS if h and "*" not in h and not h.startswith(".")]
+    return f"https://{hosts[0]}" if hosts else "http://localhost"
+
+
+class Command(BaseCommand):
+    help = "Genera el HTML minificado y precomprimido de las páginas de PRERENDER_VIEWS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default=getattr(settings, "PRERENDER_BASE_URL", "") or None,
+                            help="Esquema y host de las páginas (por defecto el primero de ALLOWED_HOSTS)")
+        parser.add_argument("--output", default=str(settings.PRERENDER_ROOT), help="Carpeta de salida")
+
+    def handle(self, *args, **options):
+        if getattr(settings, "CSP_NONCES", False):
+            raise CommandError("Con CSP_NONCES cada página lleva un nonce por petición: no se puede pre-renderizar")
+        base_url = (options["base_url"] or default_base_url()).rstrip("/")
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https") or not parts.netloc:
+            raise CommandError(f"URL base no válida: {base_url!r}")
+        root = Path(options["output"])
+        root.mkdir(parents=True, exist_ok=True)
+        # Se genera en una carpeta aparte y se cambia al final: nunca queda a medias
+        building = root / f"{HTML_DIR}.building"
+        shutil.rmtree(building, ignore_errors=True)
+
+        pages = {}
+        totals = {"html": 0, "raw": 0, "gz": 0, "br": 0}
+        overrides = dict(
+            # Sin la cache de páginas ni las pre-renderizadas anteriores: siempre en vivo
+            PRERENDER_ENABLED=False, PAGE_CACHE_ENABLED=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, parts.hostname],
+        )
+        with override_settings(**overrides):
+            # Un error en una vista no para el despliegue: esa página queda en vivo
+            client = Client(raise_request_exception=False, HTTP_HOST=parts.netloc)
+            for name in settings.PRERENDER_VIEWS:
+                try:
+                    path = reverse(name)
+                except NoReverseMatch:
+                    self.stderr.write(f"  {name}: no existe o necesita argumentos, se omite")
+                    continue
+                response = client.get(path, secure=parts.scheme == "https")
+                problem = self.problem(response)
+                if problem:
+                    self.stderr.write(f"  {path}: {problem}, se servirá en vivo")
+                    continue
+                raw = response.content
+                body = minify_html(raw.decode(response.charset)).encode(response.charset)
+                sizes = write_page(building, path, body)
+                pages[path] = {"view": name, "file": page_file(path), "headers": saved_headers(response)}
+                totals["raw"] += len(raw)
+                for key, size in sizes.items():
+                    totals[key] += size
+                self.stdout.write(
+                    f"  {path:<32} {len(raw):>7} -> {sizes['html']:>7} html"
+                    f" {sizes.get('gz', '-'):>7} gz {sizes.get('br', '-'):>7} br"
+                )
+
+        target = root / HTML_DIR
+        old = root / f"{HTML_DIR}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if target.exists():
+            target.rename(old)
+        if building.exists():
+            building.rename(target)
+        shutil.rmtree(old, ignore_errors=True)
+        write_manifest(root, pages, base_url)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(pages)} páginas en {target} ({totals['raw']} bytes renderizados -> "
+            f"{totals['html']} minificados, {totals['gz']} gzip, {totals['br']} brotli)"
+        ))
+
+    @staticmethod
+    def problem(response):
+        if response.status_code != 200:
+            return f"respuesta {response.status_code}"
+        if response.streaming or response.has_header("Content-Encoding"):
+            return "respuesta en streaming o ya comprimida"
+        if "text/html" not in response.get("Content-Type", ""):
+            return "no es HTML"
+        if "public" not in response.get("Cache-Control", "") or not is_shareable(response.wsgi_request, response):
+            return "no se puede compartir (cookies o política privada)"
+        return None
@@ -0,0 +1,25 @@
+"""
+Muestra los contadores del rate limiter (peticiones comprobadas y bloqueadas por scope).
+"""
+from django.core.management.base import BaseCommand
+
+from miweb.security.rate_limit import rate_limiter
+
+
+class Command(BaseCommand):
+    help = "Muestra las peticiones comprobadas y bloqueadas por el rate limiter, por scope."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Pone los contadores a cero tras mostrarlos")
+
+    def handle(self, *args, **options):
+        for scope, counters in rate_limiter.stats().items():
+            checked, blocked = counters["checked"], counters["blocked"]
+            detail = ", ".join(
+                f"{name.split(':', 1)[1]} {value}" for name, value in counters.items() if name.startswith("blocked:")
+            )
+            rate = blocked / checked if checked else 0.0
+            self.stdout.write(f"{scope}: {checked} comprobadas, {blocked} bloqueadas ({rate:.1%}) [{detail}]")
+        if options["reset"]:
+            rate_limiter.reset_stats()
+            self.stdout.write("Contadores a cero.")
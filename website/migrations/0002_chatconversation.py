@@ -0,0 +1,29 @@
+# Generated by Django 4.2.18 on 2026-10-18 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatConversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.CharField(max_length=32, unique=True)),
+                ('turns', models.JSONField(default=list, verbose_name='Turnos normalizados')),
+                ('lead', models.JSONField(default=dict, verbose_name='Lead agregado')),
+                ('lead_sent', models.BooleanField(default=False, verbose_name='Lead ya enviado')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Conversación de chat',
+                'verbose_name_plural': 'Conversaciones de chat',
+            },
+        ),
+    ]
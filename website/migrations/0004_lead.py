@@ -0,0 +1,35 @@
+# Generated by Django 4.2.18 on 2026-10-18 06:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0003_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('chat', 'Chat'), ('contact', 'Formulario de contacto')], max_length=16, verbose_name='Origen')),
+                ('name', models.CharField(max_length=150, verbose_name='Nombre')),
+                ('phone', models.CharField(max_length=40, verbose_name='Teléfono')),
+                ('phone_normalized', models.CharField(max_length=20, verbose_name='Teléfono normalizado')),
+                ('company', models.CharField(blank=True, default='', max_length=150, verbose_name='Empresa')),
+                ('sector', models.CharField(blank=True, default='', max_length=150, verbose_name='Sector')),
+                ('message', models.TextField(blank=True, default='', verbose_name='Proyecto')),
+                ('conversation_id', models.CharField(blank=True, default='', max_length=32)),
+                ('transcript_z', models.BinaryField(blank=True, default=b'', verbose_name='Transcripción (zlib)')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+            ],
+            options={
+                'verbose_name': 'Lead',
+                'verbose_name_plural': 'Leads',
+                'indexes': [models.Index(fields=['-created_at'], name='lead_created_idx'), models.Index(fields=['phone_normalized', '-created_at'], name='lead_phone_idx')],
+            },
+        ),
+    ]
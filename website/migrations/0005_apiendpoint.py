@@ -0,0 +1,29 @@
+# Generated by Django 4.2.18 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0004_lead'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIEndpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text="Nombre del endpoint (p. ej. 'contact'); el hash se calcula a partir de él", max_length=100, unique=True, verbose_name='Ruta interna')),
+                ('hash_id', models.CharField(blank=True, max_length=32, unique=True, verbose_name='Hash')),
+                ('view', models.CharField(help_text='Ruta Python de la vista o clase (p. ej. website.api.views.ContactAPIView)', max_length=200, verbose_name='Vista')),
+                ('methods', models.CharField(default='GET', help_text='Métodos HTTP permitidos, separados por comas', max_length=60, verbose_name='Métodos')),
+                ('enabled', models.BooleanField(default=True, verbose_name='Activo')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Endpoint de API',
+                'verbose_name_plural': 'Endpoints de API',
+            },
+        ),
+    ]
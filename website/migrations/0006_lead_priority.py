@@ -0,0 +1,23 @@
+# Generated by Django 4.2.18 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0005_apiendpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='priority',
+            field=models.CharField(blank=True, default='', max_length=16, verbose_name='Prioridad'),
+        ),
+        migrations.AlterField(
+            model_name='lead',
+            name='source',
+            field=models.CharField(choices=[('chat', 'Chat'), ('contact', 'Formulario de contacto'), ('api', 'API (carga por lotes)')], max_length=16, verbose_name='Origen'),
+        ),
+    ]
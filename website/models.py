@@ -1,6 +1,7 @@
 # FILE: website/models.py
 
 from django.db import models
+from django.utils import timezone
 
 class Contacto(models.Model):
     nombre = models.CharField(max_length=100)
@@ -27,4 +28,119 @@ class Testimonio(models.Model):
         return f'Testimonio de {self.autor}'
 
     class Meta:
-        verbose_name_plural = "Testimonios"
\ No newline at end of file
+        verbose_name_plural = "Testimonios"
+
+class ChatConversation(models.Model):
+    """Estado de una conversación del chat guardado en servidor (modo conversation_id)."""
+    conversation_id = models.CharField(max_length=32, unique=True)
+    turns = models.JSONField(default=list, verbose_name="Turnos normalizados")
+    lead = models.JSONField(default=dict, verbose_name="Lead agregado")
+    lead_sent = models.BooleanField(default=False, verbose_name="Lead ya enviado")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return self.conversation_id
+
+    class Meta:
+        verbose_name = "Conversación de chat"
+        verbose_name_plural = "Conversaciones de chat"
+
+class OutboundEmail(models.Model):
+    """Email pendiente de envío (outbox). Lo encola la petición y lo envía `manage.py outbox_worker`."""
+    KIND_LEAD = "lead"
+    KIND_CONTACT = "contact"
+    KIND_CHOICES = [(KIND_LEAD, "Lead del chat"), (KIND_CONTACT, "Formulario de contacto")]
+
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [(STATUS_PENDING, "Pendiente"), (STATUS_SENT, "Enviado"), (STATUS_FAILED, "Fallido")]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list, verbose_name="Destinatarios")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos")
+    next_attempt_at = models.DateTimeField(verbose_name="Próximo intento")
+    last_error = models.TextField(blank=True, default="", verbose_name="Último error")
+    digest = models.BooleanField(default=False, verbose_name="Enviado en resumen")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name="Enviado el")
+
+    def __str__(self):
+        return self.subject
+
+    class Meta:
+        verbose_name = "Email saliente"
+        verbose_name_plural = "Emails salientes"
+        indexes = [
+            # Lo que consulta el worker: pendientes cuyo turno ya llegó
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+class Lead(models.Model):
+    """Lead capturado por el chat o el formulario de contacto (se guarda en lotes, ver website/leads.py)."""
+    SOURCE_CHAT = "chat"
+    SOURCE_CONTACT = "contact"
+    SOURCE_API = "api"
+    SOURCE_CHOICES = [(SOURCE_CHAT, "Chat"), (SOURCE_CONTACT, "Formulario de contacto"),
+                      (SOURCE_API, "API (carga por lotes)")]
+
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, verbose_name="Origen")
+    name = models.CharField(max_length=150, verbose_name="Nombre")
+    phone = models.CharField(max_length=40, verbose_name="Teléfono")
+    phone_normalized = models.CharField(max_length=20, verbose_name="Teléfono normalizado")
+    company = models.CharField(max_length=150, blank=True, default="", verbose_name="Empresa")
+    sector = models.CharField(max_length=150, blank=True, default="", verbose_name="Sector")
+    message = models.TextField(blank=True, default="", verbose_name="Proyecto")
+    conversation_id = models.CharField(max_length=32, blank=True, default="")
+    transcript_z = models.BinaryField(blank=True, default=b"", verbose_name="Transcripción (zlib)")
+    # Solo la calculan los contactos de la API (ContactProcessor._calculate_priority)
+    priority = models.CharField(max_length=16, blank=True, default="", verbose_name="Prioridad")
+    # Momento de captura (no el del bulk_create, que llega después)
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Fecha")
+
+    def __str__(self):
+        return f"{self.name} ({self.phone})"
+
+    @property
+    def transcript(self):
+        """Turnos {role, content} de la conversación (vacío en los del formulario)."""
+        from .leads import decompress_transcript
+        return decompress_transcript(self.transcript_z)
+
+    class Meta:
+        verbose_name = "Lead"
+        verbose_name_plural = "Leads"
+        indexes = [
+            models.Index(fields=["-created_at"], name="lead_created_idx"),
+            models.Index(fields=["phone_normalized", "-created_at"], name="lead_phone_idx"),
+        ]
+
+class APIEndpoint(models.Model):
+    """Endpoint del proxy de API: /api/v1/<hash_id>/<acción>/ -> vista (ver miweb/security/api_proxy.py)."""
+    path = models.CharField(max_length=100, unique=True, verbose_name="Ruta interna",
+                            help_text="Nombre del endpoint (p. ej. 'contact'); el hash se calcula a partir de él")
+    hash_id = models.CharField(max_length=32, unique=True, blank=True, verbose_name="Hash")
+    view = models.CharField(max_length=200, verbose_name="Vista",
+                            help_text="Ruta Python de la vista o clase (p. ej. website.api.views.ContactAPIView)")
+    methods = models.CharField(max_length=60, default="GET", verbose_name="Métodos",
+                               help_text="Métodos HTTP permitidos, separados por comas")
+    enabled = models.BooleanField(default=True, verbose_name="Activo")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        if not self.hash_id:
+            from miweb.security.api_proxy import generate_endpoint_hash
+            self.hash_id = generate_endpoint_hash(self.path)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.path} ({self.hash_id})"
+
+    class Meta:
+        verbose_name = "Endpoint de API"
+        verbose_name_plural = "Endpoints de API"
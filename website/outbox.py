@@ -0,0 +1,197 @@
+"""
+Outbox de emails en base de datos.
+
+Las vistas ya no hablan con el servidor SMTP: `enqueue()` hace un único INSERT
+y la respuesta al usuario no espera al correo. `manage.py outbox_worker`
+vacía la cola con una sola conexión SMTP reutilizada, reintenta con backoff
+exponencial y, si se acumulan varios emails del mismo tipo y destinatarios,
+los agrupa en un único resumen.
+
+Cada envío se "reserva" moviendo `next_attempt_at` al futuro (lease), de modo
+que si el worker muere a mitad, el email vuelve a la cola al caducar la reserva.
+"""
+import logging
+import random
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+DIGEST_LABELS = {
+    OutboundEmail.KIND_LEAD: "leads del chat",
+    OutboundEmail.KIND_CONTACT: "contactos",
+}
+
+
+def enqueue(kind: str, subject: str, body: str, to: Iterable[str],
+            from_email: Optional[str] = None) -> OutboundEmail:
+    """Encola un email (un INSERT). Lo envía el worker."""
+    now = timezone.now()
+    return OutboundEmail.objects.create(
+        kind=kind,
+        subject=subject[:255],
+        body=body,
+        from_email=from_email or getattr(settings, "DEFAULT_FROM_EMAIL", "noreply@localhost"),
+        to=list(to),
+        next_attempt_at=now,
+    )
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Espera antes del siguiente intento: base * 2^(intentos-1), con tope y jitter."""
+    base = settings.OUTBOX_BACKOFF_BASE
+    delay = min(settings.OUTBOX_BACKOFF_MAX, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(limit: int) -> List[OutboundEmail]:
+    """Reserva hasta `limit` emails pendientes cuyo turno ha llegado."""
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+    with transaction.atomic():
+        # skip_locked: varios workers no se quitan los emails (se ignora en SQLite)
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:limit]
+        )
+        if batch:
+            OutboundEmail.objects.filter(pk__in=[e.pk for e in batch]).update(next_attempt_at=lease_until)
+    return batch
+
+
+def _group(batch: List[OutboundEmail]) -> List[List[OutboundEmail]]:
+    """Agrupa por (tipo, remitente, destinatarios) los que van en resumen; el resto, uno a uno."""
+    threshold = settings.OUTBOX_DIGEST_THRESHOLD
+    groups: Dict[Any, List[OutboundEmail]] = {}
+    for email in batch:
+        groups.setdefault((email.kind, email.from_email, tuple(email.to)), []).append(email)
+    result = []
+    for emails in groups.values():
+        if threshold and len(emails) >= threshold:
+            result.append(emails)
+        else:
+            result.extend([e] for e in emails)
+    return result
+
+
+def build_message(emails: List[OutboundEmail], connection) -> EmailMessage:
+    first = emails[0]
+    if len(emails) == 1:
+        return EmailMessage(first.subject, first.body, first.from_email, first.to, connection=connection)
+    label = DIGEST_LABELS.get(first.kind, first.kind)
+    subject = f"📬 {len(emails)} {label} nuevos"
+    separator = "\n\n" + "=" * 40 + "\n\n"
+    body = separator.join(f"{e.subject}\n{'-' * len(e.subject)}\n{e.body}" for e in emails)
+    return EmailMessage(subject, body, first.from_email, first.to, connection=connection)
+
+
+def _mark_sent(emails: List[OutboundEmail]) -> None:
+    OutboundEmail.objects.filter(pk__in=[e.pk for e in emails]).update(
+        status=OutboundEmail.STATUS_SENT,
+        sent_at=timezone.now(),
+        digest=len(emails) > 1,
+        last_error="",
+    )
+
+
+def _mark_failed(emails: List[OutboundEmail], error: Exception) -> None:
+    now = timezone.now()
+    for email in emails:
+        email.attempts += 1
+        email.last_error = f"{type(error).__name__}: {error}"[:2000]
+        if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            email.status = OutboundEmail.STATUS_FAILED
+            logger.error("Email %s descartado tras %s intentos: %s", email.pk, email.attempts, error)
+        else:
+            email.next_attempt_at = now + timedelta(seconds=backoff_seconds(email.attempts))
+    OutboundEmail.objects.bulk_update(emails, ["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def _open(connection) -> None:
+    """Abre la conexión SMTP si hace falta; si falla, cada envío lo reintentará (y fallará con backoff)."""
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning("No se pudo abrir la conexión de email: %s", e)
+
+
+def send_batch(batch: List[OutboundEmail], connection) -> Dict[str, int]:
+    """Envía un lote reservado por la conexión dada. Devuelve cuántos emails se enviaron o fallaron."""
+    sent = failed = 0
+    for emails in _group(batch):
+        try:
+            connection.send_messages([build_message(emails, connection)])
+        except Exception as e:
+            logger.warning("Fallo enviando %s email(s): %s", len(emails), e)
+            _mark_failed(emails, e)
+            failed += len(emails)
+            # La conexión puede haber quedado inservible: se reabre para el siguiente
+            connection.close()
+            _open(connection)
+            continue
+        _mark_sent(emails)
+        sent += len(emails)
+    return {"sent": sent, "failed": failed}
+
+
+def drain(batch_size: Optional[int] = None, connection=None) -> Dict[str, int]:
+    """
+    Envía todo lo que ya toca, lote a lote, por una misma conexión SMTP. Si se pasa
+    `connection`, se deja abierta al terminar (el worker la reutiliza entre vueltas).
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    totals = {"sent": 0, "failed": 0}
+    own_connection = connection is None
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        while True:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            _open(connection)  # no-op si ya está abierta
+            result = send_batch(batch, connection)
+            totals["sent"] += result["sent"]
+            totals["failed"] += result["failed"]
+    finally:
+        if own_connection:
+            connection.close()
+    return totals
+
+
+def purge(days: int) -> int:
+    """Borra los emails enviados hace más de `days` días. Devuelve cuántos."""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = OutboundEmail.objects.filter(status=OutboundEmail.STATUS_SENT, sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def stats(sample: int = 200) -> Dict[str, Any]:
+    """Profundidad de la cola y latencia de entrega (creación -> envío) de los últimos `sample` emails."""
+    now = timezone.now()
+    counts = OutboundEmail.objects.aggregate(
+        pending=Count("pk", filter=Q(status=OutboundEmail.STATUS_PENDING)),
+        due=Count("pk", filter=Q(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now)),
+        failed=Count("pk", filter=Q(status=OutboundEmail.STATUS_FAILED)),
+        oldest_pending=Min("created_at", filter=Q(status=OutboundEmail.STATUS_PENDING)),
+    )
+    recent = (OutboundEmail.objects.filter(status=OutboundEmail.STATUS_SENT)
+              .order_by("-sent_at").values_list("created_at", "sent_at")[:sample])
+    latencies = sorted((sent_at - created_at).total_seconds() for created_at, sent_at in recent)
+    oldest = counts.pop("oldest_pending")
+    return dict(
+        counts,
+        oldest_pending_seconds=(now - oldest).total_seconds() if oldest else 0.0,
+        sent_sample=len(latencies),
+        latency_p50=latencies[len(latencies) // 2] if latencies else None,
+        latency_p95=latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+        latency_max=latencies[-1] if latencies else None,
+    )
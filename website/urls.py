@@ -1,7 +1,8 @@
 # project/apps/website/urls.py
+from django.conf import settings
 from django.urls import path
 from .views import (
-    api_chat_gemini,
+    api_chat_gemini, api_chat_gemini_async, api_chat_gemini_stream,
     home_view, acerca_view, contacto_view,
     privacidad_view, terminos_view, cookies_view,
     vinaros_view, castellon_view,
@@ -9,6 +10,9 @@ from .views import (
 
 app_name = "website"
 
+# Con ASGI (CHAT_ASYNC=True) el chat espera al modelo sin bloquear un worker
+chat_view = api_chat_gemini_async if getattr(settings, "CHAT_ASYNC", False) else api_chat_gemini
+
 urlpatterns = [
     path("", home_view, name="home"),
     path("sobre-mi/", acerca_view, name="acerca"),
@@ -18,5 +22,6 @@ urlpatterns = [
     path("legal/cookies/", cookies_view, name="cookies"),
     path("vinaros/", vinaros_view, name="vinaros"),
     path("castellon/", castellon_view, name="castellon"),
-    path("api/chat-gemini/", api_chat_gemini, name="api_chat_gemini"),
+    path("api/chat-gemini/", chat_view, name="api_chat_gemini"),
+    path("api/chat-gemini/stream/", api_chat_gemini_stream, name="api_chat_gemini_stream"),
 ]
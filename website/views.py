@@ -1,65 +1,76 @@
 # project/apps/website/views.py
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from miweb.security.rate_limit import rate_limit
 from .forms import ContactForm
+from .models import Lead, OutboundEmail
+from . import outbox
+from .leads import record_lead
+from .chat.store import ConversationStore
+from .chat import lead_state
+from .chat.chip_cache import ChipReplyCache
+from .chat.backends import build_client
+from .chat.history_window import fit_history
+from .chat.injection import PromptInjectionDetector
+from .chat.reply import ReplyScanner
+from .chat.text import TextNormalizer
+from .chat import resilience
+from .chat.resilience import CircuitBreaker, ResilientCaller
+from .chat.streaming import LeadBlockFilter
 import requests
+import hashlib
 import json
 import re
 import os
-
-# Importaciones para Gemini SDK
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+from datetime import date
 
 # --- CONFIGURACIÓN ---
 DEBUG = getattr(settings, "DEBUG", False)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 LEAD_TO_EMAIL = os.getenv("LEAD_TO_EMAIL", "")
 
-# Configurar Gemini SDK
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-
-    # Configurar modelo con parámetros optimizados
-    generation_config = {
-        "temperature": 0.7,
-        "max_output_tokens": 400,
-        "top_p": 0.9,
-        "top_k": 40,
-    }
-
-    # Configuración de seguridad (permitir contenido moderado para conversaciones comerciales)
-    safety_settings = {
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    }
-
-    try:
-        # Inicializar modelo
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=generation_config,
-            safety_settings=safety_settings,
-        )
-    except Exception as e:
-        model = None
-        print(f"Error inicializando Gemini: {e}")
-else:
-    model = None
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+
+# Configurar modelo con parámetros optimizados
+generation_config = {
+    "temperature": 0.7,
+    "max_output_tokens": 400,
+    "top_p": 0.9,
+    "top_k": 40,
+}
+
+# Backend del LLM según CHAT_LLM_BACKEND ("gemini" o "stub" local para pruebas de carga).
+# El SDK de Gemini se importa y configura en el primer chat (o en el warm-up de gunicorn)
+llm_client = build_client(settings.CHAT_LLM_BACKEND, GEMINI_API_KEY, GEMINI_MODEL_NAME, generation_config)
+
+# Límite de concurrencia, circuit breaker, reintentos y plazo para cada llamada a Gemini
+llm_caller = ResilientCaller(
+    max_concurrency=settings.CHAT_GEMINI_MAX_CONCURRENCY,
+    queue_timeout=settings.CHAT_GEMINI_QUEUE_TIMEOUT,
+    deadline=settings.CHAT_GEMINI_DEADLINE,
+    max_attempts=settings.CHAT_GEMINI_MAX_ATTEMPTS,
+    backoff_base=settings.CHAT_GEMINI_BACKOFF_BASE,
+    backoff_max=settings.CHAT_GEMINI_BACKOFF_MAX,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.CHAT_GEMINI_BREAKER_THRESHOLD,
+        reset_timeout=settings.CHAT_GEMINI_BREAKER_RESET,
+    ),
+)
 
 # Campos requeridos para enviar lead (solo teléfono)
 def get_required_fields_for_lead(lead: Dict[str, Any]) -> List[str]:
     """Devuelve los campos requeridos - siempre teléfono"""
     return ["name", "phone", "message"]
 
+# Almacén de conversaciones en servidor (modo conversation_id)
+conversation_store = ConversationStore()
+
 # Marcador invisible para tracking interno (usar caracteres unicode invisibles)
 ALREADY_SENT_MARKER = "​‌‍" # Caracteres Unicode invisibles
 
@@ -88,22 +99,21 @@ PROMPT_INJECTION_PATTERNS = [
     r"ANSWER\s+AS",
 ]
 
+# Compilado una vez; CHAT_INJECTION_RULES_FILE permite recargar las reglas en caliente
+prompt_injection_detector = PromptInjectionDetector(
+    PROMPT_INJECTION_PATTERNS,
+    rules_file=getattr(settings, "CHAT_INJECTION_RULES_FILE", "") or None,
+)
+
 def is_prompt_attack(text: str) -> bool:
-    if not isinstance(text, str):
-        return False
-    text_lower = text.lower()
-    for pattern in PROMPT_INJECTION_PATTERNS:
-        if re.search(pattern, text_lower, re.IGNORECASE):
-            return True
-    return False
+    return prompt_injection_detector.is_attack(text)
+
+# Los turnos del historial llegan en cada petición: se memoriza cada turno ya limpio
+user_text_normalizer = TextNormalizer(cache_size=getattr(settings, "CHAT_TEXT_CACHE_SIZE", 2048))
 
 def _clean_user_text(s: str) -> str:
     """Normaliza texto de usuario para envío a la API."""
-    if not s:
-        return ""
-    s = re.sub(r"[^\w\s.,!?¿¡áéíóúñüÁÉÍÓÚÑÜ()@/:-]", "", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s[:2000]  # margen generoso
+    return user_text_normalizer.clean(s)
 
 def _history_to_contents(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     contents = []
@@ -187,6 +197,21 @@ def extract_lead_from_text(text: str) -> Dict[str, Any]:
     except Exception:
         return {}
 
+# Post-proceso de cada respuesta del modelo (ver website/chat/reply.py)
+reply_scanner = ReplyScanner(prompt_injection_detector, JSON_BLOCK_RX, SASQA_MSG)
+
+LEAD_FIELDS = ["name", "phone", "message"]
+
+def merge_lead(lead: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Completa `lead` con los campos de `data`: el primer valor no vacío de cada campo se queda."""
+    for k, v in (data or {}).items():
+        if k in lead and isinstance(v, str) and v and not lead[k]:
+            lead[k] = v
+    # Siempre por teléfono - solo verificar name, phone, message
+    lead["contact_preference"] = "phone"
+    lead["missing"] = [k for k in LEAD_FIELDS if not lead.get(k)]
+    return lead
+
 def aggregate_lead_from_history(history: List[Dict[str, Any]]) -> Dict[str, Any]:
     lead: Dict[str, Any] = {
         "name": "", "phone": "", "message": "", "contact_preference": "phone",
@@ -195,15 +220,8 @@ def aggregate_lead_from_history(history: List[Dict[str, Any]]) -> Dict[str, Any]
     for turn in history or []:
         if turn.get("role") != "assistant":
             continue
-        d = extract_lead_from_text(turn.get("content") or "")
-        for k, v in (d or {}).items():
-            if k in lead and isinstance(v, str) and v and not lead[k]:
-                lead[k] = v
-
-    # Siempre por teléfono - solo verificar name, phone, message
-    lead["contact_preference"] = "phone"
-    lead["missing"] = [k for k in ["name","phone","message"] if not lead.get(k)]
-    return lead
+        merge_lead(lead, extract_lead_from_text(turn.get("content") or ""))
+    return merge_lead(lead, {})
 
 def has_already_sent(history: List[Dict[str, Any]]) -> bool:
     return any(turn.get("role") == "assistant" and ALREADY_SENT_MARKER in (turn.get("content") or "")
@@ -227,35 +245,117 @@ def build_mail_body(lead: Dict[str, Any], transcript: List[Dict[str, str]]) -> s
     return "\n".join(lines)
 
 # ---------------------------
-# Endpoint: /api/chat-gemini/ (urls.py => name="api_chat_gemini")
+# Helpers compartidos por los endpoints de chat
 # ---------------------------
-@require_POST
-def api_chat_gemini(request):
-    # Payload
+FIRST_TURN_ACK = "Entendido. Estoy listo para ayudar a definir proyectos y conectar con Héctor."
+
+RATE_LIMIT_REPLY = "Disculpa, he recibido muchas consultas. Por favor espera un momento y vuelve a intentar, o puedes llenar el formulario directamente."
+# Cuerpo del 429 del rate limiter del chat: el widget lo muestra como una respuesta más
+CHAT_RATE_LIMITED = {"reply": RATE_LIMIT_REPLY, "error_type": "rate_limit", "is_complete": False}
+
+
+class ChatRequest:
+    """Datos ya validados de una petición de chat (modo history o modo conversation_id)."""
+
+    def __init__(self, user_msg: str, history: List[Dict[str, Any]], is_chip_message: bool,
+                 conversation=None, lead_token: Optional[str] = None, wants_lead_state: bool = False):
+        self.user_msg = user_msg
+        self.history = history
+        self.is_chip_message = is_chip_message
+        self.conversation = conversation
+        self.lead_token = lead_token
+        self.wants_lead_state = wants_lead_state
+        self._history_lead = None
+
+    def history_lead(self) -> Tuple[Dict[str, Any], bool]:
+        """
+        Lead agregado de los turnos anteriores y si ya se envió el email.
+
+        Sale del almacén (modo conversación) o del token `lead_state`; solo si no
+        hay ninguno se recorre el historial completo como antes.
+        """
+        if self._history_lead is None:
+            if self.conversation is not None:
+                lead = dict(self.conversation.lead or {}) or aggregate_lead_from_history([])
+                self._history_lead = (lead, self.conversation.lead_sent)
+            else:
+                self._history_lead = (lead_state.loads(self.lead_token, self.history) or
+                                      (aggregate_lead_from_history(self.history), has_already_sent(self.history)))
+        lead, sent = self._history_lead
+        return dict(lead), sent
+
+    def response_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Añade `conversation_id` o el nuevo `lead_state` firmado a la respuesta."""
+        if self.conversation is not None:
+            data["conversation_id"] = self.conversation.conversation_id
+        elif self.wants_lead_state and "reply" in data:
+            # Lo mismo que verá aggregate_lead_from_history cuando el cliente reenvíe esta respuesta
+            lead, sent = self.history_lead()
+            merge_lead(lead, extract_lead_from_text(data["reply"]))
+            sent = sent or ALREADY_SENT_MARKER in data["reply"]
+            turns = lead_state.count_assistant_turns(self.history) + 1
+            data["lead_state"] = lead_state.dumps(lead, sent, turns)
+        return data
+
+    def remember(self, reply_text: str, lead: Optional[Dict[str, Any]] = None,
+                 lead_sent: Optional[bool] = None) -> None:
+        """Guarda el intercambio en el almacén si la petición va en modo conversación."""
+        if self.conversation is not None:
+            conversation_store.append(self.conversation, self.user_msg, _clean_user_text(reply_text),
+                                      lead=lead, lead_sent=lead_sent)
+
+
+def _parse_chat_request(request) -> Tuple[Optional[ChatRequest], Optional[JsonResponse]]:
+    """Lee el payload JSON. Devuelve (chat_request, None) o (None, respuesta de error)."""
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except Exception:
-        return JsonResponse({"error": "JSON inválido"}, status=400)
+        return None, JsonResponse({"error": "JSON inválido"}, status=400)
 
     user_msg = _clean_user_text(payload.get("message") or "")
-    history  = payload.get("history") or []  # [{role, content}]
     is_chip_message = payload.get("is_chip_message", False)  # Nuevo: detectar mensajes de chip
 
     if not user_msg:
-        return JsonResponse({"error": "Mensaje vacío"}, status=400)
+        return None, JsonResponse({"error": "Mensaje vacío"}, status=400)
+
+    # Modo conversación: si el cliente no envía `history`, el historial vive en el servidor
+    # y el cliente solo manda el mensaje nuevo junto con `conversation_id`.
+    # En modo history, el cliente puede reenviar `lead_state` para no reprocesar el historial.
+    if "history" in payload:
+        history = payload.get("history") or []  # [{role, content}]
+        return ChatRequest(user_msg, history, is_chip_message,
+                           lead_token=payload.get("lead_state"),
+                           wants_lead_state="lead_state" in payload), None
+
+    conversation = conversation_store.get_or_create(payload.get("conversation_id"))
+    return ChatRequest(user_msg, list(conversation.turns or []), is_chip_message, conversation), None
+
 
+def _precheck_chat(chat_request: ChatRequest) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Anti-injection, config y caché de chips. Devuelve (data, status) si hay que cortar aquí."""
     # Anti-injection (mensaje actual y últimos del usuario)
+    history = chat_request.history
     recent_user_msgs = [t.get("content") or "" for t in history[-3:] if t.get("role") == "user"]
-    if is_prompt_attack(user_msg) or any(is_prompt_attack(m) for m in recent_user_msgs):
-        return JsonResponse({"reply": SASQA_MSG})
+    if is_prompt_attack(chat_request.user_msg) or any(is_prompt_attack(m) for m in recent_user_msgs):
+        chat_request.remember(SASQA_MSG)
+        return {"reply": SASQA_MSG}, 200
 
     # Comprobaciones de config (con fallbacks en DEBUG)
-    if not GEMINI_API_KEY or not model:
+    if not llm_client.configured or llm_client.get_model() is None:
         if DEBUG:
             # Respuesta amable para seguir probando el flujo sin API real
-            return JsonResponse({"reply": "Estoy en modo demo (falta GEMINI_API_KEY). Cuéntame objetivo, público y 3 funcionalidades clave."})
-        return JsonResponse({"error": "Falta GEMINI_API_KEY o error en configuración"}, status=500)
+            return {"reply": "Estoy en modo demo (falta GEMINI_API_KEY). Cuéntame objetivo, público y 3 funcionalidades clave."}, 200
+        return {"error": "Falta GEMINI_API_KEY o error en configuración"}, 500
 
+    # Primer mensaje de chip ya cacheado: no hace falta llamar al modelo
+    cached_reply = _cached_chip_reply(chat_request)
+    if cached_reply is not None:
+        return _finalize_reply(chat_request, cached_reply)
+    return None
+
+
+def _build_gemini_history(history: List[Dict[str, Any]], is_chip_message: bool) -> List[Dict[str, Any]]:
+    """Convierte el historial {role, content} al formato del SDK de Gemini."""
     # Construir el prompt base (solo para primer mensaje)
     if not history and not is_chip_message:
         # Solo incluir el prompt completo si es el primer mensaje
@@ -279,137 +379,297 @@ def api_chat_gemini(request):
         )
         base_prompt += chip_context
 
-    # Preparar historial para Gemini SDK
-    try:
-        # Convertir historial al formato de Gemini SDK
-        gemini_history = []
-
-        # Si no hay historial, es el primer mensaje - añadir el prompt del sistema
-        if not history:
-            gemini_history.append({
-                "role": "user",
-                "parts": [{"text": base_prompt}]
-            })
-            gemini_history.append({
-                "role": "model",
-                "parts": [{"text": "Entendido. Estoy listo para ayudar a definir proyectos y conectar con Héctor."}]
-            })
-
-        # Procesar historial existente
-        for turn in history:
-            role = turn.get("role")
-            content = _clean_user_text(turn.get("content") or "")
-            if content:
-                if role == "user":
-                    gemini_history.append({
-                        "role": "user",
-                        "parts": [{"text": content}]
-                    })
-                elif role == "assistant":
-                    # Limpiar el contenido del asistente de cualquier JSON oculto
-                    clean_content = JSON_BLOCK_RX.sub("", content).strip()
-                    if clean_content:
-                        gemini_history.append({
-                            "role": "model",
-                            "parts": [{"text": clean_content}]
-                        })
+    gemini_history = []
+
+    # Si no hay historial, es el primer mensaje - añadir el prompt del sistema
+    if not history:
+        gemini_history.append({
+            "role": "user",
+            "parts": [{"text": base_prompt}]
+        })
+        gemini_history.append({
+            "role": "model",
+            "parts": [{"text": FIRST_TURN_ACK}]
+        })
+
+    # Procesar historial existente
+    for turn in history:
+        role = turn.get("role")
+        content = _clean_user_text(turn.get("content") or "")
+        if content:
+            if role == "user":
+                gemini_history.append({
+                    "role": "user",
+                    "parts": [{"text": content}]
+                })
+            elif role == "assistant":
+                # El texto limpio ya no tiene ``` ni llaves: no queda JSON oculto que quitar
+                gemini_history.append({
+                    "role": "model",
+                    "parts": [{"text": content}]
+                })
+    return gemini_history
+
+
+def _gemini_contents(chat_request: ChatRequest) -> List[Dict[str, Any]]:
+    """Historial para Gemini recortado a CHAT_HISTORY_TOKEN_BUDGET (conservando los datos del lead)."""
+    contents = _build_gemini_history(chat_request.history, chat_request.is_chip_message)
+    budget = getattr(settings, "CHAT_HISTORY_TOKEN_BUDGET", 0)
+    if not budget or len(contents) <= 2:
+        return contents
+    lead, _ = chat_request.history_lead()
+    return fit_history(contents, budget, lead)
+
+
+# La versión del prompt de chip entra en la clave: si cambia el prompt, la caché se invalida sola
+CHIP_PROMPT_VERSION = hashlib.sha256(
+    json.dumps([llm_client.model_name, generation_config, _build_gemini_history([], True)],
+               sort_keys=True, ensure_ascii=False).encode("utf-8")
+).hexdigest()[:12]
+
+chip_reply_cache = ChipReplyCache(CHIP_PROMPT_VERSION)
+
+
+def _is_cacheable_chip(chat_request: ChatRequest) -> bool:
+    # El indicador lo pone el cliente: el texto tiene que ser además uno de los chips conocidos
+    return (bool(chat_request.is_chip_message) and not chat_request.history
+            and chip_reply_cache.key_for(chat_request.user_msg) is not None)
+
+
+def _cached_chip_reply(chat_request: ChatRequest) -> Optional[str]:
+    if not _is_cacheable_chip(chat_request):
+        return None
+    return chip_reply_cache.get(chat_request.user_msg)
+
+
+def _store_chip_reply(chat_request: ChatRequest, reply: str) -> None:
+    if _is_cacheable_chip(chat_request) and not is_prompt_attack(reply):
+        chip_reply_cache.add(chat_request.user_msg, reply)
+
+
+def _finalize_reply(chat_request: ChatRequest, reply: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Post-procesa la respuesta completa del modelo: defensa de salida, agregado del lead,
+    limpieza del bloque JSON oculto y envío del email cuando el lead está completo.
+    """
+    history = chat_request.history
+
+    # Defensa en salida (SASQA si es un ataque), lead del bloque JSON
+    # y texto visible sin el bloque ni restos de JSON
+    scan = reply_scanner.scan(reply)
+
+    # Agregamos datos del lead con histórico (almacén, token o historial) + último reply
+    agg, already_sent = chat_request.history_lead()
+    merge_lead(agg, scan.lead)
+    reply_clean = scan.visible
+
+    # ¿tenemos lo mínimo y todavía no se envió?
+    required_fields = get_required_fields_for_lead(agg)
+    missing_required = [k for k in required_fields if not agg.get(k)]
+    is_complete = not missing_required
+
+    if is_complete and not already_sent:
+        recipient = _lead_recipient()
+        if not recipient and DEBUG:
+            # En dev: no reventamos si no hay destinatario
+            cierre = (
+                "\n\n(DEV) Tengo todo el lead, pero no hay LEAD_TO_EMAIL/DEFAULT_TO_EMAIL. "
+                "Revisa .env/settings. Continúo la conversación sin enviar correo."
+            )
+            chat_request.remember(reply_clean, lead=agg)
+            return {"reply": reply_clean + cierre, "is_complete": True}, 200
+
+        if not recipient:
+            return {"error": "Falta LEAD_TO_EMAIL"}, 500
+
+        try:
+            # Siempre es llamada
+            subject = "🔥 LLAMAR - " + (agg.get("name") or "Sin nombre") + " (chat)"
+
+            transcript = history + [{"role": "user", "content": chat_request.user_msg}]
+            body_mail = build_mail_body(agg, transcript)
+            # Se encola (un INSERT); lo envía el worker del outbox con reintentos
+            outbox.enqueue(OutboundEmail.KIND_LEAD, subject, body_mail, [recipient])
+            # El registro del lead se escribe en lote, fuera de la respuesta
+            record_lead(
+                Lead.SOURCE_CHAT, agg.get("name"), agg.get("phone"), agg.get("message"),
+                conversation_id=chat_request.conversation.conversation_id if chat_request.conversation else "",
+                transcript=transcript + [{"role": "assistant", "content": reply_clean}],
+            )
+            # Agregamos marcador invisible para tracking interno
+            final_reply = reply_clean + ALREADY_SENT_MARKER
+            chat_request.remember(reply_clean, lead=agg, lead_sent=True)
+            return {"reply": final_reply, "is_complete": True}, 200
+        except Exception as e:
+            chat_request.remember(reply_clean, lead=agg)
+            return {"reply": reply_clean + "\n\n(Nota: no pude enviar el correo ahora mismo, lo reintento en breve.)", "is_complete": True}, 200
+
+    # Aún faltan datos o ya se envió - pero indicamos si está completo para mostrar el botón
+    chat_request.remember(reply_clean, lead=agg)
+    return {"reply": reply_clean, "is_complete": is_complete}, 200
 
+
+def _gemini_error_payload(e: Exception) -> Tuple[Dict[str, Any], int]:
+    """Traduce un error del SDK de Gemini a la respuesta que ve el usuario."""
+    category = resilience.classify_error(e)
+
+    # Quota/rate limit, circuito abierto o demasiadas llamadas en curso
+    if category == resilience.RATE_LIMIT:
+        return {
+            "reply": RATE_LIMIT_REPLY,
+            "error_type": "rate_limit",
+            "is_complete": False
+        }, 200
+
+    # Error de API key
+    if category == resilience.AUTH:
+        if DEBUG:
+            return {"reply": "Error de configuración de API key. Revisa la configuración."}, 200
+        return {"error": "Error de configuración"}, 500
+
+    # Error de contenido bloqueado por seguridad
+    if category == resilience.BLOCKED:
+        return {"reply": "Disculpa, reformula tu mensaje de manera más específica sobre tu proyecto."}, 200
+
+    # Error genérico
+    if DEBUG:
+        return {"error": f"Error de Gemini: {e}"}, 500
+    return {"reply": "Disculpa, hubo un problema técnico. Por favor inténtalo de nuevo."}, 200
+
+
+# ---------------------------
+# Endpoint: /api/chat-gemini/ (urls.py => name="api_chat_gemini")
+# ---------------------------
+@require_POST
+@rate_limit("chat", extra=CHAT_RATE_LIMITED)
+def api_chat_gemini(request):
+    chat_request, error_response = _parse_chat_request(request)
+    if error_response is not None:
+        return error_response
+
+    early = _precheck_chat(chat_request)
+    if early is not None:
+        data, status = early
+        return JsonResponse(chat_request.response_data(data), status=status)
+
+    try:
         # Crear chat con historial completo
-        chat = model.start_chat(history=gemini_history)
+        chat = llm_client.get_model().start_chat(history=_gemini_contents(chat_request))
 
         # Enviar el mensaje actual del usuario
-        response = chat.send_message(user_msg)
+        response = llm_caller.call(chat.send_message, chat_request.user_msg)
         reply = response.text.strip()
+        _store_chip_reply(chat_request, reply)
+        data, status = _finalize_reply(chat_request, reply)
+    except Exception as e:
+        data, status = _gemini_error_payload(e)
+    return JsonResponse(chat_request.response_data(data), status=status)
 
-        # Defensa en salida
-        if is_prompt_attack(reply):
-            reply = SASQA_MSG
-
-        # Agregamos datos del lead con histórico + último reply
-        agg = aggregate_lead_from_history(history)
-        last = extract_lead_from_text(reply)
-        for k, v in (last or {}).items():
-            if k in agg and isinstance(v, str) and v and not agg[k]:
-                agg[k] = v
-        # Siempre por teléfono - solo verificar name, phone, message
-        agg["contact_preference"] = "phone"
-        agg["missing"] = [k for k in ["name","phone","message"] if not agg.get(k)]
-
-        # Limpiamos el bloque JSON antes de devolver al usuario
-        reply_clean = JSON_BLOCK_RX.sub("", reply).strip()
-
-        # Limpieza adicional para eliminar cualquier fragmento de JSON que pueda quedar
-        reply_clean = re.sub(r'```json.*?```', '', reply_clean, flags=re.DOTALL | re.IGNORECASE)
-        reply_clean = re.sub(r'\{[^}]*"name"[^}]*\}', '', reply_clean)
-        reply_clean = reply_clean.strip()
-
-        # ¿tenemos lo mínimo y todavía no se envió?
-        required_fields = get_required_fields_for_lead(agg)
-        missing_required = [k for k in required_fields if not agg.get(k)]
-        is_complete = not missing_required
-
-        if is_complete and not has_already_sent(history):
-            recipient = _lead_recipient()
-            if not recipient and DEBUG:
-                # En dev: no reventamos si no hay destinatario
-                cierre = (
-                    "\n\n(DEV) Tengo todo el lead, pero no hay LEAD_TO_EMAIL/DEFAULT_TO_EMAIL. "
-                    "Revisa .env/settings. Continúo la conversación sin enviar correo."
-                )
-                return JsonResponse({"reply": reply_clean + cierre, "is_complete": True})
-
-            if not recipient:
-                return JsonResponse({"error": "Falta LEAD_TO_EMAIL"}, status=500)
-
-            try:
-                # Siempre es llamada
-                subject = "🔥 LLAMAR - " + (agg.get("name") or "Sin nombre") + " (chat)"
-
-                body_mail = build_mail_body(agg, history + [{"role": "user", "content": user_msg}])
-                send_mail(
-                    subject=subject,
-                    message=body_mail,
-                    from_email=getattr(settings, "DEFAULT_FROM_EMAIL", "noreply@localhost"),
-                    recipient_list=[recipient],
-                    fail_silently=False,
-                )
-                # Agregamos marcador invisible para tracking interno
-                final_reply = reply_clean + ALREADY_SENT_MARKER
-                return JsonResponse({"reply": final_reply, "is_complete": True})
-            except Exception as e:
-                return JsonResponse({"reply": reply_clean + "\n\n(Nota: no pude enviar el correo ahora mismo, lo reintento en breve.)", "is_complete": True})
-
-        # Aún faltan datos o ya se envió - pero indicamos si está completo para mostrar el botón
-        return JsonResponse({"reply": reply_clean, "is_complete": is_complete})
 
+# ---------------------------
+# Variante asíncrona de /api/chat-gemini/ (se usa si CHAT_ASYNC=True, sirviendo con ASGI)
+# ---------------------------
+@rate_limit("chat", extra=CHAT_RATE_LIMITED)
+async def api_chat_gemini_async(request):
+    """
+    Igual que `api_chat_gemini`, pero espera a Gemini con `send_message_async`.
+
+    Servida con ASGI (ver miweb/asgi.py), la espera al modelo no ocupa un worker:
+    el bucle de eventos sigue atendiendo otras peticiones. El acceso a BD y el
+    envío del email se ejecutan en un hilo con `sync_to_async`.
+    """
+    # require_POST no admite vistas async en Django 4.2
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    chat_request, error_response = await sync_to_async(_parse_chat_request)(request)
+    if error_response is not None:
+        return error_response
+
+    early = await sync_to_async(_precheck_chat)(chat_request)
+    if early is not None:
+        data, status = early
+        return JsonResponse(chat_request.response_data(data), status=status)
+
+    try:
+        chat = llm_client.get_model().start_chat(history=_gemini_contents(chat_request))
+        response = await llm_caller.call_async(chat.send_message_async, chat_request.user_msg)
+        reply = response.text.strip()
+        await sync_to_async(_store_chip_reply)(chat_request, reply)
+        data, status = await sync_to_async(_finalize_reply)(chat_request, reply)
     except Exception as e:
-        # Manejo mejorado de errores del SDK
-        error_msg = str(e).lower()
-
-        # Error de quota/rate limit
-        if "quota" in error_msg or "rate" in error_msg or "429" in error_msg:
-            fallback_reply = "Disculpa, he recibido muchas consultas. Por favor espera un momento y vuelve a intentar, o puedes llenar el formulario directamente."
-            return JsonResponse({
-                "reply": fallback_reply,
-                "error_type": "rate_limit",
-                "is_complete": False
-            })
-
-        # Error de API key
-        if "api" in error_msg and "key" in error_msg:
-            if DEBUG:
-                return JsonResponse({"reply": "Error de configuración de API key. Revisa la configuración."})
-            return JsonResponse({"error": "Error de configuración"}, status=500)
-
-        # Error de contenido bloqueado por seguridad
-        if "safety" in error_msg or "blocked" in error_msg:
-            return JsonResponse({"reply": "Disculpa, reformula tu mensaje de manera más específica sobre tu proyecto."})
-
-        # Error genérico
-        if DEBUG:
-            return JsonResponse({"error": f"Error de Gemini: {e}"}, status=500)
-        else:
-            return JsonResponse({"reply": "Disculpa, hubo un problema técnico. Por favor inténtalo de nuevo."})
+        data, status = _gemini_error_payload(e)
+    return JsonResponse(chat_request.response_data(data), status=status)
+
+
+# ---------------------------
+# Endpoint: /api/chat-gemini/stream/ (SSE, name="api_chat_gemini_stream")
+# ---------------------------
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type="text/event-stream; charset=utf-8")
+    response["X-Accel-Buffering"] = "no"  # que el proxy no acumule los eventos
+    return response
+
+
+@require_POST
+@rate_limit("chat", extra=CHAT_RATE_LIMITED)
+def api_chat_gemini_stream(request):
+    """
+    Variante en streaming de `api_chat_gemini` (server-sent events).
+
+    Emite `start`, varios `chunk` con texto visible provisional (sin el bloque
+    ```json lead```) y un `done` final con el mismo payload que el endpoint
+    JSON (`reply` definitiva, `is_complete`, `conversation_id`, `status`).
+    Si la respuesta del modelo resulta ser un ataque, los `chunk` se cortan
+    antes de que salga y `done` trae SASQA.
+    """
+    chat_request, error_response = _parse_chat_request(request)
+    if error_response is not None:
+        return error_response
+
+    def events():
+        yield _sse("start", chat_request.response_data({}))
+
+        early = _precheck_chat(chat_request)
+        if early is not None:
+            data, status = early
+            yield _sse("done", chat_request.response_data(dict(data, status=status)))
+            return
+
+        try:
+            chat = llm_client.get_model().start_chat(history=_gemini_contents(chat_request))
+
+            # Defensa en salida trozo a trozo: nada de un ataque llega al navegador
+            visible = LeadBlockFilter(prompt_injection_detector)
+            parts = []
+            with llm_caller.guard() as within_deadline:
+                # Abrir el stream y leer cada trozo cuenta para el plazo de la llamada
+                stream = iter(within_deadline(chat.send_message, chat_request.user_msg, stream=True))
+                while True:
+                    chunk = within_deadline(next, stream, None)
+                    if chunk is None:
+                        break
+                    text = chunk.text or ""
+                    parts.append(text)
+                    out = visible.feed(text)
+                    if out:
+                        yield _sse("chunk", {"text": out})
+                    if visible.attack is not None:
+                        break  # no se lee más: el `done` lleva SASQA en lugar de la respuesta
+
+            # El bloque JSON se procesa una sola vez, con la respuesta completa
+            reply = "".join(parts).strip()
+            _store_chip_reply(chat_request, reply)
+            data, status = _finalize_reply(chat_request, reply)
+        except Exception as e:
+            data, status = _gemini_error_payload(e)
+        yield _sse("done", chat_request.response_data(dict(data, status=status)))
+
+    return _sse_response(events())
 
 # --- VISTAS ORIGINALES ---
 
@@ -419,6 +679,7 @@ def home_view(request):
 def acerca_view(request):
     return render(request, 'website/acerca.html')
 
+@rate_limit("contact")
 def contacto_view(request):
     def wants_json(r):
         return (r.headers.get("x-requested-with") == "XMLHttpRequest" or
@@ -461,13 +722,10 @@ def contacto_view(request):
             f"Mensaje:\n{message}\n"
         )
         try:
-            send_mail(
-                subject=subject,
-                message=body,
-                from_email=getattr(settings, "DEFAULT_FROM_EMAIL", "noreply@localhost"),
-                recipient_list=[to_addr],
-                fail_silently=False,
-            )
+            outbox.enqueue(OutboundEmail.KIND_CONTACT, subject, body, [to_addr])
+            record_lead(Lead.SOURCE_CONTACT, name, phone, message,
+                        company=form.cleaned_data.get('company') or '',
+                        sector=form.cleaned_data.get('sector') or '')
         except Exception as e:
             err = "No pude enviar el email ahora mismo. Inténtalo más tarde."
             if wants_json(request):
@@ -485,14 +743,18 @@ def contacto_view(request):
     form = ContactForm()
     return render(request, 'website/contacto.html', {'form': form})
 
+# Última revisión de los textos legales. Es una fecha fija (no la de hoy): las páginas
+# legales se pre-renderizan en el despliegue y se sirven desde la cache de páginas
+LEGAL_UPDATED = date(2026, 10, 18)
+
 def privacidad_view(request):
-    return render(request, 'website/legal/privacidad.html')
+    return render(request, 'website/legal/privacidad.html', {'legal_updated': LEGAL_UPDATED})
 
 def terminos_view(request):
-    return render(request, 'website/legal/terminos.html')
+    return render(request, 'website/legal/terminos.html', {'legal_updated': LEGAL_UPDATED})
 
 def cookies_view(request):
-    return render(request, 'website/legal/cookies.html')
+    return render(request, 'website/legal/cookies.html', {'legal_updated': LEGAL_UPDATED})
 
 def vinaros_view(request):
     return render(request, 'website/vinaros.html')